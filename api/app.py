@@ -1,15 +1,38 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import cv2
-import numpy as np
+import asyncio
+import io
+import logging
+import time
+import uuid
+import zipfile
 import sys
 from pathlib import Path
+from typing import List, Optional
 
 # Thêm root vào sys.path
 ROOT_DIR = Path(__file__).parent.parent
 sys.path.insert(0, str(ROOT_DIR))
 
-from src.pipeline.main_pipeline import IDCardPipeline
+from api.schemas.response import (BatchResponse, FastJSONResponse, JobCreatedResponse,
+                                  JobResponse, ProcessResponse)
+from src.pipeline.main_pipeline import ANGLE_CLS_MODES, NO_TEXT_MESSAGE
+from src.preprocessing.decoding import decode_image
+from src.serving.inference_pool import InferencePool, QueueFullError
+from src.serving.job_scheduler import PRIORITIES, JobQueueFullError, JobScheduler
+from src.serving.job_store import Job
+from src.serving.result_cache import ResultCache
+from src.serving.upload import BodyLimitMiddleware, UploadLimits, UploadRejected
+from src.serving.warmup import load_warmup_image
+from src.utils.config import Config
+from src.utils.logger import request_id_var, setup_logging
+from src.utils import metrics
+from src.utils.timing import StageTimer
+
+# Config + logging
+config = Config(str(ROOT_DIR / "configs" / "config.yaml"))
+setup_logging(config.get("logging"))
+logger = logging.getLogger(__name__)
 
 # Khởi tạo FastAPI
 app = FastAPI(
@@ -26,8 +49,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Khởi tạo Pipeline - BỎ config.config
-pipeline = IDCardPipeline()  # ✅ ĐÚNG - Không truyền gì
+# Giới hạn upload (section `api.upload`): body quá lớn bị chặn trước khi multipart được nhận hết
+upload_limits = UploadLimits.from_config(config.get("api.upload"))
+app.add_middleware(BodyLimitMiddleware, max_bytes=upload_limits.max_request_bytes)
+
+# Pool worker inference - mỗi worker một IDCardPipeline riêng (worker tạo trong startup)
+inference_pool = InferencePool.from_config(config.get("inference"), config.config)
+
+# Cache kết quả theo nội dung ảnh (None nếu tắt)
+result_cache = ResultCache.from_config(config.get("cache"))
+if result_cache is not None:
+    metrics.track_cache(result_cache.stats)
+
+# Metrics: queue depth đọc trực tiếp từ pool; trả block "timings" trong response nếu bật
+metrics.track_pool(lambda: inference_pool.queue_depth, lambda: inference_pool.in_flight)
+RETURN_TIMINGS = bool(config.get("metrics.return_timings", False))
+
+# Decode JPEG lớn ở 1/2, 1/4, 1/8 kích thước khi cạnh dài vẫn >= min_long_side
+DECODE_MIN_LONG_SIDE = (int(config.get("preprocessing.decode.min_long_side", 1600))
+                        if config.get("preprocessing.decode.reduced", False) else 0)
+
+# Trạng thái cho /readyz: worker đã load model và warm-up xong chưa
+readiness = {"ready": False, "error": None, "warmup": None}
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Gắn request id (X-Request-ID hoặc tự sinh) vào log của request"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+def _warm_up_pool():
+    """Load model trên mọi worker và chạy warm-up (section `inference.warmup`)"""
+    warmup = config.get("inference.warmup") or {}
+    try:
+        image = load_warmup_image(warmup.get("image")) if warmup.get("enabled", True) else None
+        stats = inference_pool.warm_up(image, runs=int(warmup.get("runs", 1)))
+    except Exception as e:
+        logger.exception("Warm-up thất bại: %s", e)
+        readiness["error"] = str(e)
+        return
+    metrics.observe_model_load({"startup": stats["seconds"]})
+    readiness["warmup"] = {"workers": stats["workers"], "ocr_workers": stats["ocr_workers"],
+                           "seconds": round(stats["seconds"], 3)}
+    # Chỉ ready khi mọi worker đã load model và (nếu có ảnh warm-up) đã chạy qua OCR
+    if stats["workers"] != inference_pool.workers:
+        readiness["error"] = f"Chỉ warm-up được {stats['workers']}/{inference_pool.workers} worker"
+    elif image is not None and stats["ocr_workers"] != inference_pool.workers:
+        readiness["error"] = (f"OCR chỉ chạy trên {stats['ocr_workers']}/{inference_pool.workers} "
+                              "worker khi warm-up")
+    if readiness["error"]:
+        logger.error("Warm-up chưa đầy đủ: %s", readiness["error"])
+        return
+    readiness["ready"] = True
+    logger.info("Sẵn sàng: %d worker, load + warm-up %.2fs", stats["workers"], stats["seconds"])
+
+@app.on_event("startup")
+async def start_pool():
+    # Prefork: load model + fork ngay tại đây, khi process còn ít thread (trước thread warm-up)
+    inference_pool.start()
+    # Chạy nền để server nhận kết nối ngay (/healthz), /readyz báo ready khi xong
+    asyncio.get_running_loop().run_in_executor(None, _warm_up_pool)
+    if job_scheduler is not None:
+        await job_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_pool():
+    if job_scheduler is not None:
+        await job_scheduler.stop()
+    inference_pool.shutdown(wait=False)
 
 @app.get("/")
 def read_root():
@@ -37,55 +132,362 @@ def read_root():
         "status": "running"
     }
 
-@app.post("/api/process")
-async def process_image(file: UploadFile = File(...)):
-    """Xử lý ảnh CCCD/Bằng lái xe"""
+@app.get("/healthz")
+def healthz():
+    """Liveness: process còn sống và event loop còn phục vụ"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(response: Response):
+    """Readiness: model đã load và warm-up xong trên mọi worker"""
+    if not readiness["ready"]:
+        response.status_code = 503
+        return {"status": "error" if readiness["error"] else "starting", "error": readiness["error"]}
+    return {"status": "ready", "warmup": readiness["warmup"]}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Metrics dạng Prometheus text"""
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+def _pop_worker_meta(result: dict) -> dict:
+    """Tách timings/model_load/angle_cls/ocr_batches khỏi kết quả worker, ghi vào metrics"""
+    timings = result.pop("timings", None)
+    metrics.observe_timings(timings)
+    metrics.observe_model_load(result.pop("model_load", None))
+    metrics.observe_angle_cls(result.pop("angle_cls", None))
+    metrics.observe_ocr_batches(result.pop("ocr_batches", None))
+    return timings or {}
+
+def _check_angle_cls(angle_cls: Optional[str]):
+    if angle_cls is not None and angle_cls not in ANGLE_CLS_MODES:
+        raise HTTPException(400, f"angle_cls phải là một trong: {', '.join(ANGLE_CLS_MODES)}")
+
+async def _read_image_upload(file: UploadFile) -> bytearray:
+    """Đọc ảnh upload trong giới hạn dung lượng/kích thước, vượt giới hạn -> 413"""
+    try:
+        return await upload_limits.read_image(file)
+    except UploadRejected as e:
+        raise HTTPException(e.status_code, e.detail)
+
+def _cache_lookup(contents, read_cache: bool):
+    """(SHA-256 key, kết quả đã cache hoặc None) - hash + đọc tầng đĩa, chạy trong thread pool"""
+    key = ResultCache.content_key(contents)
+    if not read_cache:
+        return key, None
+    return key, result_cache.get(key, record_miss=not result_cache.perceptual_hash)
+
+def _cache_lookup_similar(image, read_cache: bool):
+    """(dHash key, kết quả của ảnh gần giống hoặc None) - chạy trong thread pool"""
+    key = ResultCache.image_key(image)
+    return key, (result_cache.get_similar(key) if read_cache else None)
+
+def _cache_store(keys: List[str], result: dict):
+    """Ghi kết quả vào cache theo mọi key (kể cả file JSON tầng đĩa) - chạy trong thread pool"""
+    for key in keys:
+        result_cache.put(key, result)
+
+def _json_response(content, headers: Optional[dict] = None) -> FastJSONResponse:
+    """Response đã encode sẵn bằng orjson (polygon numpy ghi trực tiếp), thời gian encode vào metrics"""
+    start = time.perf_counter()
+    response = FastJSONResponse(content, headers=headers)
+    metrics.observe_timings({"encode": (time.perf_counter() - start) * 1000})
+    return response
+
+def _outcome(result: dict) -> str:
+    if result.get("success"):
+        return "success"
+    if result.get("message") == NO_TEXT_MESSAGE:
+        return "empty_ocr"
+    if result.get("quality") and not result["quality"]["passed"]:
+        return "low_quality"
+    return "failure"
+
+@app.post("/api/process", response_model=ProcessResponse, response_class=FastJSONResponse)
+async def process_image(file: UploadFile = File(...),
+                        x_cache_bypass: Optional[str] = Header(None),
+                        timings: bool = Query(False, description="Trả về thời gian từng stage"),
+                        angle_cls: Optional[str] = Query(None, description="Classifier hướng dòng text: always / auto / never")):
+    """
+    Xử lý ảnh CCCD/Bằng lái xe
+    Header `X-Cache-Bypass: 1` bỏ qua cache (không đọc, vẫn ghi kết quả mới)
+    """
+    start = time.perf_counter()
+    timer = StageTimer()
+    include_timings = timings or RETURN_TIMINGS
+    headers = {}
+    outcome = "error"
     try:
-        print("=" * 50)
-        print("🔵 BẮT ĐẦU XỬ LÝ")
-        
         # 1. Validate file type
-        print(f"📁 File: {file.filename}")
-        print(f"📁 Content-Type: {file.content_type}")
+        logger.debug("File: %s (%s)", file.filename, file.content_type)
         
         if not file.content_type.startswith('image/'):
             raise HTTPException(400, "File phải là ảnh")
+        _check_angle_cls(angle_cls)
+        
+        # 2. Đọc file (kiểm tra dung lượng + kích thước ảnh theo header trước khi đọc hết)
+        contents = await _read_image_upload(file)
+        logger.debug("Đã đọc %d bytes", len(contents))
         
-        # 2. Đọc file
-        print("📖 Đang đọc file...")
-        contents = await file.read()
-        print(f"📖 Đã đọc {len(contents)} bytes")
+        # Tra cache theo hash nội dung trước khi decode
+        use_cache = result_cache is not None
+        # Chọn angle_cls tường minh (thường để sửa kết quả sai) -> không đọc cache
+        read_cache = use_cache and x_cache_bypass not in ("1", "true") and angle_cls is None
+        cache_keys = []
+        loop = asyncio.get_running_loop()
+        if use_cache:
+            key, cached = await loop.run_in_executor(None, _cache_lookup, contents, read_cache)
+            cache_keys.append(key)
+            if cached is not None:
+                outcome = _outcome(cached)
+                return _json_response({**cached, "timings": timer.as_dict()} if include_timings else cached,
+                                      {"X-Cache": "HIT"})
         
-        # 3. Decode ảnh
-        print("🖼️  Đang decode ảnh...")
-        nparr = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # 3. Decode ảnh (trong thread pool - decode ảnh lớn tốn hàng chục ms, không chặn event loop)
+        with timer.stage("decode"):
+            image, original_size = await loop.run_in_executor(None, decode_image, contents, DECODE_MIN_LONG_SIDE)
+        metrics.observe_timings({"decode": timer.timings["decode"]})
         
         if image is None:
-            print("❌ cv2.imdecode trả về None!")
             raise HTTPException(400, "Không đọc được ảnh (decode failed)")
         
-        print(f"✅ Decode thành công: {image.shape}")
+        logger.debug("Decode thành công: %s (ảnh gốc %dx%d)", image.shape, *original_size)
+        
+        # Tra tiếp theo perceptual hash (bắt ảnh bị nén lại/đổi định dạng)
+        if use_cache and result_cache.perceptual_hash:
+            key, cached = await loop.run_in_executor(None, _cache_lookup_similar, image, read_cache)
+            cache_keys.append(key)
+            if cached is not None:
+                await loop.run_in_executor(None, _cache_store, cache_keys[:1], cached)
+                outcome = _outcome(cached)
+                return _json_response({**cached, "timings": timer.as_dict()} if include_timings else cached,
+                                      {"X-Cache": "HIT"})
         
         # 4. Process
-        print("🔄 Đang xử lý với pipeline...")
-        result = pipeline.process(image)
+        try:
+            result = await inference_pool.submit(image, original_size, angle_cls)
+        except QueueFullError as qe:
+            logger.warning("Hàng đợi đầy (%d request)", inference_pool.in_flight)
+            outcome = "rejected"
+            raise HTTPException(
+                503,
+                "Server đang bận, vui lòng thử lại sau",
+                headers={"Retry-After": str(qe.retry_after)}
+            )
         
-        print(f"✅ Xử lý xong: success={result.get('success')}")
-        print("=" * 50)
+        timer.merge(_pop_worker_meta(result))
+        outcome = _outcome(result)
+        logger.debug("Xử lý xong: success=%s", result.get("success"))
         
-        return result
+        # Chỉ cache kết quả thành công (lỗi có thể do tạm thời)
+        if use_cache:
+            headers["X-Cache"] = "BYPASS" if not read_cache else "MISS"
+            if result.get("success"):
+                await loop.run_in_executor(None, _cache_store, cache_keys, result)
+        
+        # Không sửa dict đã cache
+        return _json_response({**result, "timings": timer.as_dict()} if include_timings else result, headers)
         
     except HTTPException as he:
-        print(f"⚠️  HTTPException: {he.detail}")
+        logger.info("HTTPException %d: %s", he.status_code, he.detail)
+        if he.status_code in (400, 413):
+            outcome = "bad_request"
         raise
     except Exception as e:
-        print(f"❌ Exception: {type(e).__name__}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Lỗi xử lý request: %s", e)
         raise HTTPException(500, f"Lỗi server: {str(e)}")
+    finally:
+        metrics.REQUESTS.labels(outcome=outcome).inc()
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+ZIP_CONTENT_TYPES = {'application/zip', 'application/x-zip-compressed'}
+BATCH_MAX_FILES = int(config.get("api.batch_max_files", 200))
+BATCH_QUEUE_RETRIES = 3
+
+def _is_zip(filename: str, content_type: str) -> bool:
+    return content_type in ZIP_CONTENT_TYPES or filename.lower().endswith('.zip')
+
+def _expand_zip(filename: str, contents: bytearray):
+    """
+    Bung file zip thành list (tên, bytes, lỗi)
+    Ảnh trong zip cũng bị giới hạn dung lượng/kích thước như ảnh upload trực tiếp;
+    tổng dung lượng giải nén không vượt max_request_mb (chặn zip bomb)
+    """
+    items = []
+    total = 0
+    try:
+        with zipfile.ZipFile(io.BytesIO(contents)) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or Path(info.filename).suffix.lower() not in IMAGE_EXTENSIONS:
+                    continue
+                if len(items) >= BATCH_MAX_FILES:
+                    break
+                name = f"{filename}/{info.filename}"
+                try:
+                    upload_limits.check_size(info.file_size)
+                    total += info.file_size
+                    if total > upload_limits.max_request_bytes:
+                        raise HTTPException(413, "Tổng dung lượng ảnh giải nén vượt giới hạn")
+                    # ZipExtFile không đọc quá file_size khai báo trong zip
+                    with zf.open(info) as member:
+                        head = member.read(upload_limits.header_bytes)
+                        wanted = upload_limits.header_wanted(head)
+                        while wanted:
+                            chunk = member.read(wanted)
+                            if not chunk:
+                                break
+                            head += chunk
+                            wanted = upload_limits.header_wanted(head)
+                        upload_limits.check_header(head)
+                        items.append((name, head + member.read(), None))
+                except UploadRejected as e:
+                    items.append((name, None, e.detail))
+    except zipfile.BadZipFile:
+        items.append((filename, None, "File zip không hợp lệ"))
+    return items
+
+async def _process_batch_item(name: str, contents, error: Optional[str], limiter: asyncio.Semaphore,
+                              angle_cls: Optional[str] = None):
+    """Xử lý một ảnh trong batch - lỗi chỉ ảnh hưởng ảnh này"""
+    if error is not None:
+        return {"file": name, "success": False, "message": error}
+    
+    async with limiter:
+        image, original_size = await asyncio.get_running_loop().run_in_executor(
+            None, decode_image, contents, DECODE_MIN_LONG_SIDE)
+        if image is None:
+            return {"file": name, "success": False, "message": "Không đọc được ảnh (decode failed)"}
+        
+        for attempt in range(BATCH_QUEUE_RETRIES + 1):
+            try:
+                result = await inference_pool.submit(image, original_size, angle_cls)
+                _pop_worker_meta(result)
+                return {"file": name, **result}
+            except QueueFullError as qe:
+                if attempt == BATCH_QUEUE_RETRIES:
+                    return {"file": name, "success": False, "message": "Server đang bận, vui lòng thử lại sau"}
+                await asyncio.sleep(qe.retry_after)
+            except Exception as e:
+                logger.exception("Lỗi xử lý %s: %s", name, e)
+                return {"file": name, "success": False, "message": str(e)}
+
+@app.post("/api/process/batch", response_model=BatchResponse, response_class=FastJSONResponse)
+async def process_batch(files: List[UploadFile] = File(...),
+                        angle_cls: Optional[str] = Query(None, description="Classifier hướng dòng text: always / auto / never")):
+    """Xử lý nhiều ảnh (hoặc file zip chứa ảnh) trong một request"""
+    _check_angle_cls(angle_cls)
+    items = []
+    for file in files:
+        filename = file.filename or ""
+        if _is_zip(filename, file.content_type or ""):
+            try:
+                contents = await upload_limits.read_file(file)
+            except UploadRejected as e:
+                raise HTTPException(e.status_code, e.detail)
+            items.extend(_expand_zip(filename, contents))
+        else:
+            try:
+                items.append((filename, await upload_limits.read_image(file), None))
+            except UploadRejected as e:
+                items.append((filename, None, e.detail))
+        if len(items) > BATCH_MAX_FILES:
+            raise HTTPException(413, f"Tối đa {BATCH_MAX_FILES} ảnh mỗi batch")
+    
+    if not items:
+        raise HTTPException(400, "Không có ảnh nào trong request")
+    
+    # Mỗi batch chiếm tối đa số worker của pool, phần còn lại chờ trong batch
+    limiter = asyncio.Semaphore(inference_pool.workers)
+    results = await asyncio.gather(*[
+        _process_batch_item(name, contents, error, limiter, angle_cls) for name, contents, error in items
+    ])
+    
+    return _json_response({
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r.get("success")),
+        "results": results
+    })
+
+async def _run_job(job: Job, payload) -> dict:
+    """Runner của JobScheduler: decode + pipeline, chờ khi hàng đợi inference đầy"""
+    contents, angle_cls = payload
+    request_id_var.set(job.id[:16])
+    outcome = "error"
+    try:
+        image, original_size = await asyncio.get_running_loop().run_in_executor(
+            None, decode_image, contents, DECODE_MIN_LONG_SIDE)
+        if image is None:
+            outcome = "bad_request"
+            raise ValueError("Không đọc được ảnh (decode failed)")
+        while True:
+            try:
+                result = await inference_pool.submit(image, original_size, angle_cls)
+                break
+            except QueueFullError as qe:
+                # Job không có client đang giữ kết nối - chờ worker rảnh thay vì báo lỗi
+                await asyncio.sleep(qe.retry_after)
+        _pop_worker_meta(result)
+        outcome = _outcome(result)
+        return result
+    finally:
+        metrics.JOBS.labels(outcome=outcome).inc()
+
+# Scheduler job bất đồng bộ (None nếu jobs.enabled: false)
+job_scheduler = JobScheduler.from_config(config.get("jobs"), _run_job, inference_pool.workers)
+if job_scheduler is not None:
+    metrics.track_jobs(lambda: job_scheduler.queued)
+
+def _require_jobs() -> JobScheduler:
+    if job_scheduler is None:
+        raise HTTPException(404, "Job API đang tắt (jobs.enabled: false)")
+    return job_scheduler
+
+@app.post("/api/jobs", status_code=202, response_model=JobCreatedResponse)
+async def create_job(request: Request, response: Response, file: UploadFile = File(...),
+                     priority: str = Query("normal", description="Mức ưu tiên: high / normal / low"),
+                     callback_url: Optional[str] = Query(None, description="URL nhận POST kết quả khi job xong"),
+                     angle_cls: Optional[str] = Query(None, description="Classifier hướng dòng text: always / auto / never"),
+                     x_client_id: Optional[str] = Header(None)):
+    """
+    Nhận ảnh và trả job id ngay, xử lý chạy nền
+    Header `X-Client-ID` xác định client cho việc xoay vòng công bằng (mặc định IP)
+    """
+    scheduler = _require_jobs()
+    if not (file.content_type or "").startswith('image/'):
+        raise HTTPException(400, "File phải là ảnh")
+    _check_angle_cls(angle_cls)
+    if priority not in PRIORITIES:
+        raise HTTPException(400, f"priority phải là một trong: {', '.join(PRIORITIES)}")
+    if callback_url is not None:
+        try:
+            scheduler.check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    
+    contents = await _read_image_upload(file)
+    client_id = x_client_id or (request.client.host if request.client else "-")
+    try:
+        job = await scheduler.submit(Job(client_id=client_id, priority=priority, callback_url=callback_url),
+                                     (contents, angle_cls), nbytes=len(contents))
+    except JobQueueFullError:
+        raise HTTPException(503, "Hàng đợi job đã đầy, vui lòng thử lại sau",
+                            headers={"Retry-After": str(inference_pool.retry_after)})
+    
+    status_url = f"/api/jobs/{job.id}"
+    response.headers["Location"] = status_url
+    return {"job_id": job.id, "status": job.status, "status_url": status_url}
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse, response_class=FastJSONResponse)
+async def get_job(job_id: str):
+    """Trạng thái job (queued / running / succeeded / failed), kèm kết quả khi xong"""
+    job = await _require_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(404, "Không tìm thấy job (sai id hoặc đã hết hạn)")
+    return _json_response(job.to_dict())
 
 if __name__ == "__main__":
     import uvicorn
-    print("🚀 Starting server at http://localhost:8000")
+    logger.info("Starting server at http://localhost:8000")
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
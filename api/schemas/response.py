@@ -1,18 +1,77 @@
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
+from fastapi.responses import Response
+
+from src.utils import serialization
+
 class DetectionResponse(BaseModel):
     bbox: List[int]
     confidence: float
     class_name: str
 
 class OCRResult(BaseModel):
+    bbox: List[List[int]]       # polygon 4 điểm [x, y] trên ảnh gốc
     text: str
     confidence: float
+    field: Optional[str] = None  # vùng detector chứa dòng này (OCR theo field)
+
+class QualityReason(BaseModel):
+    code: str
+    message: str
+    value: float
+    threshold: float
+
+class QualityReport(BaseModel):
+    passed: bool
+    reasons: List[QualityReason] = []
+    metrics: Dict[str, Optional[float]] = {}
 
 class ProcessResponse(BaseModel):
     success: bool
     message: Optional[str] = None
     detection: Optional[DetectionResponse] = None
+    card_quad: Optional[List[List[int]]] = None
+    regions: Optional[Dict[str, str]] = None
     full_text: Optional[str] = None
+    ocr_results: List[OCRResult] = []
     parsed_data: Optional[Dict[str, Any]] = None
+    quality: Optional[QualityReport] = None
+    timings: Optional[Dict[str, float]] = None
+
+class BatchItemResponse(ProcessResponse):
+    file: str
+
+class BatchResponse(BaseModel):
+    total: int
+    succeeded: int
+    results: List[BatchItemResponse]
+
+class JobCreatedResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobResponse(BaseModel):
+    id: str
+    client_id: str
+    priority: str
+    callback_url: Optional[str] = None
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[ProcessResponse] = None
+    error: Optional[str] = None
+    callback_status: Optional[str] = None
+
+class FastJSONResponse(Response):
+    """
+    Response JSON encode bằng orjson (mảng numpy ghi trực tiếp)
+    Endpoint trả về instance này nên FastAPI bỏ qua jsonable_encoder/validate theo
+    response_model - các model ở trên chỉ mô tả schema cho OpenAPI
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return serialization.dumps(content)
@@ -9,17 +9,20 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from src.pipeline.main_pipeline import IDCardPipeline
 from src.utils.config import Config
-import json
+from src.utils.logger import setup_logging
+from src.utils import serialization
 
 def main():
     # Load config
     config = Config()
+    setup_logging(config.get("logging"))
     
     # Initialize pipeline
     pipeline = IDCardPipeline(config.config)
     
-    # Test image
-    test_image = "test_images/cccd_sample.jpg"
+    # Test image (truyền đường dẫn qua argv, mặc định ảnh mẫu)
+    # Xử lý nhiều ảnh: python scripts/batch_process.py --input <thư mục> --output results.jsonl
+    test_image = sys.argv[1] if len(sys.argv) > 1 else "test_images/cccd_sample.jpg"
     
     if not Path(test_image).exists():
         print(f"Test image not found: {test_image}")
@@ -34,7 +37,7 @@ def main():
     print("\n" + "="*50)
     print("RESULT:")
     print("="*50)
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    print(serialization.dumps(result, indent=True).decode('utf-8'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+Xử lý hàng loạt ảnh CCCD qua IDCardPipeline
+
+Input là một thư mục ảnh hoặc file manifest (mỗi dòng một đường dẫn ảnh).
+Kết quả ghi ra JSONL, mỗi dòng một ảnh. Chạy lại với cùng file output sẽ bỏ qua
+các ảnh đã có kết quả (resume), lỗi của một ảnh không làm dừng cả lượt chạy - kể cả
+khi worker process chết (segfault, bị OOM kill): pool được tạo lại, các ảnh đang dở được
+chạy lại lần lượt từng ảnh và chỉ ảnh làm worker chết bị ghi lỗi.
+
+Ví dụ:
+    python scripts/batch_process.py --input scans/ --output results.jsonl --workers 4
+    python scripts/batch_process.py --input manifest.txt --output results.jsonl --retry-errors
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+# Thêm thư mục gốc vào sys.path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from src.utils import serialization
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+
+_pipeline = None
+
+
+def _init_worker(config_path: Optional[str]):
+    """Mỗi process worker load một pipeline riêng"""
+    global _pipeline
+    from src.pipeline.main_pipeline import IDCardPipeline
+    from src.utils.config import Config
+
+    config = Config(config_path).config if config_path else None
+    _pipeline = IDCardPipeline(config)
+
+
+def _process_file(path: str) -> Dict[str, Any]:
+    """Xử lý một ảnh, không bao giờ raise - lỗi được ghi vào kết quả"""
+    start = time.perf_counter()
+    try:
+        result = _pipeline.process(path)
+        record = {"file": path, **result}
+    except Exception as e:
+        record = {"file": path, "success": False, "error": f"{type(e).__name__}: {e}"}
+    record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+def iter_inputs(input_path: Path) -> Iterator[str]:
+    """Liệt kê ảnh trong thư mục (đệ quy, có sắp xếp) hoặc đọc từ manifest"""
+    if input_path.is_dir():
+        for path in sorted(input_path.rglob('*')):
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+                yield str(path)
+        return
+
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            # Manifest JSONL: {"file": "..."}; manifest text: một đường dẫn mỗi dòng
+            if line.startswith('{'):
+                line = json.loads(line)['file']
+            yield line
+
+
+def load_checkpoint(output_path: Path, retry_errors: bool) -> Set[str]:
+    """Các file đã xử lý xong trong output (bỏ qua dòng ghi dở ở cuối file)"""
+    done = set()
+    if not output_path.exists():
+        return done
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Pipeline không raise mà trả success=False (kèm message) - coi là lỗi
+            if retry_errors and not record.get('success'):
+                continue
+            done.add(record['file'])
+    return done
+
+
+def run(input_path: Path, output_path: Path, workers: int, config_path: Optional[str],
+        retry_errors: bool = False):
+    done = load_checkpoint(output_path, retry_errors)
+    if done:
+        print(f"↩️  Resume: bỏ qua {len(done)} ảnh đã xử lý")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    stats = {"processed": 0, "succeeded": 0, "errors": 0}
+    start = time.perf_counter()
+
+    def new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config_path,))
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+
+        def write(record: Dict[str, Any]):
+            out.write(serialization.dumps(record).decode('utf-8') + '\n')
+            out.flush()
+            stats["processed"] += 1
+            stats["succeeded"] += bool(record.get("success"))
+            stats["errors"] += not record.get("success")
+            if stats["processed"] % 100 == 0:
+                rate = stats["processed"] / (time.perf_counter() - start)
+                print(f"   {stats['processed']} ảnh ({rate:.1f} ảnh/s)")
+
+        executor = new_executor()
+        pending: Dict[Future, str] = {}
+
+        def recover(crashed: List[str]):
+            """Một worker chết làm hỏng cả pool: mọi task chưa xong cũng lỗi theo"""
+            nonlocal executor
+            for future in wait(list(pending)).done:
+                path = pending.pop(future)
+                try:
+                    write(future.result())
+                except BrokenProcessPool:
+                    crashed.append(path)
+            executor.shutdown(wait=False)
+            executor = new_executor()
+            print(f"⚠️  Worker bị crash, chạy lại lần lượt {len(crashed)} ảnh đang dở")
+            # Từng ảnh một để biết chính xác ảnh nào làm worker chết
+            for path in crashed:
+                try:
+                    write(executor.submit(_process_file, path).result())
+                except BrokenProcessPool:
+                    write({"file": path, "success": False, "error": "Worker process bị crash khi xử lý ảnh"})
+                    executor.shutdown(wait=False)
+                    executor = new_executor()
+
+        def submit(path: str):
+            try:
+                pending[executor.submit(_process_file, path)] = path
+            except BrokenProcessPool:
+                recover([path])
+
+        def collect(finished: Iterable[Future]):
+            crashed = []
+            for future in finished:
+                path = pending.pop(future)
+                try:
+                    write(future.result())
+                except BrokenProcessPool:
+                    crashed.append(path)
+            if crashed:
+                recover(crashed)
+
+        # Giới hạn số task đang chờ để không load cả danh sách vào executor
+        max_pending = workers * 4
+        try:
+            for path in iter_inputs(input_path):
+                if path in done:
+                    continue
+                while len(pending) >= max_pending:
+                    collect(wait(list(pending), return_when=FIRST_COMPLETED).done)
+                submit(path)
+
+            while pending:
+                collect(wait(list(pending), return_when=FIRST_COMPLETED).done)
+        finally:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print("=" * 60)
+    print(f"✅ Xong {stats['processed']} ảnh trong {elapsed:.1f}s")
+    print(f"   Thành công: {stats['succeeded']}")
+    print(f"   Lỗi:        {stats['errors']}")
+    print(f"📁 Kết quả:   {output_path}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Xử lý hàng loạt ảnh CCCD')
+    parser.add_argument('--input', type=str, required=True, help='Thư mục ảnh hoặc file manifest')
+    parser.add_argument('--output', type=str, required=True, help='File kết quả JSONL')
+    parser.add_argument('--workers', type=int, default=2, help='Số process worker')
+    parser.add_argument('--config', type=str, default=str(ROOT / 'configs' / 'config.yaml'),
+                        help='File config.yaml')
+    parser.add_argument('--retry-errors', action='store_true',
+                        help='Xử lý lại các ảnh chưa thành công (success=false) ở lần chạy trước')
+
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"❌ Không tìm thấy input: {input_path}")
+        sys.exit(1)
+
+    run(input_path, Path(args.output), args.workers, args.config, args.retry_errors)
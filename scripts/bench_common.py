@@ -0,0 +1,176 @@
+"""
+Tiện ích dùng chung cho các script benchmark
+
+- StubPaddleOCR: backend OCR giả (không cần weights) để benchmark parser + glue code
+- Corpus ảnh thẻ tổng hợp (seed cố định) hoặc đọc từ thư mục local
+- Thống kê latency (p50/p95/p99), peak RSS, commit hiện tại
+"""
+import sys
+import time
+import types
+import random
+import resource
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Thêm thư mục gốc vào sys.path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+
+FAMILY_NAMES = ['NGUYỄN', 'TRẦN', 'LÊ', 'PHẠM', 'HUỲNH', 'VÕ', 'ĐẶNG', 'BÙI']
+MIDDLE_NAMES = ['VĂN', 'THỊ', 'HỮU', 'MINH', 'NGỌC', 'THANH']
+GIVEN_NAMES = ['AN', 'BÌNH', 'CƯỜNG', 'DUNG', 'HOÀNG', 'LAN', 'NAM', 'TRANG']
+PLACES = ['Kiến Xương, Thái Bình', 'Bình Long, Bình Phước', 'Hoàn Kiếm, Hà Nội',
+          'Hải Châu, Đà Nẵng', 'Ninh Kiều, Cần Thơ']
+
+
+def synthetic_card_lines(rng: random.Random) -> List[str]:
+    """Các dòng text giống output OCR của mặt trước CCCD"""
+    name = f"{rng.choice(FAMILY_NAMES)} {rng.choice(MIDDLE_NAMES)} {rng.choice(GIVEN_NAMES)}"
+    dob = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2005)}"
+    expiry = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2030, 2045)}"
+    return [
+        'CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM',
+        'Độc lập - Tự do - Hạnh phúc',
+        'SOCIALIST REPUBLIC OF VIET NAM',
+        'CĂN CƯỚC CÔNG DÂN',
+        'Citizen Identity Card',
+        f"Số / No.: {rng.randint(0, 10 ** 12 - 1):012d}",
+        'Họ và tên / Full name:',
+        name,
+        f"Ngày sinh / Date of birth: {dob}",
+        f"Giới tính / Sex: {rng.choice(['Nam', 'Nữ'])} Quốc tịch / Nationality: Việt Nam",
+        f"Quê quán / Place of origin: {rng.choice(PLACES)}",
+        f"Nơi thường trú / Place of residence: Tổ {rng.randint(1, 20)}, {rng.choice(PLACES)}",
+        f"Có giá trị đến: {expiry}",
+    ]
+
+
+def synthetic_card(rng: random.Random) -> str:
+    """Full text của một thẻ tổng hợp"""
+    return '\n'.join(synthetic_card_lines(rng))
+
+
+def synthetic_card_image(rng: random.Random, size: Tuple[int, int] = (1280, 960)) -> np.ndarray:
+    """
+    Ảnh chụp thẻ tổng hợp: nền nhiễu, thẻ tỉ lệ ID-1 hơi xoay, các dòng text
+    (cv2 chỉ vẽ được ASCII - đủ cho benchmark tốc độ)
+    """
+    w, h = size
+    np_rng = np.random.default_rng(rng.randint(0, 2 ** 31))
+    image = np_rng.integers(60, 120, size=(h, w, 3), dtype=np.uint8)
+
+    card_w = int(w * 0.7)
+    card_h = int(card_w / 1.586)
+    card = np.full((card_h, card_w, 3), (235, 240, 245), dtype=np.uint8)
+    cv2.rectangle(card, (int(card_w * 0.04), int(card_h * 0.3)),
+                  (int(card_w * 0.28), int(card_h * 0.8)), (150, 140, 130), -1)
+    scale = card_w / 1000
+    for i, line in enumerate(synthetic_card_lines(rng)):
+        text = line.encode('ascii', 'ignore').decode()
+        y = int(card_h * 0.08) + int(i * card_h * 0.07)
+        x = int(card_w * 0.32) if i >= 5 else int(card_w * 0.15)
+        cv2.putText(card, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55 * scale, (30, 30, 30),
+                    max(1, int(scale)), cv2.LINE_AA)
+
+    # Dán thẻ vào giữa ảnh với một góc xoay nhỏ
+    angle = rng.uniform(-4, 4)
+    x0, y0 = (w - card_w) // 2, (h - card_h) // 2
+    matrix = cv2.getRotationMatrix2D((card_w / 2, card_h / 2), angle, 1.0)
+    matrix[:, 2] += (x0, y0)
+    mask = np.full((card_h, card_w), 255, dtype=np.uint8)
+    warped = cv2.warpAffine(card, matrix, (w, h))
+    warped_mask = cv2.warpAffine(mask, matrix, (w, h))
+    image[warped_mask > 0] = warped[warped_mask > 0]
+    return image
+
+
+def load_corpus(images_dir: Optional[str], count: int, seed: int = 0,
+                size: Tuple[int, int] = (1280, 960)) -> List[Tuple[str, np.ndarray]]:
+    """Ảnh từ thư mục local (nếu có), không thì sinh `count` ảnh tổng hợp"""
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        corpus = []
+        for path in paths[:count] if count else paths:
+            image = cv2.imread(str(path))
+            if image is not None:
+                corpus.append((str(path), image))
+        return corpus
+
+    rng = random.Random(seed)
+    return [(f"synthetic_{i:04d}", synthetic_card_image(rng, size)) for i in range(count)]
+
+
+class StubPaddleOCR:
+    """
+    PaddleOCR giả - predict() trả về kết quả dạng dict như PaddleOCR 3.x
+    Text là một thẻ tổng hợp cố định, polygon co giãn theo kích thước ảnh.
+    """
+
+    calls = 0
+    latency = 0.0          # giây, giả lập thời gian inference
+    latency_per_mpx = 0.0  # giây thêm cho mỗi megapixel (detection tỉ lệ với số pixel)
+
+    def __init__(self, *args, **kwargs):
+        self._lines = synthetic_card_lines(random.Random(0))
+
+    def predict(self, image, **kwargs):
+        StubPaddleOCR.calls += 1
+        h, w = image.shape[:2]
+        delay = self.latency + self.latency_per_mpx * h * w / 1e6
+        if delay:
+            time.sleep(delay)
+        step = h / (len(self._lines) + 1)
+        polys = [
+            np.array([[w * 0.1, step * i], [w * 0.9, step * i],
+                      [w * 0.9, step * i + step * 0.8], [w * 0.1, step * i + step * 0.8]], dtype=np.int32)
+            for i in range(len(self._lines))
+        ]
+        return [{'rec_texts': list(self._lines), 'rec_scores': [0.95] * len(self._lines), 'rec_polys': polys}]
+
+    ocr = predict
+
+
+def install_stub_paddleocr(latency: float = 0.0, latency_per_mpx: float = 0.0):
+    """Đăng ký module paddleocr giả trước khi import pipeline"""
+    StubPaddleOCR.latency = latency
+    StubPaddleOCR.latency_per_mpx = latency_per_mpx
+    module = types.ModuleType('paddleocr')
+    module.PaddleOCR = StubPaddleOCR
+    sys.modules['paddleocr'] = module
+
+
+def latency_summary(samples_ms: List[float], wall_seconds: float) -> Dict[str, float]:
+    """p50/p95/p99 (ms) và throughput"""
+    if not samples_ms:
+        return {'n': 0}
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        'n': int(arr.size),
+        'mean_ms': round(float(arr.mean()), 3),
+        'p50_ms': round(float(np.percentile(arr, 50)), 3),
+        'p95_ms': round(float(np.percentile(arr, 95)), 3),
+        'p99_ms': round(float(np.percentile(arr, 99)), 3),
+        'max_ms': round(float(arr.max()), 3),
+        'images_per_sec': round(arr.size / wall_seconds, 2) if wall_seconds > 0 else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS của process hiện tại (MB) - ru_maxrss là KB trên Linux, byte trên macOS"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
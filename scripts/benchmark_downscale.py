@@ -0,0 +1,132 @@
+"""
+Benchmark thu nhỏ ảnh trước OCR: latency vs độ chính xác
+
+Mỗi preset `preprocessing.downscale` được so với kết quả xử lý ở độ phân giải gốc:
+    fields    tỉ lệ field parsed_data trùng với kết quả gốc
+    text      độ giống full_text (difflib ratio)
+    bbox_px   sai lệch trung bình (px, toạ độ ảnh gốc) của bbox các block
+
+Mặc định chạy offline với OCR giả (latency tỉ lệ theo megapixel) trên ảnh tổng
+hợp 4000x3000 - chỉ đo được latency; dùng --ocr paddle --images <dir> để đo
+độ chính xác thật.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import difflib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from bench_common import ROOT, git_commit, install_stub_paddleocr, latency_summary, load_corpus
+
+
+def agreement(reference: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """So một kết quả với kết quả ở độ phân giải gốc"""
+    ref_fields = reference.get('parsed_data') or {}
+    fields = result.get('parsed_data') or {}
+    keys = [k for k, v in ref_fields.items() if v]
+    field_match = sum(1 for k in keys if fields.get(k) == ref_fields[k]) / len(keys) if keys else None
+
+    text_ratio = difflib.SequenceMatcher(None, reference.get('full_text', ''),
+                                         result.get('full_text', '')).ratio()
+
+    bbox_error = None
+    ref_blocks, blocks = reference.get('ocr_results') or [], result.get('ocr_results') or []
+    if ref_blocks and len(ref_blocks) == len(blocks):
+        errors = [np.abs(np.asarray(a['bbox'], dtype=np.float32) - np.asarray(b['bbox'], dtype=np.float32)).mean()
+                  for a, b in zip(ref_blocks, blocks)]
+        bbox_error = float(np.mean(errors))
+
+    return {'fields': field_match, 'text': text_ratio, 'bbox_px': bbox_error}
+
+
+def mean_or_none(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return round(float(np.mean(values)), 4) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark downscale trước OCR (latency vs accuracy)')
+    parser.add_argument('--images', help='Thư mục ảnh (mặc định: ảnh thẻ tổng hợp)')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--size', default='4000x3000', help='Kích thước ảnh tổng hợp WxH')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ocr', choices=['stub', 'paddle'], default='stub')
+    parser.add_argument('--stub-latency-per-mpx', type=float, default=0.05,
+                        help='Độ trễ giả lập của OCR stub mỗi megapixel (giây)')
+    parser.add_argument('--max-sides', type=int, nargs='+', default=[2560, 1600, 1280, 1000, 800],
+                        help='Các giá trị max_long_side cần thử (ngoài preset "auto" trong config)')
+    parser.add_argument('--config', help='Đường dẫn config.yaml')
+    parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.ocr == 'stub':
+        install_stub_paddleocr(latency_per_mpx=args.stub_latency_per_mpx)
+
+    from src.pipeline.main_pipeline import IDCardPipeline
+    from src.utils.config import Config
+
+    config = Config(args.config or str(ROOT / 'configs' / 'config.yaml')).config
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    corpus = load_corpus(args.images, args.count, seed=args.seed, size=(width, height))
+    if not corpus:
+        raise SystemExit(f"Không có ảnh nào trong {args.images}")
+
+    pipeline = IDCardPipeline(config)
+    auto = dict((config.get('preprocessing') or {}).get('downscale') or {}, enabled=True)
+    presets = {'original': {'enabled': False}, 'auto': auto}
+    for side in args.max_sides:
+        presets[f"max_{side}"] = dict(auto, min_long_side=min(side, int(auto.get('min_long_side', 1000))),
+                                      max_long_side=side)
+
+    references: List[Dict[str, Any]] = []
+    report = {}
+    for name, preset in presets.items():
+        pipeline.downscale = preset
+        pipeline.process(corpus[0][1])  # warm-up
+
+        samples, scores = [], []
+        wall_start = time.perf_counter()
+        for i, (_, image) in enumerate(corpus):
+            start = time.perf_counter()
+            result = pipeline.process(image)
+            samples.append((time.perf_counter() - start) * 1000)
+            if name == 'original':
+                references.append(result)
+            scores.append(agreement(references[i], result))
+
+        report[name] = {
+            'settings': preset,
+            **latency_summary(samples, time.perf_counter() - wall_start),
+            'field_agreement': mean_or_none([s['fields'] for s in scores]),
+            'text_similarity': mean_or_none([s['text'] for s in scores]),
+            'bbox_error_px': mean_or_none([s['bbox_px'] for s in scores]),
+        }
+
+    print("=" * 86)
+    print(f"OCR: {args.ocr} | {len(corpus)} ảnh | {args.images or f'tổng hợp {args.size}'}")
+    print(f"{'preset':<14}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}{'fields':>10}{'text':>10}{'bbox px':>10}")
+    for name, row in report.items():
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+        print(f"{name:<14}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['images_per_sec']:>10.2f}"
+              f"{fmt(row['field_agreement'], '.1%'):>10}{fmt(row['text_similarity'], '.3f'):>10}"
+              f"{fmt(row['bbox_error_px'], '.1f'):>10}")
+    print("=" * 86)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'meta': {'commit': git_commit(), 'ocr': args.ocr, 'images': len(corpus),
+                                'corpus': args.images or f"synthetic {args.size}"},
+                       'presets': report}, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi kết quả: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark các mức enhance của ImageProcessor.enhance_image
+
+Chạy offline trên ảnh thẻ tổng hợp (đã rectify về kích thước chuẩn) với các
+biến thể: sạch, tương phản thấp, tối, nhiễu, mờ. Với mỗi tier in latency và
+chỉ số chất lượng (contrast/noise) sau khi enhance, kèm quyết định của
+quality gate (needs_enhancement) cho từng biến thể.
+"""
+import time
+import random
+import logging
+import argparse
+from typing import Dict
+
+import cv2
+import numpy as np
+
+from bench_common import latency_summary, synthetic_card_image
+from src.preprocessing.image_processing import ImageProcessor
+
+
+def degraded_variants(card: np.ndarray, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    return {
+        'clean': card,
+        'low_contrast': (card.astype(np.float32) * 0.3 + 100).astype(np.uint8),
+        'dark': (card.astype(np.float32) * 0.35).astype(np.uint8),
+        'noisy': np.clip(card.astype(np.int16) + rng.normal(0, 15, card.shape), 0, 255).astype(np.uint8),
+        'blurry': cv2.GaussianBlur(card, (9, 9), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark các tier enhance_image')
+    parser.add_argument('--cards', type=int, default=5, help='Số thẻ tổng hợp')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần chạy mỗi ảnh')
+    parser.add_argument('--size', default='1000x630', help='Kích thước thẻ sau rectify WxH')
+    parser.add_argument('--max-side', type=int, help='Chạy enhance trên bản thu nhỏ cạnh dài này')
+    parser.add_argument('--tiers', nargs='+', default=list(ImageProcessor.ENHANCE_TIERS),
+                        choices=ImageProcessor.ENHANCE_TIERS)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    rng = random.Random(args.seed)
+    np_rng = np.random.default_rng(args.seed)
+
+    variants: Dict[str, list] = {}
+    for _ in range(args.cards):
+        photo = synthetic_card_image(rng, (int(width * 1.4), int(height * 1.9)))
+        quad = ImageProcessor.find_card_quad(photo)
+        card = ImageProcessor.rectify_card(photo, quad, (width, height))[0] if quad is not None else \
+            ImageProcessor.resize_image(photo, (width, height))
+        for name, image in degraded_variants(card, np_rng).items():
+            variants.setdefault(name, []).append(image)
+
+    print("=" * 78)
+    print(f"Quality gate ({args.cards} thẻ {width}x{height}, ngưỡng mặc định):")
+    print(f"{'biến thể':<14}{'score ms':>10}{'sharpness':>12}{'contrast':>10}{'noise':>8}{'enhance?':>10}")
+    for name, images in variants.items():
+        start = time.perf_counter()
+        scores = [ImageProcessor.quality_score(img) for img in images]
+        score_ms = (time.perf_counter() - start) * 1000 / len(images)
+        needed = sum(ImageProcessor.needs_enhancement(s) for s in scores)
+        print(f"{name:<14}{score_ms:>10.2f}{np.mean([s['sharpness'] for s in scores]):>12.1f}"
+              f"{np.mean([s['contrast'] for s in scores]):>10.1f}{np.mean([s['noise'] for s in scores]):>8.2f}"
+              f"{f'{needed}/{len(images)}':>10}")
+
+    print(f"\nTier (max_side={args.max_side or 'giữ nguyên'}):")
+    print(f"{'tier':<10}{'biến thể':<14}{'p50 ms':>10}{'p95 ms':>10}{'contrast':>10}{'noise':>8}")
+    for tier in args.tiers:
+        for name, images in variants.items():
+            ImageProcessor.enhance_image(images[0], tier, args.max_side)  # warm-up
+            samples, outputs = [], []
+            wall_start = time.perf_counter()
+            for image in images:
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    out = ImageProcessor.enhance_image(image, tier, args.max_side)
+                    samples.append((time.perf_counter() - start) * 1000)
+                outputs.append(out)
+            stats = latency_summary(samples, time.perf_counter() - wall_start)
+            after = [ImageProcessor.quality_score(out) for out in outputs]
+            print(f"{tier:<10}{name:<14}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                  f"{np.mean([s['contrast'] for s in after]):>10.1f}{np.mean([s['noise'] for s in after]):>8.2f}")
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Micro-benchmark FieldParser.parse - thời gian parse mỗi thẻ
+
+Chạy offline trên text CCCD tổng hợp, không cần OCR/model.
+"""
+import sys
+import io
+import time
+import random
+import argparse
+import contextlib
+import statistics
+from pathlib import Path
+
+# Thêm thư mục gốc vào sys.path
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from bench_common import synthetic_card
+from src.ocr.field_parser import FieldParser
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FieldParser.parse')
+    parser.add_argument('--cards', type=int, default=2000, help='Số thẻ tổng hợp')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    texts = [synthetic_card(rng) for _ in range(args.cards)]
+    field_parser = FieldParser()
+
+    timings = []
+    # parse() in kết quả ra stdout - bỏ qua để chỉ đo thời gian parse
+    with contextlib.redirect_stdout(io.StringIO()) as sink:
+        for text in texts:
+            sink.seek(0)
+            sink.truncate()
+            start = time.perf_counter()
+            field_parser.parse(text, [])
+            timings.append((time.perf_counter() - start) * 1e6)
+
+    timings.sort()
+    print("=" * 60)
+    print(f"Số thẻ:      {len(timings)}")
+    print(f"Trung bình:  {statistics.mean(timings):.1f} µs/thẻ")
+    print(f"p50:         {timings[len(timings) // 2]:.1f} µs")
+    print(f"p95:         {timings[int(len(timings) * 0.95)]:.1f} µs")
+    print(f"Throughput:  {1e6 / statistics.mean(timings):.0f} thẻ/s")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
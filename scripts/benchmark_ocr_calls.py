@@ -0,0 +1,48 @@
+"""
+Benchmark hồi quy: đảm bảo IDCardPipeline.process chỉ gọi PaddleOCR một lần mỗi ảnh
+
+Chạy offline, không cần model weights: PaddleOCR được thay bằng model giả
+có đếm số lần gọi và giả lập thời gian inference.
+"""
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from bench_common import StubPaddleOCR, install_stub_paddleocr
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark số lần gọi OCR mỗi ảnh')
+    parser.add_argument('--images', type=int, default=20, help='Số ảnh xử lý')
+    args = parser.parse_args()
+
+    install_stub_paddleocr(latency=0.02)
+    from src.pipeline.main_pipeline import IDCardPipeline
+
+    pipeline = IDCardPipeline()
+    image = np.full((600, 960, 3), 255, dtype=np.uint8)
+
+    StubPaddleOCR.calls = 0
+    start = time.perf_counter()
+    for _ in range(args.images):
+        result = pipeline.process(image)
+        assert result['success'], result.get('message')
+    elapsed = time.perf_counter() - start
+
+    calls_per_image = StubPaddleOCR.calls / args.images
+    print("=" * 60)
+    print(f"Ảnh xử lý:          {args.images}")
+    print(f"Số lần gọi OCR:     {StubPaddleOCR.calls} ({calls_per_image:.2f}/ảnh)")
+    print(f"Thời gian / ảnh:    {elapsed / args.images * 1000:.1f} ms")
+    print("=" * 60)
+
+    if calls_per_image != 1:
+        print("❌ FAIL: PaddleOCR phải được gọi đúng 1 lần mỗi ảnh")
+        sys.exit(1)
+    print("✅ PASS: PaddleOCR được gọi 1 lần mỗi ảnh")
+
+
+if __name__ == "__main__":
+    main()
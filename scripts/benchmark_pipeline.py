@@ -0,0 +1,290 @@
+"""
+Benchmark offline toàn bộ pipeline theo từng stage
+
+Đo p50/p95/p99, throughput (ảnh/s), peak RSS và cold-start cho:
+    decode.*            decode JPEG full-size / ở độ phân giải giảm
+    preprocess.*        ImageProcessor (resize, enhance, edges, localize = tìm + warp thẻ)
+    ocr.extract_text    OCREngine.extract_text
+    detector.detect     CCCDDetector.detect (bỏ qua nếu thiếu ultralytics/weights)
+    parser.parse        FieldParser.parse
+    pipeline.process    IDCardPipeline.process (end-to-end)
+
+Chạy trên CPU, không cần mạng: mặc định dùng OCR giả (--ocr stub) và ảnh thẻ
+tổng hợp; --ocr paddle|onnx và --images <dir> để đo với model/ảnh thật.
+Kết quả ghi ra JSON để so sánh giữa các commit:
+
+    python scripts/benchmark_pipeline.py --output bench/new.json --compare bench/old.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from bench_common import (ROOT, git_commit, install_stub_paddleocr, latency_summary,
+                          load_corpus, peak_rss_mb)
+
+STAGES = ['decode.full', 'decode.reduced', 'preprocess.resize', 'preprocess.enhance', 'preprocess.edges',
+          'preprocess.localize', 'ocr.extract_text',
+          'detector.detect', 'parser.parse', 'pipeline.process']
+
+
+def load_config(path: Optional[str], ocr: str = 'stub') -> Dict[str, Any]:
+    """Config pipeline; --ocr onnx chọn backend ONNX Runtime (stub/paddle dùng backend paddle)"""
+    from src.utils.config import Config
+    config = Config(path or str(ROOT / 'configs' / 'config.yaml')).config
+    config.setdefault('ocr', {})['backend'] = 'onnx' if ocr == 'onnx' else 'paddle'
+    return config
+
+
+def time_stage(fn: Callable[[Any], Any], inputs: List[Any], warmup: int) -> Dict[str, Any]:
+    """Chạy fn trên từng input, trả về thống kê latency (bỏ qua `warmup` lần đầu)"""
+    for item in inputs[:warmup]:
+        fn(item)
+
+    samples = []
+    wall_start = time.perf_counter()
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    summary = latency_summary(samples, time.perf_counter() - wall_start)
+    summary['peak_rss_mb'] = peak_rss_mb()
+    return summary
+
+
+def cold_start_probe(args) -> Dict[str, float]:
+    """Chạy trong subprocess riêng: import -> khởi tạo pipeline -> request đầu tiên"""
+    if args.ocr == 'stub':
+        install_stub_paddleocr(args.stub_latency)
+
+    start = time.perf_counter()
+    from src.pipeline.main_pipeline import IDCardPipeline
+    import_s = time.perf_counter() - start
+
+    config = load_config(args.config, args.ocr)
+    start = time.perf_counter()
+    pipeline = IDCardPipeline(config)
+    init_s = time.perf_counter() - start
+
+    _, image = load_corpus(args.images, 1, seed=args.seed, size=args.size)[0]
+    start = time.perf_counter()
+    pipeline.process(image)
+    first_s = time.perf_counter() - start
+
+    return {
+        'import_ms': round(import_s * 1000, 3),
+        'init_ms': round(init_s * 1000, 3),
+        'first_request_ms': round(first_s * 1000, 3),
+        'total_ms': round((import_s + init_s + first_s) * 1000, 3),
+        'load_timings_ms': {k: round(v * 1000, 3) for k, v in pipeline.load_timings.items()},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure_cold_start(args) -> Dict[str, Any]:
+    cmd = [sys.executable, str(Path(__file__).resolve()), '--cold-start-probe',
+           '--ocr', args.ocr, '--stub-latency', str(args.stub_latency), '--seed', str(args.seed),
+           '--size', f"{args.size[0]}x{args.size[1]}"]
+    if args.images:
+        cmd += ['--images', args.images]
+    if args.config:
+        cmd += ['--config', args.config]
+
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'probe failed'}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    if args.ocr == 'stub':
+        install_stub_paddleocr(args.stub_latency)
+
+    import cv2
+    from src.pipeline.main_pipeline import IDCardPipeline
+    from src.preprocessing.decoding import decode_image
+    from src.preprocessing.image_processing import ImageProcessor
+
+    corpus = load_corpus(args.images, args.count, seed=args.seed, size=args.size)
+    if not corpus:
+        raise SystemExit(f"Không có ảnh nào trong {args.images}")
+    images = [image for _, image in corpus]
+
+    pipeline = IDCardPipeline(load_config(args.config, args.ocr))
+    selected = set(args.stages or STAGES)
+    stages: Dict[str, Any] = {}
+
+    if selected & {'decode.full', 'decode.reduced'}:
+        encoded = [cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes() for img in images]
+        if 'decode.full' in selected:
+            stages['decode.full'] = time_stage(decode_image, encoded, args.warmup)
+        if 'decode.reduced' in selected:
+            stages['decode.reduced'] = time_stage(
+                lambda data: decode_image(data, pipeline.decode_min_long_side or 1600), encoded, args.warmup)
+
+    if 'preprocess.resize' in selected:
+        stages['preprocess.resize'] = time_stage(
+            lambda img: ImageProcessor.resize_image(img, (img.shape[1] // 2, img.shape[0] // 2)),
+            images, args.warmup)
+    if 'preprocess.enhance' in selected:
+        stages['preprocess.enhance'] = time_stage(ImageProcessor.enhance_image, images, args.warmup)
+    if 'preprocess.edges' in selected:
+        stages['preprocess.edges'] = time_stage(ImageProcessor.detect_edges, images, args.warmup)
+    if 'preprocess.localize' in selected:
+        def localize(img):
+            quad = ImageProcessor.find_card_quad(img)
+            return ImageProcessor.rectify_card(img, quad) if quad is not None else None
+
+        stages['preprocess.localize'] = time_stage(localize, images, args.warmup)
+        stages['preprocess.localize']['found_rate'] = round(
+            sum(ImageProcessor.find_card_quad(img) is not None for img in images) / len(images), 3)
+
+    # Output OCR giữ lại làm input cho parser.parse
+    ocr_outputs = [pipeline.ocr_engine.extract_text(img) for img in images]
+    if 'ocr.extract_text' in selected:
+        stages['ocr.extract_text'] = time_stage(pipeline.ocr_engine.extract_text, images, args.warmup)
+
+    if 'detector.detect' in selected:
+        if pipeline.detector is None:
+            stages['detector.detect'] = {'skipped': 'detector không load được (thiếu ultralytics hoặc weights)'}
+        else:
+            stages['detector.detect'] = time_stage(pipeline.detector.detect, images, args.warmup)
+
+    if 'parser.parse' in selected:
+        parse_inputs = [(pipeline.ocr_engine.get_full_text(ocr_results=blocks), blocks) for blocks in ocr_outputs]
+        stages['parser.parse'] = time_stage(lambda item: pipeline.field_parser.parse(*item),
+                                            parse_inputs, args.warmup)
+
+    if 'pipeline.process' in selected:
+        internal: Dict[str, List[float]] = {}
+
+        def process(img):
+            result = pipeline.process(img)
+            for name, ms in (result.get('timings') or {}).items():
+                internal.setdefault(name, []).append(ms)
+
+        stages['pipeline.process'] = time_stage(process, images, args.warmup)
+        # Breakdown theo StageTimer của pipeline (median, ms)
+        stages['pipeline.process']['internal_p50_ms'] = {
+            name: round(sorted(values)[len(values) // 2], 3) for name, values in internal.items()
+        }
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'ocr': args.ocr,
+            'stub_latency': args.stub_latency if args.ocr == 'stub' else None,
+            'corpus': args.images or 'synthetic',
+            'images': len(images),
+            'image_size': None if args.images else list(args.size),
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: Optional[float]) -> bool:
+    """In chênh lệch p50/p95/throughput so với baseline; False nếu p50 chậm hơn ngưỡng"""
+    ok = True
+    print(f"\nSo sánh với baseline {baseline.get('meta', {}).get('commit')}:")
+    print(f"{'stage':<22}{'p50 ms':>24}{'p95 ms':>24}{'img/s':>24}")
+    for name, new in report['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if not old or 'p50_ms' not in old or 'p50_ms' not in new:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'images_per_sec'):
+            delta = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:.2f}->{new[key]:.2f} ({delta:+.0f}%)")
+        print(f"{name:<22}" + ''.join(f"{c:>24}" for c in cells))
+        if max_regression is not None and old['p50_ms'] and \
+                (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 > max_regression:
+            print(f"   ❌ {name}: p50 chậm hơn quá {max_regression}%")
+            ok = False
+    return ok
+
+
+def print_report(report: Dict[str, Any]):
+    print("=" * 78)
+    print(f"Commit {report['meta']['commit']} | OCR: {report['meta']['ocr']} | "
+          f"{report['meta']['images']} ảnh | peak RSS {report['peak_rss_mb']} MB")
+    print(f"{'stage':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'img/s':>12}{'RSS MB':>10}")
+    for name, stats in report['stages'].items():
+        if 'skipped' in stats:
+            print(f"{name:<22}  bỏ qua: {stats['skipped']}")
+            continue
+        print(f"{name:<22}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+              f"{stats['images_per_sec']:>12.1f}{stats['peak_rss_mb']:>10.1f}")
+    cold = report.get('cold_start')
+    if cold:
+        if 'error' in cold:
+            print(f"Cold start: lỗi - {cold['error']}")
+        else:
+            print(f"Cold start: import {cold['import_ms']:.0f} ms + init {cold['init_ms']:.0f} ms "
+                  f"+ request đầu {cold['first_request_ms']:.0f} ms = {cold['total_ms']:.0f} ms")
+    print("=" * 78)
+
+
+def parse_size(value: str):
+    w, h = value.lower().split('x')
+    return int(w), int(h)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pipeline theo stage (offline, CPU)')
+    parser.add_argument('--images', help='Thư mục ảnh (mặc định: ảnh thẻ tổng hợp)')
+    parser.add_argument('--count', type=int, default=30, help='Số ảnh tổng hợp / số ảnh tối đa đọc từ thư mục')
+    parser.add_argument('--size', type=parse_size, default=(1280, 960), help='Kích thước ảnh tổng hợp WxH')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ocr', choices=['stub', 'paddle', 'onnx'], default='stub', help='Backend OCR')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='Độ trễ giả lập của OCR stub (giây)')
+    parser.add_argument('--config', help='Đường dẫn config.yaml')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, help='Chỉ chạy các stage này')
+    parser.add_argument('--warmup', type=int, default=2, help='Số lần chạy làm nóng mỗi stage')
+    parser.add_argument('--no-cold-start', action='store_true', help='Không đo cold-start')
+    parser.add_argument('--output', help='Ghi kết quả JSON ra file')
+    parser.add_argument('--compare', help='File JSON baseline để so sánh')
+    parser.add_argument('--max-regression', type=float,
+                        help='Exit 1 nếu p50 của stage nào chậm hơn baseline quá N%%')
+    parser.add_argument('--cold-start-probe', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Log của pipeline làm nhiễu output benchmark
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.cold_start_probe:
+        print(json.dumps(cold_start_probe(args)))
+        return
+
+    report = run_benchmark(args)
+    if not args.no_cold_start:
+        report['cold_start'] = measure_cold_start(args)
+    print_report(report)
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi kết quả: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
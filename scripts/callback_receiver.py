@@ -0,0 +1,66 @@
+"""
+Server nhận callback của job API (POST /api/jobs?callback_url=...) để thử nghiệm local
+
+In mỗi callback nhận được (job id, trạng thái, tóm tắt kết quả), tuỳ chọn ghi
+nguyên payload ra JSONL. Với --fail N, N request đầu trả 500 để thử cơ chế retry.
+
+Cần cho phép host trong config: jobs.callback_allowed_hosts: ["localhost"]
+
+Ví dụ:
+    python scripts/callback_receiver.py --port 9000 --output callbacks.jsonl
+    curl -F "file=@test_images/cccd.jpg" "http://localhost:8000/api/jobs?callback_url=http://localhost:9000/hook"
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+def make_handler(output: Optional[str], fail: int):
+    state = {'remaining_failures': fail}
+
+    class CallbackHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if state['remaining_failures'] > 0:
+                state['remaining_failures'] -= 1
+                self.send_response(500)
+                self.end_headers()
+                print(f"{self.path}: trả 500 (còn {state['remaining_failures']} lần)")
+                return
+
+            try:
+                job = json.loads(body)
+            except ValueError:
+                self.send_response(400)
+                self.end_headers()
+                return
+            result = job.get('result') or {}
+            print(f"{self.path}: job {job.get('id')} {job.get('status')} "
+                  f"success={result.get('success')} {job.get('error') or result.get('message', '')}")
+            if output:
+                with open(output, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(job, ensure_ascii=False) + '\n')
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return CallbackHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Nhận callback của job API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--output', default=None, help='Ghi payload ra file JSONL')
+    parser.add_argument('--fail', type=int, default=0, help='Số request đầu tiên trả 500')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.output, args.fail))
+    print(f"Đang nghe callback tại http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,84 @@
+"""
+Kiểm tra hồi quy cho quality gate (preprocessing.quality_gate)
+
+Chạy localize (find_card_quad + rectify như pipeline) rồi QualityGate.assess trên các
+ảnh tổng hợp có kết quả mong đợi: ảnh hợp lệ (thẻ chiếm cả khung, bản scan nền trắng)
+phải qua gate, ảnh mờ/thẻ nhỏ/loá trên thẻ phải bị từ chối đúng mã lý do.
+Exit 1 nếu có trường hợp sai - chạy sau khi sửa ngưỡng hoặc logic của gate.
+
+Ví dụ:
+    python scripts/check_quality_gate.py
+"""
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+
+from src.preprocessing.image_processing import ImageProcessor
+from src.preprocessing.quality import QualityGate
+from src.serving.warmup import synthetic_card
+from src.utils.config import Config
+
+
+def on_background(card: np.ndarray, size: Tuple[int, int], color: int, offset: Tuple[int, int]) -> np.ndarray:
+    """Dán thẻ lên nền đồng màu kích thước size (w, h) tại offset (x, y)"""
+    w, h = size
+    image = np.full((h, w, 3), color, dtype=np.uint8)
+    x, y = offset
+    image[y:y + card.shape[0], x:x + card.shape[1]] = card
+    return image
+
+
+def cases() -> List[Tuple[str, np.ndarray, Optional[str]]]:
+    """(tên, ảnh, mã lý do mong đợi hoặc None nếu phải qua gate)"""
+    card = synthetic_card()
+    glare = card.copy()
+    cv2.circle(glare, (650, 300), 140, (255, 255, 255), -1)
+    # Thẻ ~22% khung hình: rectify tìm được (>= 20%) nhưng dưới min_card_area_ratio
+    small = cv2.resize(card, (670, 422))
+    return [
+        ('full_frame_card', card, None),
+        ('white_margin_scan', on_background(card, (1020, 650), 255, (10, 10)), None),
+        ('a4_scan_white_background', on_background(card, (1700, 2200), 255, (350, 400)), None),
+        ('blurry', cv2.GaussianBlur(card, (21, 21), 8), 'blurry'),
+        ('small_card_on_table', on_background(small, (1280, 960), 90, (300, 270)), 'card_too_small'),
+        ('glare_on_card', on_background(glare, (1280, 960), 90, (140, 165)), 'glare'),
+    ]
+
+
+def assess(gate: QualityGate, rectify: Dict, image: np.ndarray) -> Dict:
+    quad = ImageProcessor.find_card_quad(
+        image,
+        work_size=int(rectify.get('work_size', 640)),
+        min_area_ratio=float(rectify.get('min_area_ratio', 0.2)),
+        aspect_tolerance=float(rectify.get('aspect_tolerance', 0.25))
+    )
+    card = None
+    if quad is not None:
+        card, _ = ImageProcessor.rectify_card(image, quad, tuple(rectify.get('canonical_size', (1000, 630))))
+    return gate.assess(image, card=card, quad=quad)
+
+
+def main() -> int:
+    config = Config(str(ROOT / 'configs' / 'config.yaml'))
+    gate = QualityGate.from_config({**(config.get('preprocessing.quality_gate') or {}), 'enabled': True})
+    rectify = config.get('preprocessing.rectify') or {}
+
+    failures = 0
+    for name, image, expected in cases():
+        report = assess(gate, rectify, image)
+        codes = [r['code'] for r in report['reasons']]
+        ok = (report['passed'] if expected is None else expected in codes)
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name:28s} mong đợi={expected or 'passed':16s} "
+              f"lý do={codes or '-'} area={report['metrics'].get('card_area_ratio')}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
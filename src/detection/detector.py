@@ -8,10 +8,105 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parent.parent.parent
 sys.path.append(str(ROOT))
 
-from ultralytics import YOLO
+import logging
 import cv2
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+
+class Detections:
+    """
+    Kết quả detect của một ảnh dạng mảng (thay vì list dict)
+    
+    boxes: (N, 4) int32 - x1, y1, x2, y2
+    confidences: (N,) float32
+    class_ids: (N,) int32
+    """
+    
+    def __init__(self, boxes: np.ndarray, confidences: np.ndarray, class_ids: np.ndarray,
+                 names: Dict[int, str]):
+        self.boxes = boxes
+        self.confidences = confidences
+        self.class_ids = class_ids
+        self.names = names
+    
+    @classmethod
+    def from_result(cls, result, names: Dict[int, str]) -> "Detections":
+        """Tạo từ một ultralytics Results - một lần chuyển tensor sang numpy cho cả ảnh"""
+        data = result.boxes.data.cpu().numpy()  # (N, 6): x1, y1, x2, y2, conf, cls
+        # Sort theo class_id để dễ đọc (giống detect())
+        data = data[np.argsort(data[:, 5], kind='stable')]
+        return cls(
+            boxes=data[:, :4].astype(np.int32),
+            confidences=data[:, 4].astype(np.float32),
+            class_ids=data[:, 5].astype(np.int32),
+            names=names
+        )
+    
+    def __len__(self) -> int:
+        return len(self.class_ids)
+    
+    @property
+    def class_names(self) -> List[str]:
+        return [self.names[int(c)] for c in self.class_ids]
+    
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Chuyển sang dạng list dict như detect() trả về"""
+        return [
+            {
+                'bbox': box,
+                'confidence': conf,
+                'class_id': class_id,
+                'class_name': self.names[class_id]
+            }
+            for box, conf, class_id in zip(self.boxes.tolist(), self.confidences.tolist(),
+                                           self.class_ids.tolist())
+        ]
+
+
+class LazyCrop:
+    """
+    Vùng crop chưa cắt: chỉ giữ ảnh gốc và bbox (đã kẹp trong ảnh)
+    
+    view(): view vào ảnh gốc (zero-copy, chỉ dùng khi ảnh gốc chưa bị sửa/giải phóng)
+    array: mảng riêng, copy lần truy cập đầu rồi bỏ tham chiếu tới ảnh gốc
+    np.asarray(crop) tương đương crop.array
+    """
+    
+    __slots__ = ('bbox', '_image', '_array')
+    
+    def __init__(self, image: np.ndarray, bbox: List[int]):
+        x1, y1, x2, y2 = bbox
+        h, w = image.shape[:2]
+        self.bbox = [max(0, x1), max(0, y1), min(w, x2), min(h, y2)]
+        self._image: Optional[np.ndarray] = image
+        self._array: Optional[np.ndarray] = None
+    
+    @property
+    def shape(self) -> tuple:
+        if self._array is not None:
+            return self._array.shape
+        x1, y1, x2, y2 = self.bbox
+        return (max(0, y2 - y1), max(0, x2 - x1)) + self._image.shape[2:]
+    
+    def view(self) -> np.ndarray:
+        if self._array is not None:
+            return self._array
+        x1, y1, x2, y2 = self.bbox
+        return self._image[y1:y2, x1:x2]
+    
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            self._array = self.view().copy()
+            self._image = None
+        return self._array
+    
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.array if dtype is None else self.array.astype(dtype)
+
 
 class CCCDDetector:
     """Detector cho CCCD Việt Nam"""
@@ -52,11 +147,13 @@ class CCCDDetector:
                 f"   Vui lòng train model trước bằng: python scripts/train_detector.py"
             )
         
-        print(f"📦 Loading model: {model_path}")
+        # Import ultralytics (kéo theo torch) chỉ khi thực sự load model
+        from ultralytics import YOLO
+        
+        logger.info("Loading model: %s", model_path)
         self.model = YOLO(str(model_path))
         self.conf_threshold = conf_threshold
-        print(f"✓ Model loaded!")
-        print(f"✓ Classes: {len(self.CLASS_NAMES)} classes")
+        logger.info("Model loaded (%d classes)", len(self.CLASS_NAMES))
     
     def detect(self, image: np.ndarray, conf: Optional[float] = None) -> List[Dict[str, Any]]:
         """
@@ -74,39 +171,60 @@ class CCCDDetector:
         
         detections = []
         for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0])
-                class_id = int(box.cls[0])
-                class_name = self.model.names[class_id]
-                
-                detections.append({
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'confidence': confidence,
-                    'class_id': class_id,
-                    'class_name': class_name
-                })
-        
-        # Sort theo class_id để dễ đọc
-        detections.sort(key=lambda x: x['class_id'])
+            detections.extend(Detections.from_result(r, self.model.names).to_list())
         
         return detections
     
-    def detect_and_crop(self, image: np.ndarray, conf: Optional[float] = None) -> Dict[str, np.ndarray]:
+    def detect_batch(self, images: Sequence[np.ndarray], conf: Optional[float] = None,
+                     batch_size: int = 16) -> List[Detections]:
+        """
+        Phát hiện trên nhiều ảnh, mỗi lần gọi model với batch_size ảnh
+        
+        Returns:
+            List Detections, cùng thứ tự với images
+        """
+        conf = conf or self.conf_threshold
+        batch_size = max(1, batch_size)
+        
+        outputs = []
+        for start in range(0, len(images), batch_size):
+            batch = list(images[start:start + batch_size])
+            results = self.model(batch, conf=conf, verbose=False, batch=len(batch))
+            outputs.extend(Detections.from_result(r, self.model.names) for r in results)
+        
+        return outputs
+    
+    def detect_and_crop(self, image: np.ndarray, conf: Optional[float] = None,
+                        detections: Optional[Union[List[Dict[str, Any]], Detections]] = None,
+                        copy: bool = False, lazy: bool = False) -> Dict[str, Union[np.ndarray, LazyCrop]]:
         """
         Detect và crop các vùng thông tin
         
+        Args:
+            detections: Kết quả detect() đã có (None = chạy detect)
+            copy: False = trả về view vào ảnh gốc (zero-copy),
+                  True = copy ra mảng riêng (không giữ tham chiếu tới ảnh gốc) - dùng khi crop
+                  được giữ lâu hơn ảnh gốc (cache, kết quả job)
+            lazy: True = trả về LazyCrop (chỉ copy khi truy cập .array, bỏ qua `copy`)
+        
         Returns:
             Dictionary: {class_name: cropped_image}
         """
-        detections = self.detect(image, conf)
+        if detections is None:
+            detections = self.detect(image, conf)
+        elif isinstance(detections, Detections):
+            detections = detections.to_list()
         
         cropped_regions = {}
         for det in detections:
             class_name = det['class_name']
             bbox = det['bbox']
-            cropped = self.crop_bbox(image, bbox)
+            if lazy:
+                cropped = LazyCrop(image, bbox)
+            else:
+                cropped = self.crop_bbox(image, bbox)
+                if copy:
+                    cropped = cropped.copy()
             
             # Nếu có nhiều vùng cùng class, thêm số thứ tự
             if class_name in cropped_regions:
@@ -120,7 +238,7 @@ class CCCDDetector:
         return cropped_regions
     
     def crop_bbox(self, image: np.ndarray, bbox: List[int]) -> np.ndarray:
-        """Cắt vùng ảnh theo bbox"""
+        """Cắt vùng ảnh theo bbox (view vào ảnh gốc, không copy)"""
         x1, y1, x2, y2 = bbox
         # Đảm bảo bbox nằm trong ảnh
         h, w = image.shape[:2]
@@ -129,11 +247,18 @@ class CCCDDetector:
         return image[y1:y2, x1:x2]
     
     def visualize(self, image: np.ndarray, conf: Optional[float] = None, 
-                  save_path: Optional[str] = None) -> np.ndarray:
+                  save_path: Optional[str] = None,
+                  detections: Optional[Union[List[Dict[str, Any]], Detections]] = None) -> np.ndarray:
         """
         Vẽ bounding boxes lên ảnh
+        
+        Args:
+            detections: Kết quả detect() đã có (None = chạy detect)
         """
-        detections = self.detect(image, conf)
+        if detections is None:
+            detections = self.detect(image, conf)
+        elif isinstance(detections, Detections):
+            detections = detections.to_list()
         result_img = image.copy()
         
         # Màu cho mỗi class
@@ -169,17 +294,20 @@ class CCCDDetector:
         return result_img
     
     def process_image(self, image_path: str, output_dir: Optional[str] = None, 
-                     conf: Optional[float] = None) -> Dict[str, Any]:
+                     conf: Optional[float] = None,
+                     detections: Optional[Union[List[Dict[str, Any]], Detections]] = None) -> Dict[str, Any]:
         """
-        Xử lý một ảnh CCCD hoàn chỉnh
+        Xử lý một ảnh CCCD hoàn chỉnh - model chỉ chạy một lần
         
         Args:
             image_path: Đường dẫn ảnh CCCD
             output_dir: Thư mục lưu kết quả (optional)
             conf: Confidence threshold
+            detections: Kết quả detect() đã có (None = chạy detect)
             
         Returns:
-            Dictionary chứa detections và cropped regions
+            Dictionary chứa detections và cropped regions (LazyCrop - lưu file bằng view,
+            chỉ copy khi truy cập .array)
         """
         # Đọc ảnh
         image = cv2.imread(image_path)
@@ -188,17 +316,20 @@ class CCCDDetector:
         
         print(f"📸 Processing: {image_path}")
         
-        # Detect
-        detections = self.detect(image, conf)
+        # Detect (một lần, dùng lại cho crop và visualize)
+        if detections is None:
+            detections = self.detect(image, conf)
+        elif isinstance(detections, Detections):
+            detections = detections.to_list()
         print(f"✓ Detected {len(detections)} regions:")
         for det in detections:
             print(f"   - {det['class_name']}: {det['confidence']:.2f}")
         
         # Crop regions
-        cropped_regions = self.detect_and_crop(image, conf)
+        cropped_regions = self.detect_and_crop(image, detections=detections, lazy=True)
         
         # Visualize
-        vis_image = self.visualize(image, conf)
+        vis_image = self.visualize(image, detections=detections)
         
         # Lưu kết quả
         if output_dir:
@@ -214,7 +345,7 @@ class CCCDDetector:
             # Lưu cropped regions
             for class_name, cropped in cropped_regions.items():
                 crop_path = output_path / f"{img_name}_{class_name}.jpg"
-                cv2.imwrite(str(crop_path), cropped)
+                cv2.imwrite(str(crop_path), cropped.view())
             
             print(f"✓ Saved {len(cropped_regions)} cropped regions")
         
@@ -0,0 +1,140 @@
+# src/ocr/backends.py
+"""
+Backend OCR (detection + recognition) sau một interface chung
+
+Mỗi backend trả về list OCRLine đã chuẩn hoá (polygon 4 điểm int32, text, confidence)
+nên OCREngine/pipeline không phải đoán định dạng kết quả của từng thư viện.
+Chọn backend bằng `ocr.backend` trong config.yaml:
+    paddle  PaddleOCR (paddlepaddle)
+    onnx    model PP-OCR export sang ONNX, chạy bằng ONNX Runtime CPU (src/ocr/onnx_backend.py)
+"""
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Protocol
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('paddle', 'onnx')
+
+
+class OCRLine(NamedTuple):
+    """Một dòng text đã nhận dạng"""
+    polygon: np.ndarray  # (4, 2) int32, toạ độ trên ảnh đầu vào
+    text: str
+    confidence: float
+
+    def as_block(self) -> Dict[str, Any]:
+        """Dạng block dùng trong pipeline/field parser"""
+        return {'bbox': self.polygon, 'text': self.text, 'confidence': self.confidence}
+
+
+class OCRBackend(Protocol):
+    """Interface backend OCR"""
+
+    name: str
+    # Backend có classifier hướng dòng text (bật/tắt được từng lần gọi)
+    supports_angle_cls: bool
+
+    def predict(self, image: np.ndarray, angle_cls: bool = True) -> List[OCRLine]:
+        """Detection + recognition trên ảnh BGR; angle_cls=False bỏ classifier cho ảnh này"""
+        ...
+
+    def after_fork(self):
+        """Gọi trong worker sau khi fork từ process đã load model (inference mode prefork)"""
+        ...
+
+
+def _polygon(points) -> np.ndarray:
+    return np.asarray(points, dtype=np.float32).reshape(-1, 2).round().astype(np.int32)
+
+
+class PaddleBackend:
+    """PaddleOCR đầy đủ (det + cls + rec)"""
+
+    name = 'paddle'
+
+    def __init__(self, lang: str = 'vi', use_angle_cls: bool = True, cpu_threads: Optional[int] = None):
+        """
+        Args:
+            cpu_threads: Số thread CPU của Paddle inference (None = mặc định của PaddleOCR)
+        """
+        # Import paddleocr khi tạo backend - import module không kéo theo framework nặng
+        from paddleocr import PaddleOCR
+        self.supports_angle_cls = use_angle_cls
+        kwargs = {'cpu_threads': cpu_threads} if cpu_threads else {}
+        self._ocr = PaddleOCR(
+            use_angle_cls=use_angle_cls,
+            lang=lang,
+            **kwargs,
+            # det_db_thresh=0.3,      # ← Thêm: ngưỡng detection thấp hơn
+            # det_db_box_thresh=0.5,   # ← Thêm: confidence box cao hơn
+            # rec_batch_num=6,         # ← Thêm: batch size
+            # use_space_char=True      # ← Quan trọng cho tiếng Việt
+            # use_gpu=use_gpu,
+            # show_log=False
+        )
+        # PaddleOCR 3.x: predict() trả về dict rec_texts/rec_scores/rec_polys;
+        # 2.x: ocr() trả về list [polygon, (text, score)] - xác định một lần khi khởi tạo
+        self._legacy = not hasattr(self._ocr, 'predict')
+
+    def predict(self, image: np.ndarray, angle_cls: bool = True) -> List[OCRLine]:
+        if self._legacy:
+            kwargs = {} if angle_cls or not self.supports_angle_cls else {'cls': False}
+            results = self._ocr.ocr(image, **kwargs)
+            return self._parse_legacy(results[0] if results else None)
+
+        kwargs = {} if angle_cls or not self.supports_angle_cls else {'use_textline_orientation': False}
+        results = list(self._ocr.predict(image, **kwargs))
+        return self._parse(results[0] if results else None)
+
+    def after_fork(self):
+        # Paddle tạo thread pool khi chạy inference lần đầu (process cha chưa chạy) - không cần làm gì
+        pass
+
+    @staticmethod
+    def _parse(page: Optional[Dict[str, Any]]) -> List[OCRLine]:
+        if not page:
+            return []
+        texts = page['rec_texts']
+        # rec_scores/rec_polys có thể là numpy array - không dùng `or` (truth value mơ hồ)
+        scores = page.get('rec_scores')
+        if scores is None:
+            scores = [1.0] * len(texts)
+        polys = page.get('rec_polys')
+        if polys is None:
+            polys = [[[0, 0], [1, 0], [1, 1], [0, 1]]] * len(texts)
+        return [OCRLine(_polygon(poly), text.strip(), float(score))
+                for text, score, poly in zip(texts, scores, polys) if text and text.strip()]
+
+    @staticmethod
+    def _parse_legacy(page: Optional[list]) -> List[OCRLine]:
+        lines = []
+        for idx, line in enumerate(page or []):
+            try:
+                polygon, (text, score) = line[0], line[1][:2]
+            except (TypeError, ValueError, IndexError):
+                logger.debug("Bỏ qua line %d: %s", idx, line)
+                continue
+            text = str(text).strip()
+            if text:
+                lines.append(OCRLine(_polygon(polygon), text, float(score)))
+        return lines
+
+
+def backend_from_config(ocr_config: Optional[Dict[str, Any]], use_angle_cls: bool = True) -> OCRBackend:
+    """
+    Tạo backend theo section `ocr:` của config.yaml
+    Args:
+        use_angle_cls: Load classifier hướng dòng text
+    """
+    ocr_config = ocr_config or {}
+    name = ocr_config.get('backend', 'paddle')
+    if name == 'paddle':
+        cpu_threads = ocr_config.get('cpu_threads')
+        return PaddleBackend(lang=ocr_config.get('lang', 'vi'), use_angle_cls=use_angle_cls,
+                             cpu_threads=int(cpu_threads) if cpu_threads else None)
+    if name == 'onnx':
+        from src.ocr.onnx_backend import OnnxBackend
+        return OnnxBackend.from_config(ocr_config.get('onnx'), use_angle_cls=use_angle_cls)
+    raise ValueError(f"ocr.backend không hợp lệ: {name} (chọn {', '.join(BACKENDS)})")
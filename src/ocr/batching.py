@@ -0,0 +1,184 @@
+# src/ocr/batching.py
+"""
+Micro-batching cho bước recognition
+
+Các worker gửi crop dòng text của request mình vào một hàng đợi chung.
+Một thread scheduler gom crop từ nhiều request trong một cửa sổ thời gian ngắn
+(hoặc tới khi đủ max_batch_size), chạy recognition một lần cho cả batch rồi
+trả kết quả về đúng request.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+RecognizeFn = Callable[[List[np.ndarray]], List[Tuple[str, float]]]
+
+
+class _Request:
+    """Một lần gọi recognize() - chờ đủ kết quả của tất cả crop"""
+
+    def __init__(self, n_items: int):
+        self.future: Future = Future()
+        self.results: List[Optional[Tuple[str, float]]] = [None] * n_items
+        self.remaining = n_items
+
+
+class BatchStats:
+    """
+    Thống kê kích thước batch và thời gian chờ trong hàng đợi
+    Ngoài tổng cộng dồn, giữ các batch chưa được drain() - pipeline gửi về API
+    (cả khi worker là process khác) để ghi vào histogram của /metrics
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes: Counter = Counter()
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._pending_sizes: List[int] = []
+        self._pending_waits: List[float] = []
+
+    def record(self, batch_size: int, waits: List[float]):
+        with self._lock:
+            self.batches += 1
+            self.items += batch_size
+            self.batch_sizes[batch_size] += 1
+            self.total_wait += sum(waits)
+            self.max_wait = max(self.max_wait, max(waits, default=0.0))
+            self._pending_sizes.append(batch_size)
+            self._pending_waits.extend(waits)
+
+    def drain(self) -> Dict[str, List[float]]:
+        """Batch size và thời gian chờ (giây, từng crop) ghi nhận từ lần drain trước, rồi xoá"""
+        with self._lock:
+            drained = {'batch_sizes': self._pending_sizes, 'wait_seconds': self._pending_waits}
+            self._pending_sizes, self._pending_waits = [], []
+        return drained
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'mean_wait_ms': self.total_wait / self.items * 1000 if self.items else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+
+class RecognitionBatcher:
+    """Scheduler gom crop từ nhiều request thành batch recognition"""
+
+    def __init__(self, recognize_fn: RecognizeFn, window_ms: float = 10.0,
+                 max_batch_size: int = 32):
+        """
+        Args:
+            recognize_fn: Hàm nhận list crop, trả list (text, score) cùng thứ tự
+            window_ms: Thời gian tối đa chờ gom thêm crop sau crop đầu tiên
+            max_batch_size: Số crop tối đa mỗi batch
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size phải >= 1")
+
+        self.recognize_fn = recognize_fn
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch_size = max_batch_size
+        self.stats = BatchStats()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='rec-batcher', daemon=True)
+        self._thread.start()
+
+    def recognize(self, crops: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """Nhận dạng các crop (block tới khi batch chứa chúng chạy xong)"""
+        if not crops:
+            return []
+        if self._closed:
+            raise RuntimeError("RecognitionBatcher đã đóng")
+
+        request = _Request(len(crops))
+        now = time.perf_counter()
+        for idx, crop in enumerate(crops):
+            self._queue.put((request, idx, crop, now))
+        return request.future.result()
+
+    def _collect(self) -> List[Tuple[_Request, int, np.ndarray, float]]:
+        """Lấy crop đầu tiên (block), sau đó gom thêm trong cửa sổ thời gian"""
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Đưa lại tín hiệu dừng để vòng lặp thoát sau batch này
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            start = time.perf_counter()
+            self.stats.record(len(batch), [start - enqueued for _, _, _, enqueued in batch])
+
+            try:
+                outputs = self.recognize_fn([crop for _, _, crop, _ in batch])
+                if len(outputs) != len(batch):
+                    raise RuntimeError(f"recognize_fn trả {len(outputs)} kết quả cho {len(batch)} crop")
+            except Exception as e:
+                for request in {id(r): r for r, _, _, _ in batch}.values():
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            for (request, idx, _, _), output in zip(batch, outputs):
+                if request.future.done():
+                    continue
+                request.results[idx] = output
+                request.remaining -= 1
+                if request.remaining == 0:
+                    request.future.set_result(request.results)
+
+    def close(self):
+        """Dừng scheduler sau khi xử lý hết các crop đang chờ"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+
+_shared_batcher: Optional[RecognitionBatcher] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_batcher(recognize_factory: Callable[[], RecognizeFn], window_ms: float = 10.0,
+                       max_batch_size: int = 32) -> RecognitionBatcher:
+    """
+    Batcher dùng chung trong process - các worker thread cùng gửi crop vào đây
+    recognize_factory chỉ được gọi một lần khi tạo batcher
+    """
+    global _shared_batcher
+    with _shared_lock:
+        if _shared_batcher is None:
+            _shared_batcher = RecognitionBatcher(recognize_factory(), window_ms, max_batch_size)
+        return _shared_batcher
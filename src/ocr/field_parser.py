@@ -1,9 +1,114 @@
 # src/parsers/field_parser.py
+import logging
 import re
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime
 
+# Chữ cái in hoa tiếng Việt dùng trong pattern họ tên
+_UPPER_VI = 'A-ZÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ'
+
+# (date, day, month, year) - kết quả quét ngày tháng dùng chung cho dob và expiry
+ParsedDate = Tuple[str, int, int, int]
+
+logger = logging.getLogger(__name__)
+
+
 class FieldParser:
+    # Class của CCCDDetector -> field output
+    REGION_FIELDS = {
+        'id': 'id_number',
+        'name': 'full_name',
+        'dob': 'date_of_birth',
+        'gender': 'gender',
+        'nationality': 'nationality',
+        'origin_place': 'place_of_origin',
+        'current_place': 'place_of_residence',
+        'expire_date': 'expiry_date',
+        'issue_date': 'issue_date',
+        'features': 'features',
+    }
+    
+    # Blacklist mở rộng - thêm các variation không dấu
+    NAME_BLACKLIST = frozenset([
+        'SOCIALIST', 'REPUBLIC', 'VIET', 'NAM', 'VIETNAM', 'CITIZEN', 'IDENTITY', 'CARD',
+        'INDEPENDENCE', 'FREEDOM', 'HAPPINESS', 'CÔNG', 'CONG', 'HÓA', 'HOA', 'HÒA',
+        'DÂN', 'DAN', 'CĂN', 'CAN', 'CƯỚC', 'CUOC', 'CHỦ', 'CHU', 'CHÙ',
+        'NGHĨA', 'NGHIA', 'XÃ', 'XA', 'HỘI', 'HOI', 'VIỆT', 'VET'
+    ])
+    
+    NAME_CORRECTIONS = {
+        'NGUYN': 'NGUYỄN',
+        'TRÂN': 'TRẦN',
+        'L': 'LÊ',
+        'LE': 'LÊ',
+        'PHM': 'PHẠM',
+        'PHAM': 'PHẠM',
+        'HUỲH': 'HUỲNH',
+        'HUYNH': 'HUỲNH',
+        'VÕ': 'VÕ',
+        'VO': 'VÕ',
+        'DƯƠNG': 'DƯƠNG',
+        'DUONG': 'DƯƠNG',
+        'BÙI': 'BÙI',
+        'BUI': 'BÙI',
+        'ĐÀO': 'ĐÀO',
+        'DAO': 'ĐÀO',
+        'ĐỖ': 'ĐỖ',
+        'DO': 'ĐỖ',
+    }
+    
+    # Pattern compile một lần khi load class
+    _RE_NEWLINES = re.compile(r'\n+')
+    _RE_SPACES = re.compile(r'\s+')
+    _RE_NON_DIGIT = re.compile(r'\D')
+    _RE_ID = re.compile(r'\b\d{12}\b')
+    _RE_DATE = re.compile(r'\b(\d{2})/(\d{2})/(\d{4})\b')
+    _RE_DATE_ANY = re.compile(r'\d{2}/\d{2}/\d{4}')
+    _RE_NAME = re.compile(rf'\b([{_UPPER_VI}]{{2,}}(?:\s+[{_UPPER_VI}]{{2,}}){{1,3}})\b')
+    # "Automaton" cho blacklist: một regex alternation, từ dài thử trước
+    _RE_NAME_BLACKLIST = re.compile('|'.join(map(re.escape, sorted(NAME_BLACKLIST, key=len, reverse=True))))
+    
+    _RE_GENDER = (
+        re.compile(r'(?:Giới\s*tính|Sex)[:\s]+(Nữ|Nam|Female|Male)', re.IGNORECASE),  # Có context
+        re.compile(r'\b(Nữ|Nam|Female|Male)\b', re.IGNORECASE)  # Fallback
+    )
+    
+    _RE_NATIONALITY = (
+        re.compile(r'Nationality[:\s]+([^\n]+)', re.IGNORECASE),
+        re.compile(r'(?:Quốc\s*tịch|tich)[:\s]+([^\n]+)', re.IGNORECASE)
+    )
+    _RE_NATIONALITY_STOP = re.compile(r'\s+(?:Giới|Quê|Place|of\s+origin)', re.IGNORECASE)
+    _RE_NATIONALITY_VALID = re.compile(r'^[A-Za-zÀ-ỹ\s]{2,20}$')
+    
+    _RE_ORIGIN = (
+        re.compile(r'origin[:\s]+(.+?)(?:\s+(?:thuòng|thu[oò]ng|Noi|Place\s+of\s+residence|Có\s+giá)|$)', re.IGNORECASE),
+        re.compile(r'Quê\s+quán[:\s/]+(.+?)(?:\s+Nơi|$)', re.IGNORECASE)
+    )
+    _RE_THUONG = re.compile(r'thu[oò]ng\s+', re.IGNORECASE)
+    
+    _RE_RESIDENCE = (
+        # Pattern 1: Tìm giữa "residence" và "Date of expiry" hoặc "Có giá"
+        re.compile(r'residence[:\s]+(.+?)(?=\s*(?:Co|Có)\s+gia|Date\s+of\s+expiry|$)', re.IGNORECASE | re.DOTALL),
+        # Pattern 2: Tiếng Việt
+        re.compile(r'Noi\s+thu[oò]ng\s+tr[uú][:\s/]+(.+?)(?=\s*(?:Co|Có)\s+gia|$)', re.IGNORECASE | re.DOTALL),
+    )
+    # Aggressive cleaning - remove junk text
+    _RE_RESIDENCE_JUNK = tuple(re.compile(p, re.IGNORECASE) for p in (
+        r'Noi\s+trú[:/\s]+',
+        r'Place\s+of\s+residence[:\s]+',
+        r'thu[oò]ng\s+',
+        r'\s*(?:Co|Có)\s+gia.*$',  # Remove "Co gia tri den..."
+        r'\s*Date\s+of.*$',        # Remove "Date of expiry..."
+        r'\s+Place\s+\d+.*$',      # Remove "Place 6"
+        r'\s+Place$',
+    ))
+    _RE_HAS_LETTER = re.compile(r'[A-Za-zÀ-ỹ]')
+    
+    _RE_EXPIRY = (
+        re.compile(r'(?:Có\s+giá\s+trị\s+đến|Co\s+gia\s+tri\s+den|giá\s+trj\s+dên)[:\s]+(\d{2}/\d{2}/\d{4})', re.IGNORECASE),
+        re.compile(r'(?:Date\s+of\s+)?expiry[:\s]+(\d{2}/\d{2}/\d{4})', re.IGNORECASE)
+    )
+    
     def __init__(self):
         """Initialize parser"""
         pass
@@ -13,34 +118,86 @@ class FieldParser:
         # Clean text trước
         text = self._clean_text(full_text)
         
+        # Quét ngày tháng một lần, dùng chung cho ngày sinh và ngày hết hạn
+        dates = self._find_dates(text)
+        current_year = datetime.now().year
+        
         data = {
             'card_type': self.detect_card_type(text),  # ← THÊM NHẬN DIỆN LOẠI THẺ
             'id_number': self._extract_id_number(text),
             'full_name': self._extract_name(text),
-            'date_of_birth': self._extract_dob(text),
+            'date_of_birth': self._extract_dob(text, dates, current_year),
             'gender': self._extract_gender(text),
             'nationality': self._extract_nationality(text),
             'place_of_origin': self._extract_origin(text),
             'place_of_residence': self._extract_residence(text),
-            'expiry_date': self._extract_expiry(text)
+            'expiry_date': self._extract_expiry(text, dates, current_year)
         }
         
-        print(f"\n📊 Extracted:")
-        for key, value in data.items():
-            if value:
-                print(f"   ✓ {key}: {value}")
-        print()
+        logger.debug("Extracted: %s", data)
+        
+        return data
+    
+    def parse_regions(self, regions: Dict[str, str]) -> Dict[str, Optional[str]]:
+        """
+        Parse text OCR theo từng vùng detector đã crop (mỗi vùng biết sẵn field)
+        Chỉ chuẩn hóa giá trị, không cần regex-scan toàn bộ text
+        """
+        # CCCDDetector chỉ được train cho CCCD; giữ đủ các key như parse()
+        data = {
+            'card_type': 'Căn cước công dân',
+            'id_number': None,
+            'full_name': None,
+            'date_of_birth': None,
+            'gender': None,
+            'nationality': None,
+            'place_of_origin': None,
+            'place_of_residence': None,
+            'expiry_date': None
+        }
+        
+        for region, raw in regions.items():
+            field = self.REGION_FIELDS.get(region)
+            text = self._clean_text(raw).strip()
+            if not field or not text:
+                continue
+            
+            if field == 'id_number':
+                digits = self._RE_NON_DIGIT.sub('', text)
+                value = digits if len(digits) == 12 else (self._extract_id_number(text) or digits or None)
+            elif field == 'full_name':
+                value = self._fix_name_spelling(text.upper())
+            elif field in ('date_of_birth', 'expiry_date', 'issue_date'):
+                match = self._RE_DATE_ANY.search(text)
+                value = match.group() if match else text
+            elif field == 'gender':
+                value = self._extract_gender(text) or text
+            elif field == 'nationality':
+                value = self._normalize_nationality(text)
+            else:
+                value = text
+            
+            data[field] = value
+        
+        logger.debug("Extracted (regions): %s", data)
         
         return data
     
     def _clean_text(self, text: str) -> str:
         """Clean và normalize text"""
         # Gộp các dòng ngắn thành 1 dòng
-        text = re.sub(r'\n+', ' ', text)
+        text = self._RE_NEWLINES.sub(' ', text)
         # Remove multiple spaces
-        text = re.sub(r'\s+', ' ', text)
+        text = self._RE_SPACES.sub(' ', text)
         return text
     
+    def _find_dates(self, text: str) -> List[ParsedDate]:
+        """Tất cả date dd/mm/yyyy trong text, theo thứ tự xuất hiện"""
+        return [
+            (match.group(), int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            for match in self._RE_DATE.finditer(text)
+        ]
+    
     def detect_card_type(self, text: str) -> str:
         """Nhận diện loại giấy tờ"""
         text_upper = text.upper()
@@ -56,29 +213,19 @@ class FieldParser:
     
     def _extract_id_number(self, text: str) -> Optional[str]:
         """Tìm số ID (12 chữ số)"""
-        match = re.search(r'\b\d{12}\b', text)
+        match = self._RE_ID.search(text)
         return match.group() if match else None
     
     def _extract_name(self, text: str) -> Optional[str]:
         """Tìm họ tên - cải thiện với spell correction"""
         # Pattern: 2-4 từ viết HOA liên tiếp
-        pattern = r'\b([A-ZÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ]{2,}(?:\s+[A-ZÀÁẠẢÃÂẦẤẬẨẪĂẰẮẶẲẴÈÉẸẺẼÊỀẾỆỂỄÌÍỊỈĨÒÓỌỎÕÔỒỐỘỔỖƠỜỚỢỞỠÙÚỤỦŨƯỪỨỰỬỮỲÝỴỶỸĐ]{2,}){1,3})\b'
-        
-        matches = re.findall(pattern, text)
-        
-        # Blacklist mở rộng - thêm các variation không dấu
-        blacklist = [
-            'SOCIALIST', 'REPUBLIC', 'VIET', 'NAM', 'VIETNAM', 'CITIZEN', 'IDENTITY', 'CARD',
-            'INDEPENDENCE', 'FREEDOM', 'HAPPINESS', 'CÔNG', 'CONG', 'HÓA', 'HOA', 'HÒA',
-            'DÂN', 'DAN', 'CĂN', 'CAN', 'CƯỚC', 'CUOC', 'CHỦ', 'CHU', 'CHÙ',
-            'NGHĨA', 'NGHIA', 'XÃ', 'XA', 'HỘI', 'HOI', 'VIỆT', 'VIET', 'VET'
-        ]
+        matches = self._RE_NAME.findall(text)
         
         valid_names = []
         
         for name in matches:
             # Skip nếu chứa keyword
-            if any(kw in name.upper().replace(' ', '') for kw in blacklist):
+            if self._RE_NAME_BLACKLIST.search(name.upper().replace(' ', '')):
                 continue
             
             # Check có 2-4 từ
@@ -100,75 +247,38 @@ class FieldParser:
             # Fix spelling errors
             name = self._fix_name_spelling(name)
             return name
-    
+        
         return None
     
     def _fix_name_spelling(self, name: str) -> str:
         """Fix common OCR errors in Vietnamese names"""
-        corrections = {
-            'NGUYN': 'NGUYỄN',
-            'TRÂN': 'TRẦN',
-            'L': 'LÊ',
-            'LE': 'LÊ',
-            'PHM': 'PHẠM',
-            'PHAM': 'PHẠM',
-            'HUỲH': 'HUỲNH',
-            'HUYNH': 'HUỲNH',
-            'VÕ': 'VÕ',
-            'VO': 'VÕ',
-            'DƯƠNG': 'DƯƠNG',
-            'DUONG': 'DƯƠNG',
-            'BÙI': 'BÙI',
-            'BUI': 'BÙI',
-            'ĐÀO': 'ĐÀO',
-            'DAO': 'ĐÀO',
-            'ĐỖ': 'ĐỖ',
-            'DO': 'ĐỖ',
-        }
-        
-        words = name.split()
-        fixed_words = []
-        
-        for word in words:
-            # Kiểm tra từng từ có trong corrections không
-            fixed_word = corrections.get(word, word)
-            fixed_words.append(fixed_word)
-        
-        return ' '.join(fixed_words)
+        corrections = self.NAME_CORRECTIONS
+        return ' '.join(corrections.get(word, word) for word in name.split())
     
-    def _extract_dob(self, text: str) -> Optional[str]:
+    def _extract_dob(self, text: str, dates: Optional[List[ParsedDate]] = None,
+                     current_year: Optional[int] = None) -> Optional[str]:
         """Tìm ngày sinh (dd/mm/yyyy) - flexible"""
-        # Tìm tất cả dates
-        dates = re.findall(r'\b(\d{2}/\d{2}/\d{4})\b', text)
-        
-        current_year = datetime.now().year
+        if dates is None:
+            dates = self._find_dates(text)
+        if current_year is None:
+            current_year = datetime.now().year
         
-        for date in dates:
-            try:
-                day, month, year = map(int, date.split('/'))
-                
-                # Validate date hợp lệ
-                if not (1 <= day <= 31 and 1 <= month <= 12):
-                    continue
-                
-                # Ngày sinh: từ 1900 đến năm hiện tại
-                if 1900 <= year <= current_year:
-                    return date
-            except:
+        for date, day, month, year in dates:
+            # Validate date hợp lệ
+            if not (1 <= day <= 31 and 1 <= month <= 12):
                 continue
+            
+            # Ngày sinh: từ 1900 đến năm hiện tại
+            if 1900 <= year <= current_year:
+                return date
         
         return None
     
     def _extract_gender(self, text: str) -> Optional[str]:
         """Tìm giới tính - improved with context"""
         # Ưu tiên tìm theo context trước
-        patterns = [
-            r'(?:Giới\s*tính|Sex)[:\s]+(Nữ|Nam|Female|Male)',  # Có context
-            r'\b(Nữ|Nam|Female|Male)\b'  # Fallback
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in self._RE_GENDER:
+            match = pattern.search(text)
             if match:
                 gender = match.group(1)
                 # Normalize
@@ -179,46 +289,40 @@ class FieldParser:
         
         return None
     
+    @staticmethod
+    def _normalize_nationality(nationality: str) -> str:
+        return nationality.replace('Viêt', 'Việt').replace('VIT', 'Việt').replace('Viet', 'Việt')
+    
     def _extract_nationality(self, text: str) -> Optional[str]:
         """Tìm quốc tịch - improved"""
-        patterns = [
-            r'Nationality[:\s]+([^\n]+)',
-            r'(?:Quốc\s*tịch|tich)[:\s]+([^\n]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in self._RE_NATIONALITY:
+            match = pattern.search(text)
             if match:
                 line = match.group(1).strip()
                 
                 # Split bởi các keyword không liên quan
-                parts = re.split(r'\s+(?:Giới|Quê|Place|of\s+origin)', line, flags=re.IGNORECASE)
+                parts = self._RE_NATIONALITY_STOP.split(line)
                 nationality = parts[0].strip()
                 
                 # Normalize
-                nationality = nationality.replace('Viêt', 'Việt').replace('VIT', 'Việt').replace('Viet', 'Việt')
+                nationality = self._normalize_nationality(nationality)
                 
                 # Validate: chỉ chữ cái và space, 2-20 ký tự
-                if re.match(r'^[A-Za-zÀ-ỹ\s]{2,20}$', nationality):
+                if self._RE_NATIONALITY_VALID.match(nationality):
                     return nationality
         
         return None
     
     def _extract_origin(self, text: str) -> Optional[str]:
         """Tìm quê quán"""
-        patterns = [
-            r'origin[:\s]+(.+?)(?:\s+(?:thuòng|thu[oò]ng|Noi|Place\s+of\s+residence|Có\s+giá)|$)',
-            r'Quê\s+quán[:\s/]+(.+?)(?:\s+Nơi|$)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in self._RE_ORIGIN:
+            match = pattern.search(text)
             if match:
                 origin = match.group(1).strip()
                 
                 # Remove junk
-                origin = re.sub(r'thu[oò]ng\s+', '', origin, flags=re.IGNORECASE)
-                origin = re.sub(r'\s+', ' ', origin).strip()
+                origin = self._RE_THUONG.sub('', origin)
+                origin = self._RE_SPACES.sub(' ', origin).strip()
                 
                 # Lấy tối đa 100 ký tự
                 if len(origin) > 100:
@@ -231,38 +335,20 @@ class FieldParser:
     
     def _extract_residence(self, text: str) -> Optional[str]:
         """Tìm nơi thường trú - fixed version"""
-        patterns = [
-            # Pattern 1: Tìm giữa "residence" và "Date of expiry" hoặc "Có giá"
-            r'residence[:\s]+(.+?)(?=\s*(?:Co|Có)\s+gia|Date\s+of\s+expiry|$)',
-            # Pattern 2: Tiếng Việt
-            r'Noi\s+thu[oò]ng\s+tr[uú][:\s/]+(.+?)(?=\s*(?:Co|Có)\s+gia|$)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+        for pattern in self._RE_RESIDENCE:
+            match = pattern.search(text)
             if match:
                 residence = match.group(1).strip()
                 
-                # Aggressive cleaning - remove junk text
-                junk_patterns = [
-                    r'Noi\s+trú[:/\s]+',
-                    r'Place\s+of\s+residence[:\s]+',
-                    r'thu[oò]ng\s+',
-                    r'\s*(?:Co|Có)\s+gia.*$',  # Remove "Co gia tri den..."
-                    r'\s*Date\s+of.*$',        # Remove "Date of expiry..."
-                    r'\s+Place\s+\d+.*$',      # Remove "Place 6"
-                    r'\s+Place$',
-                ]
-                
-                for jp in junk_patterns:
-                    residence = re.sub(jp, '', residence, flags=re.IGNORECASE)
+                for junk in self._RE_RESIDENCE_JUNK:
+                    residence = junk.sub('', residence)
                 
                 # Clean spaces and slashes
-                residence = re.sub(r'\s+', ' ', residence).strip()
+                residence = self._RE_SPACES.sub(' ', residence).strip()
                 residence = residence.rstrip('/')
                 
                 # Validate: phải có ít nhất 1 chữ cái
-                if residence and re.search(r'[A-Za-zÀ-ỹ]', residence):
+                if residence and self._RE_HAS_LETTER.search(residence):
                     # Lấy tối đa 100 ký tự
                     if len(residence) > 100:
                         residence = residence[:100] + '...'
@@ -270,42 +356,33 @@ class FieldParser:
         
         return None
     
-    def _extract_expiry(self, text: str) -> Optional[str]:
+    def _extract_expiry(self, text: str, dates: Optional[List[ParsedDate]] = None,
+                        current_year: Optional[int] = None) -> Optional[str]:
         """Tìm ngày hết hạn - flexible"""
-        patterns = [
-            r'(?:Có\s+giá\s+trị\s+đến|Co\s+gia\s+tri\s+den|giá\s+trj\s+dên)[:\s]+(\d{2}/\d{2}/\d{4})',
-            r'(?:Date\s+of\s+)?expiry[:\s]+(\d{2}/\d{2}/\d{4})'
-        ]
-        
-        current_year = datetime.now().year
+        if current_year is None:
+            current_year = datetime.now().year
         
         # Thử tìm theo pattern trước
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in self._RE_EXPIRY:
+            match = pattern.search(text)
             if match:
                 date = match.group(1)
-                try:
-                    year = int(date.split('/')[-1])
-                    # Ngày hết hạn: từ năm hiện tại đến +30 năm
-                    if current_year <= year <= current_year + 30:
-                        return date
-                except:
-                    continue
+                year = int(date[-4:])
+                # Ngày hết hạn: từ năm hiện tại đến +30 năm
+                if current_year <= year <= current_year + 30:
+                    return date
         
         # Fallback: tìm date bất kỳ có năm > hiện tại
-        dates = re.findall(r'\b(\d{2}/\d{2}/\d{4})\b', text)
-        for date in dates:
-            try:
-                day, month, year = map(int, date.split('/'))
-                
-                # Validate date
-                if not (1 <= day <= 31 and 1 <= month <= 12):
-                    continue
-                
-                # Năm hết hạn phải > năm hiện tại
-                if current_year < year <= current_year + 30:
-                    return date
-            except:
+        if dates is None:
+            dates = self._find_dates(text)
+        
+        for date, day, month, year in dates:
+            # Validate date
+            if not (1 <= day <= 31 and 1 <= month <= 12):
                 continue
+            
+            # Năm hết hạn phải > năm hiện tại
+            if current_year < year <= current_year + 30:
+                return date
         
-        return None
\ No newline at end of file
+        return None
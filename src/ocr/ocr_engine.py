@@ -1,120 +1,207 @@
-from paddleocr import PaddleOCR
+import logging
+import time
 import numpy as np
 import cv2
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Union, Tuple, Callable
+from src.ocr.backends import OCRBackend, PaddleBackend
+from src.ocr.batching import RecognitionBatcher
+from src.preprocessing.image_processing import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class OCRResult:
+    """
+    Kết quả OCR của một ảnh - model chỉ chạy một lần,
+    các dạng text (full text, text theo dòng) được tính lại từ blocks
+    """
+
+    def __init__(self, blocks: List[Dict[str, Any]], timings: Optional[Dict[str, float]] = None):
+        self.blocks = blocks
+        # Thời gian (ms) các bước OCR: 'ocr' tổng, 'ocr_det'/'ocr_rec' khi chạy batched
+        self.timings = timings or {}
+        self._full_text: Optional[str] = None
+        self._line_text: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __bool__(self) -> bool:
+        return bool(self.blocks)
+
+    @property
+    def full_text(self) -> str:
+        """Text của các block nối theo thứ tự PaddleOCR trả về"""
+        if self._full_text is None:
+            self._full_text = '\n'.join([b['text'] for b in self.blocks if b.get('text')])
+        return self._full_text
+
+    @property
+    def line_text(self) -> str:
+        """Text sắp xếp theo dòng (trên xuống dưới, trái sang phải)"""
+        if self._line_text is None:
+            self._line_text = '\n'.join(' '.join(b['text'] for b in line) for line in self.lines())
+        return self._line_text
+
+    def lines(self) -> List[List[Dict[str, Any]]]:
+        """Gom các block có tâm gần nhau theo trục y thành một dòng"""
+        items = []
+        for block in self.blocks:
+            if not block.get('text'):
+                continue
+            pts = np.asarray(block['bbox'], dtype=np.float32).reshape(-1, 2)
+            y_min, y_max = float(pts[:, 1].min()), float(pts[:, 1].max())
+            items.append(((y_min + y_max) / 2, y_max - y_min, float(pts[:, 0].min()), block))
+
+        if not items:
+            return []
+
+        items.sort(key=lambda x: x[0])
+        # Ngưỡng gom dòng: nửa chiều cao trung vị của các block
+        tolerance = max(float(np.median([h for _, h, _, _ in items])) / 2, 1.0)
+
+        lines = []
+        current = [items[0]]
+        for item in items[1:]:
+            if item[0] - current[-1][0] <= tolerance:
+                current.append(item)
+            else:
+                lines.append(current)
+                current = [item]
+        lines.append(current)
+
+        return [[b for _, _, _, b in sorted(line, key=lambda x: x[2])] for line in lines]
+
 
 class OCREngine:
-    def __init__(self, lang: str = 'vi', use_gpu: bool = False):
-        self.ocr = PaddleOCR(
-            use_angle_cls=True,
-            lang=lang,
-            # det_db_thresh=0.3,      # ← Thêm: ngưỡng detection thấp hơn
-            # det_db_box_thresh=0.5,   # ← Thêm: confidence box cao hơn
-            # rec_batch_num=6,         # ← Thêm: batch size
-            # use_space_char=True      # ← Quan trọng cho tiếng Việt
-            # use_gpu=use_gpu,
-            # show_log=False
-        )
-        print(f"✅ Khởi tạo OCR (lang={lang})")
+    def __init__(self, lang: str = 'vi', use_gpu: bool = False,
+                 batcher: Optional[RecognitionBatcher] = None, det_model: Optional[str] = None,
+                 use_angle_cls: bool = True, backend: Optional[OCRBackend] = None):
+        """
+        Args:
+            lang: Ngôn ngữ OCR
+            use_gpu: Dùng GPU
+            batcher: Nếu có, engine chỉ chạy detection, recognition được gửi
+                     qua batcher để gom batch với các request khác
+            det_model: Tên model detection dùng trong chế độ batching
+            use_angle_cls: Chạy classifier hướng dòng text (tắt được khi ảnh đã rectify)
+            backend: Backend OCR (None = PaddleBackend), xem src/ocr/backends.py
+        """
+        self.batcher = batcher
+        self.backend = None
+        self.text_detector = None
+
+        if batcher is not None:
+            from paddleocr import TextDetection
+            self.text_detector = TextDetection(model_name=det_model) if det_model else TextDetection()
+            # Classifier hướng dòng text không có ở chế độ batching
+            self.use_angle_cls = False
+            logger.info("Khởi tạo OCR (lang=%s, batched recognition)", lang)
+            return
+
+        self.backend = backend if backend is not None else PaddleBackend(lang=lang, use_angle_cls=use_angle_cls)
+        self.use_angle_cls = self.backend.supports_angle_cls
+        logger.info("Khởi tạo OCR (backend=%s, lang=%s, angle_cls=%s)", self.backend.name, lang, self.use_angle_cls)
     
-    def extract_text(self, image: np.ndarray) -> List[Dict[str, Any]]:
+    def extract_text(self, image: np.ndarray, timings: Optional[Dict[str, float]] = None,
+                     angle_cls: bool = True) -> List[Dict[str, Any]]:
         """
         Trích xuất text từ ảnh
+        Args:
+            timings: Nếu có, ghi thời gian (ms) các bước det/rec tách được vào đây
+            angle_cls: False = bỏ classifier hướng dòng text cho ảnh này (ảnh đã biết nằm thẳng)
         Returns: List of detected text with coordinates
         """
         try:
             if isinstance(image, str):
                 image = cv2.imread(image)
             
-            print(f"📐 Kích thước ảnh: {image.shape}")
-            
-            # Gọi OCR
-            results = self.ocr.ocr(image)
-            
-            extracted_data = []
-            
-            print(f"🔍 Type of results: {type(results)}")
+            logger.debug("Kích thước ảnh: %s", image.shape)
             
-            if not results:
-                print("⚠️  OCR trả về None")
-                return extracted_data
-            
-            # Check structure
-            print(f"🔍 Length of results: {len(results)}")
-            print(f"🔍 Type of results[0]: {type(results[0])}")
-            
-            # Parse dựa trên type
-            page_result = results[0]
-            
-            # Nếu là dict → Lấy key chứa text results
-            if isinstance(page_result, dict):
-                print(f"🔍 Dict keys: {list(page_result.keys())}")
-                
-                # Thử các key thường gặp
-                if 'rec_texts' in page_result:
-                    texts = page_result['rec_texts']
-                    scores = page_result.get('rec_scores', [1.0] * len(texts))
-                    polys = page_result.get('rec_polys', [[[0,0],[1,0],[1,1],[0,1]]] * len(texts))
-                    
-                    for text, score, poly in zip(texts, scores, polys):
-                        if text and text.strip():
-                            extracted_data.append({
-                                'bbox': poly,
-                                'text': text.strip(),
-                                'confidence': float(score)
-                            })
-                            print(f"   ✓ '{text}' (conf: {score:.2f})")
-                else:
-                    print("⚠️  Không tìm thấy 'rec_texts' trong dict")
-                    print(f"⚠️  Available keys: {list(page_result.keys())}")
-                    
-            # Nếu là list → Parse như bình thường
-            elif isinstance(page_result, list):
-                print(f"🔍 Số lượng lines: {len(page_result)}")
-                
-                if len(page_result) > 0:
-                    print(f"🔍 Line đầu tiên: {page_result[0]}")
-                
-                for idx, line in enumerate(page_result):
-                    try:
-                        if not isinstance(line, (list, tuple)) or len(line) < 2:
-                            continue
-                        
-                        bbox = line[0]
-                        text_info = line[1]
-                        
-                        if isinstance(text_info, (list, tuple)) and len(text_info) >= 2:
-                            text = str(text_info[0]).strip()
-                            confidence = float(text_info[1])
-                        else:
-                            continue
-                        
-                        if text:
-                            extracted_data.append({
-                                'bbox': bbox,
-                                'text': text,
-                                'confidence': confidence
-                            })
-                            print(f"   ✓ [{idx}] '{text}' (conf: {confidence:.2f})")
-                    
-                    except Exception as e:
-                        print(f"⚠️  Bỏ qua line {idx}: {e}")
-                        continue
-            else:
-                print(f"⚠️  Unknown type: {type(page_result)}")
+            if self.batcher is not None:
+                return self._extract_text_batched(image, timings)
             
-            print(f"✅ OCR phát hiện {len(extracted_data)} text blocks")
+            extracted_data = [line.as_block() for line in self.backend.predict(image, angle_cls)]
+            logger.debug("OCR phát hiện %d text blocks", len(extracted_data))
             return extracted_data
             
         except Exception as e:
-            print(f"❌ Lỗi OCR: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Lỗi OCR: %s", e)
             return []
     
-    def get_full_text(self, image: np.ndarray) -> str:
-        """Lấy toàn bộ text từ ảnh"""
-        results = self.extract_text(image)
-        if not results:
-            return ""
-        return '\n'.join([r['text'] for r in results if r.get('text')])
\ No newline at end of file
+    def _extract_text_batched(self, image: np.ndarray,
+                              timings: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+        """Detection trên ảnh này, recognition gom batch qua self.batcher"""
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        det_results = list(self.text_detector.predict(input=image))
+        timings['ocr_det'] = (time.perf_counter() - start) * 1000
+        if not det_results:
+            return []
+        
+        polys = []
+        crops = []
+        for poly in det_results[0]['dt_polys']:
+            poly = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+            if len(poly) != 4:
+                continue
+            crop = ImageProcessor.perspective_transform(image, poly)
+            if crop.size == 0:
+                continue
+            polys.append(poly.astype(np.int32))
+            crops.append(crop)
+        
+        start = time.perf_counter()
+        recognized = self.batcher.recognize(crops)
+        # Gồm cả thời gian chờ gom batch
+        timings['ocr_rec'] = (time.perf_counter() - start) * 1000
+        
+        extracted_data = []
+        for poly, (text, score) in zip(polys, recognized):
+            if text and text.strip():
+                extracted_data.append({
+                    'bbox': poly,
+                    'text': text.strip(),
+                    'confidence': float(score)
+                })
+        
+        logger.debug("OCR phát hiện %d text blocks (batched)", len(extracted_data))
+        return extracted_data
+    
+    def run(self, image: np.ndarray, angle_cls: bool = True) -> OCRResult:
+        """Chạy OCR một lần, trả về OCRResult (blocks + full text + text theo dòng)"""
+        timings: Dict[str, float] = {}
+        start = time.perf_counter()
+        blocks = self.extract_text(image, timings, angle_cls)
+        timings['ocr'] = (time.perf_counter() - start) * 1000
+        return OCRResult(blocks, timings)
+
+    def get_full_text(self, image: Optional[np.ndarray] = None,
+                      ocr_results: Optional[Union[OCRResult, List[Dict[str, Any]]]] = None) -> str:
+        """
+        Lấy toàn bộ text từ ảnh
+        Nếu đã có ocr_results (OCRResult hoặc list blocks) thì không chạy lại OCR
+        """
+        if ocr_results is None:
+            if image is None:
+                raise ValueError("Cần truyền image hoặc ocr_results")
+            ocr_results = self.extract_text(image)
+        if not isinstance(ocr_results, OCRResult):
+            ocr_results = OCRResult(ocr_results)
+        return ocr_results.full_text
+
+
+def build_paddle_recognizer(model_name: Optional[str] = None,
+                            batch_size: int = 32) -> Callable[[List[np.ndarray]], List[Tuple[str, float]]]:
+    """Hàm recognition theo batch dùng PaddleOCR TextRecognition - dùng cho RecognitionBatcher"""
+    from paddleocr import TextRecognition
+    model = TextRecognition(model_name=model_name) if model_name else TextRecognition()
+    
+    def recognize(crops: List[np.ndarray]) -> List[Tuple[str, float]]:
+        outputs = model.predict(input=crops, batch_size=batch_size)
+        return [(str(r['rec_text']), float(r['rec_score'])) for r in outputs]
+    
+    return recognize
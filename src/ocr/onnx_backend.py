@@ -0,0 +1,302 @@
+# src/ocr/onnx_backend.py
+"""
+Backend OCR chạy model PP-OCR (det + cls + rec) đã export sang ONNX bằng ONNX Runtime CPU
+
+Không cần paddlepaddle lúc serving - chỉ onnxruntime + opencv. Tiền/hậu xử lý
+theo PP-OCR: DB post-processing cho detection, CTC greedy decode cho recognition.
+Export model:
+    paddle2onnx --model_dir <inference_model_dir> --model_filename inference.pdmodel \\
+                --params_filename inference.pdiparams --save_file det.onnx
+"""
+import logging
+import math
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from src.ocr.backends import OCRLine
+from src.preprocessing.image_processing import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+# Thư mục gốc để resolve đường dẫn model tương đối trong config
+ROOT = Path(__file__).resolve().parent.parent.parent
+
+
+def _session_options(intra_op_threads: int, inter_op_threads: int, allow_spinning: bool):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # 0 = để onnxruntime tự chọn theo số core
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads > 0:
+        options.inter_op_num_threads = inter_op_threads
+    # Nhiều worker chung CPU: thread rảnh không spin chiếm core của worker khác
+    options.add_session_config_entry('session.intra_op.allow_spinning', '1' if allow_spinning else '0')
+    return options
+
+
+class OnnxBackend:
+    """PP-OCR det/cls/rec trên ONNX Runtime (CPUExecutionProvider)"""
+
+    name = 'onnx'
+
+    # Chuẩn hoá ảnh detection (ImageNet, áp trên ảnh BGR như PaddleOCR)
+    DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+    DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+    CLS_SHAPE = (48, 192)  # (h, w)
+
+    def __init__(self, det_model: str, rec_model: str, rec_dict: str,
+                 cls_model: Optional[str] = None, use_angle_cls: bool = True,
+                 intra_op_threads: int = 0, inter_op_threads: int = 1, allow_spinning: bool = False,
+                 det_limit_side: int = 960, det_thresh: float = 0.3, box_thresh: float = 0.6,
+                 unclip_ratio: float = 1.5, max_candidates: int = 1000,
+                 rec_image_height: int = 48, rec_batch_size: int = 8, drop_score: float = 0.5,
+                 cls_thresh: float = 0.9, use_space_char: bool = True):
+        """
+        Args:
+            det_model, rec_model, cls_model: File .onnx (cls_model None = không có classifier)
+            rec_dict: File từ điển ký tự của model rec (mỗi dòng một ký tự)
+            intra_op_threads: Số thread trong một operator (0 = mặc định của onnxruntime)
+            inter_op_threads: Số thread chạy song song các operator
+            allow_spinning: Cho thread chờ spin (giảm latency, tốn CPU khi nhiều worker)
+            det_limit_side: Cạnh dài tối đa của ảnh đưa vào detection
+            det_thresh, box_thresh, unclip_ratio: Tham số DB post-processing
+            rec_image_height: Chiều cao ảnh dòng text đưa vào rec
+            drop_score: Bỏ dòng có confidence thấp hơn
+        """
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Backend onnx cần onnxruntime: pip install onnxruntime") from e
+
+        paths = {'det_model': det_model, 'rec_model': rec_model, 'rec_dict': rec_dict}
+        if use_angle_cls and cls_model:
+            paths['cls_model'] = cls_model
+        for key, path in paths.items():
+            if not path or not Path(path).exists():
+                raise FileNotFoundError(f"❌ Không tìm thấy {key} cho backend onnx: {path}")
+
+        self._paths = {key: str(path) for key, path in paths.items()}
+        self._threads = (intra_op_threads, inter_op_threads, allow_spinning)
+        self.det = self.rec = self.cls = None
+        self._load_sessions()
+        self.supports_angle_cls = self.cls is not None
+
+        # Index 0 là blank của CTC
+        with open(rec_dict, 'r', encoding='utf-8') as f:
+            self.characters = [''] + [line.rstrip('\r\n') for line in f]
+        if use_space_char:
+            self.characters.append(' ')
+
+        self.det_limit_side = det_limit_side
+        self.det_thresh = det_thresh
+        self.box_thresh = box_thresh
+        self.unclip_ratio = unclip_ratio
+        self.max_candidates = max_candidates
+        self.rec_image_height = rec_image_height
+        self.rec_batch_size = max(1, rec_batch_size)
+        self.drop_score = drop_score
+        self.cls_thresh = cls_thresh
+        logger.info("Khởi tạo ONNX OCR (threads=%d/%d, angle_cls=%s)",
+                    intra_op_threads, inter_op_threads, self.supports_angle_cls)
+
+    def _load_sessions(self):
+        import onnxruntime as ort
+        options = _session_options(*self._threads)
+        providers = ['CPUExecutionProvider']
+        self.det = ort.InferenceSession(self._paths['det_model'], sess_options=options, providers=providers)
+        self.rec = ort.InferenceSession(self._paths['rec_model'], sess_options=options, providers=providers)
+        if 'cls_model' in self._paths:
+            self.cls = ort.InferenceSession(self._paths['cls_model'], sess_options=options, providers=providers)
+
+    def after_fork(self):
+        """
+        Session 1 thread (intra_op_threads = 1, ORT_SEQUENTIAL) không có thread pool riêng nên
+        dùng tiếp được sau fork: weights của process cha chia sẻ copy-on-write giữa các worker.
+        Session nhiều thread mất thread pool khi fork - phải tạo lại trong worker (mỗi worker
+        một bản weights). Session cũ được giữ lại, không giải phóng: destructor của nó chờ
+        join các thread không còn tồn tại trong worker và treo process
+        """
+        if self._threads[0] != 1:
+            logger.info("onnx intra_op_threads=%d: tạo lại session sau fork, weights không dùng chung",
+                        self._threads[0])
+            self._inherited_sessions = (self.det, self.rec, self.cls)
+            self._load_sessions()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], use_angle_cls: bool = True) -> "OnnxBackend":
+        """Tạo backend từ section `ocr.onnx` trong config.yaml"""
+        config = config or {}
+
+        def path(key: str) -> Optional[str]:
+            value = config.get(key)
+            if not value:
+                return None
+            return str(value if Path(value).is_absolute() else ROOT / value)
+
+        return cls(
+            det_model=path('det_model'),
+            rec_model=path('rec_model'),
+            rec_dict=path('rec_dict'),
+            cls_model=path('cls_model'),
+            use_angle_cls=use_angle_cls,
+            intra_op_threads=int(config.get('intra_op_threads', 0)),
+            inter_op_threads=int(config.get('inter_op_threads', 1)),
+            allow_spinning=bool(config.get('allow_spinning', False)),
+            det_limit_side=int(config.get('det_limit_side', 960)),
+            det_thresh=float(config.get('det_thresh', 0.3)),
+            box_thresh=float(config.get('box_thresh', 0.6)),
+            unclip_ratio=float(config.get('unclip_ratio', 1.5)),
+            rec_image_height=int(config.get('rec_image_height', 48)),
+            rec_batch_size=int(config.get('rec_batch_size', 8)),
+            drop_score=float(config.get('drop_score', 0.5)),
+            cls_thresh=float(config.get('cls_thresh', 0.9)),
+            use_space_char=bool(config.get('use_space_char', True)),
+        )
+
+    def predict(self, image: np.ndarray, angle_cls: bool = True) -> List[OCRLine]:
+        boxes = self.detect(image)
+        if not boxes:
+            return []
+
+        crops = []
+        for box in boxes:
+            crop = ImageProcessor.perspective_transform(image, box)
+            # Dòng text dọc -> xoay về nằm ngang như PaddleOCR
+            if crop.shape[0] >= crop.shape[1] * 1.5:
+                crop = cv2.rotate(crop, cv2.ROTATE_90_COUNTERCLOCKWISE)
+            crops.append(crop)
+
+        if self.cls is not None and angle_cls:
+            crops = self.classify(crops)
+
+        lines = []
+        for box, (text, score) in zip(boxes, self.recognize(crops)):
+            if text.strip() and score >= self.drop_score:
+                lines.append(OCRLine(box.round().astype(np.int32), text.strip(), score))
+        return lines
+
+    # --- Detection (DB) ---
+
+    def detect(self, image: np.ndarray) -> List[np.ndarray]:
+        """Polygon (4, 2) float32 của các dòng text, sắp xếp trên xuống, trái sang phải"""
+        h, w = image.shape[:2]
+        scale = min(1.0, self.det_limit_side / max(h, w))
+        # Kích thước đầu vào là bội số của 32
+        rh = max(32, int(round(h * scale / 32)) * 32)
+        rw = max(32, int(round(w * scale / 32)) * 32)
+        resized = cv2.resize(image, (rw, rh), interpolation=cv2.INTER_LINEAR)
+        blob = ((resized.astype(np.float32) / 255 - self.DET_MEAN) / self.DET_STD).transpose(2, 0, 1)[None]
+
+        prob = self.det.run(None, {self.det.get_inputs()[0].name: blob})[0][0, 0]
+        mask = (prob > self.det_thresh).astype(np.uint8)
+        contours, _ = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        sx, sy = w / rw, h / rh
+        for contour in contours[:self.max_candidates]:
+            rect = cv2.minAreaRect(contour)
+            if min(rect[1]) < 3:
+                continue
+            if self._box_score(prob, cv2.boxPoints(rect)) < self.box_thresh:
+                continue
+            rect = self._unclip(rect)
+            if min(rect[1]) < 5:
+                continue
+            box = cv2.boxPoints(rect)
+            box[:, 0] = np.clip(box[:, 0] * sx, 0, w - 1)
+            box[:, 1] = np.clip(box[:, 1] * sy, 0, h - 1)
+            boxes.append(ImageProcessor.order_points(box))
+        return self._sort_boxes(boxes)
+
+    @staticmethod
+    def _box_score(prob: np.ndarray, box: np.ndarray) -> float:
+        """Xác suất trung bình trong box (chế độ 'fast' của PaddleOCR)"""
+        h, w = prob.shape
+        x0, x1 = int(np.clip(np.floor(box[:, 0].min()), 0, w - 1)), int(np.clip(np.ceil(box[:, 0].max()), 0, w - 1))
+        y0, y1 = int(np.clip(np.floor(box[:, 1].min()), 0, h - 1)), int(np.clip(np.ceil(box[:, 1].max()), 0, h - 1))
+        mask = np.zeros((y1 - y0 + 1, x1 - x0 + 1), dtype=np.uint8)
+        cv2.fillPoly(mask, [(box - [x0, y0]).astype(np.int32)], 1)
+        return float(cv2.mean(prob[y0:y1 + 1, x0:x1 + 1], mask)[0])
+
+    def _unclip(self, rect) -> Tuple:
+        """Nới box ra một khoảng area * ratio / perimeter (xấp xỉ offset polygon của DB)"""
+        (cx, cy), (bw, bh), angle = rect
+        distance = bw * bh * self.unclip_ratio / (2 * (bw + bh))
+        return (cx, cy), (bw + 2 * distance, bh + 2 * distance), angle
+
+    @staticmethod
+    def _sort_boxes(boxes: List[np.ndarray]) -> List[np.ndarray]:
+        """Trên xuống dưới; các box lệch nhau < 10 px theo y coi là cùng dòng, xếp trái sang phải"""
+        boxes = sorted(boxes, key=lambda b: (b[0][1], b[0][0]))
+        for i in range(len(boxes) - 1):
+            for j in range(i, -1, -1):
+                if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and boxes[j + 1][0][0] < boxes[j][0][0]:
+                    boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+                else:
+                    break
+        return boxes
+
+    # --- Classifier hướng dòng text ---
+
+    def classify(self, crops: List[np.ndarray]) -> List[np.ndarray]:
+        """Xoay 180 độ các crop bị classifier nhận là ngược"""
+        height, width = self.CLS_SHAPE
+        crops = list(crops)
+        name = self.cls.get_inputs()[0].name
+        for start in range(0, len(crops), self.rec_batch_size):
+            batch = crops[start:start + self.rec_batch_size]
+            blob = np.stack([self._normalize_line(crop, height, width, width) for crop in batch])
+            probs = self.cls.run(None, {name: blob})[0]
+            for offset, prob in enumerate(probs):
+                # label 1 = '180'
+                if int(np.argmax(prob)) == 1 and float(prob[1]) > self.cls_thresh:
+                    crops[start + offset] = cv2.rotate(crops[start + offset], cv2.ROTATE_180)
+        return crops
+
+    # --- Recognition (CTC) ---
+
+    def recognize(self, crops: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """(text, confidence) cho từng crop dòng text"""
+        height = self.rec_image_height
+        results: List[Tuple[str, float]] = [('', 0.0)] * len(crops)
+        # Gom crop có tỉ lệ gần nhau vào cùng batch để giảm padding
+        order = np.argsort([crop.shape[1] / max(crop.shape[0], 1) for crop in crops])
+        name = self.rec.get_inputs()[0].name
+        for start in range(0, len(order), self.rec_batch_size):
+            indices = order[start:start + self.rec_batch_size]
+            max_ratio = max(320 / 48, max(crops[i].shape[1] / max(crops[i].shape[0], 1) for i in indices))
+            width = int(math.ceil(height * max_ratio))
+            blob = np.stack([self._normalize_line(crops[i], height, width) for i in indices])
+            probs = self.rec.run(None, {name: blob})[0]
+            for i, decoded in zip(indices, self._ctc_decode(probs)):
+                results[i] = decoded
+        return results
+
+    @staticmethod
+    def _normalize_line(crop: np.ndarray, height: int, width: int,
+                        max_width: Optional[int] = None) -> np.ndarray:
+        """Resize giữ tỉ lệ về chiều cao height, pad phải tới width, chuẩn hoá về [-1, 1] (CHW)"""
+        h, w = crop.shape[:2]
+        resized_w = min(width, max_width or width, int(math.ceil(height * w / max(h, 1))))
+        resized = cv2.resize(crop, (max(1, resized_w), height), interpolation=cv2.INTER_LINEAR)
+        blob = np.zeros((3, height, width), dtype=np.float32)
+        blob[:, :, :resized.shape[1]] = (resized.astype(np.float32) / 255 - 0.5).transpose(2, 0, 1) / 0.5
+        return blob
+
+    def _ctc_decode(self, probs: np.ndarray) -> List[Tuple[str, float]]:
+        """Greedy CTC: gộp ký tự lặp liên tiếp, bỏ blank (index 0)"""
+        indices = probs.argmax(axis=2)
+        scores = probs.max(axis=2)
+        decoded = []
+        for seq, seq_scores in zip(indices, scores):
+            keep = seq != 0
+            keep[1:] &= seq[1:] != seq[:-1]
+            chars = [self.characters[i] for i in seq[keep] if i < len(self.characters)]
+            decoded.append((''.join(chars), float(seq_scores[keep].mean()) if keep.any() else 0.0))
+        return decoded
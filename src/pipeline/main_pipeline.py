@@ -1,43 +1,143 @@
 # src/pipeline/main_pipeline.py
+import logging
+import time
 import cv2
 import numpy as np
-from src.ocr.ocr_engine import OCREngine
+from typing import Any, Dict, Optional, Tuple
+from src.ocr.batching import get_shared_batcher
+from src.ocr.backends import backend_from_config
+from src.ocr.ocr_engine import OCREngine, build_paddle_recognizer
 from src.ocr.field_parser import FieldParser
+from src.preprocessing.decoding import decode_image
 from src.preprocessing.image_processing import ImageProcessor
+from src.preprocessing.quality import QualityGate
+from src.utils.timing import StageTimer
 
-def convert_numpy_to_native(obj):
-    """Recursively convert numpy types to Python native types"""
-    if isinstance(obj, dict):
-        return {k: convert_numpy_to_native(v) for k, v in obj.items()}
-    elif isinstance(obj, (list, tuple)):
-        return [convert_numpy_to_native(item) for item in obj]
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.bool_):
-        return bool(obj)
-    else:
-        return obj
+logger = logging.getLogger(__name__)
+
+NO_TEXT_MESSAGE = "Không phát hiện text trong ảnh"
+
+# Chế độ classifier hướng dòng text (config `ocr.angle_cls.mode` hoặc từng request)
+ANGLE_CLS_MODES = ('always', 'auto', 'never')
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chuẩn hoá kết quả thành công: polygon là mảng int32 (N, 2) liền bộ nhớ, confidence là float
+    Không chuyển mảng sang list lồng nhau - response được encode bằng orjson với
+    OPT_SERIALIZE_NUMPY (src/utils/serialization.py)
+    """
+    for block in result["ocr_results"]:
+        block["bbox"] = np.ascontiguousarray(block["bbox"], dtype=np.int32).reshape(-1, 2)
+        block["confidence"] = float(block["confidence"])
+    if "card_quad" in result:
+        result["card_quad"] = np.ascontiguousarray(result["card_quad"], dtype=np.int32)
+    return result
 
 class IDCardPipeline:
-    def __init__(self):
-        self.ocr_engine = OCREngine(lang='vi')
+    # Các vùng detector không chứa text cần OCR
+    SKIP_REGIONS = {'qr', 'finger_print'}
+    
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config: Nội dung configs/config.yaml (None = mặc định)
+        """
+        self.config = config or {}
+        ocr_config = self.config.get('ocr') or {}
+        lang = ocr_config.get('lang', 'vi')
+        
+        # Micro-batching recognition: batcher dùng chung giữa các pipeline trong process
+        batcher = None
+        batching = ocr_config.get('batching') or {}
+        if batching.get('enabled', False):
+            if ocr_config.get('backend', 'paddle') != 'paddle':
+                raise ValueError("ocr.batching chỉ hỗ trợ backend paddle")
+            batcher = get_shared_batcher(
+                lambda: build_paddle_recognizer(batching.get('rec_model'), int(batching.get('max_batch_size', 32))),
+                window_ms=float(batching.get('window_ms', 10)),
+                max_batch_size=int(batching.get('max_batch_size', 32))
+            )
+        
+        # Thời gian load model (giây) theo thành phần
+        self.load_timings: Dict[str, float] = {}
+        
+        # Thu nhỏ ảnh lớn (khi decode và trước OCR), toạ độ trả về vẫn theo ảnh gốc
+        preprocessing = self.config.get('preprocessing') or {}
+        self.downscale = dict(preprocessing.get('downscale') or {})
+        # Tìm thẻ và warp về kích thước chuẩn trước OCR
+        self.rectify = dict(preprocessing.get('rectify') or {})
+        # Enhance (CLAHE + lọc nhiễu) khi ảnh tương phản thấp hoặc nhiều nhiễu
+        self.enhance = dict(preprocessing.get('enhance') or {})
+        # Từ chối sớm ảnh không đọc được (None nếu tắt)
+        self.quality_gate = QualityGate.from_config(preprocessing.get('quality_gate'))
+        decode = preprocessing.get('decode') or {}
+        self.decode_min_long_side = int(decode.get('min_long_side', 1600)) if decode.get('reduced', False) else 0
+        
+        # Ảnh đã rectify luôn nằm ngang -> có thể bỏ classifier hướng dòng text
+        use_angle_cls = bool(ocr_config.get('use_angle_cls', True))
+        if self.rectify.get('enabled', False) and self.rectify.get('disable_angle_cls', False):
+            use_angle_cls = False
+        
+        # always / auto (bỏ classifier khi ảnh chắc chắn nằm thẳng) / never
+        self.angle_cls = dict(ocr_config.get('angle_cls') or {})
+        if self.angle_cls.get('mode', 'auto') not in ANGLE_CLS_MODES:
+            raise ValueError(f"ocr.angle_cls.mode không hợp lệ: {self.angle_cls['mode']}")
+        
+        start = time.perf_counter()
+        # Backend OCR theo `ocr.backend` (paddle / onnx); chế độ batching dùng TextDetection của Paddle
+        backend = backend_from_config(ocr_config, use_angle_cls) if batcher is None else None
+        self.ocr_engine = OCREngine(lang=lang, batcher=batcher, det_model=batching.get('det_model'),
+                                    use_angle_cls=use_angle_cls, backend=backend)
+        self.load_timings['ocr'] = time.perf_counter() - start
         self.field_parser = FieldParser()
+        
+        start = time.perf_counter()
+        self.detector = self._load_detector(self.config.get('detection') or {})
+        if self.detector is not None:
+            self.load_timings['detector'] = time.perf_counter() - start
     
-    def process(self, image_input):
+    def after_fork(self):
+        """Gọi trong worker sau khi fork từ process đã load model (inference mode prefork)"""
+        if self.ocr_engine.backend is not None:
+            self.ocr_engine.backend.after_fork()
+    
+    @staticmethod
+    def _load_detector(det_config: Dict[str, Any]):
+        """Load CCCDDetector nếu bật field detection, không có weights thì trả về None"""
+        if not det_config.get('use_field_detector', False):
+            return None
+        try:
+            from src.detection.detector import CCCDDetector
+            return CCCDDetector(
+                model_path=det_config.get('field_model'),
+                conf_threshold=float(det_config.get('conf_threshold', 0.5))
+            )
+        except (FileNotFoundError, ImportError) as e:
+            logger.warning("Không load được detector, dùng OCR toàn bộ ảnh: %s", e)
+            return None
+    
+    def process(self, image_input, original_size: Optional[Tuple[int, int]] = None,
+                angle_cls: Optional[str] = None, check_quality: bool = True):
         """
         Xử lý ảnh CCCD/Bằng lái
         Args:
             image_input: numpy array hoặc đường dẫn file
+            original_size: (w, h) ảnh gốc nếu image_input đã được thu nhỏ khi decode
+            angle_cls: Chế độ classifier hướng dòng text cho ảnh này (None = theo config)
+            check_quality: False = bỏ quality gate (warm-up phải chạy tới OCR)
+        Kết quả có block "timings": thời gian (ms) từng stage; toạ độ theo ảnh gốc
         """
+        timer = StageTimer()
         try:
             # Đọc ảnh nếu là đường dẫn
             if isinstance(image_input, str):
-                print(f"📂 Đọc ảnh từ: {image_input}")
-                image = cv2.imread(image_input)
+                logger.debug("Đọc ảnh từ: %s", image_input)
+                with timer.stage('read'):
+                    try:
+                        with open(image_input, 'rb') as f:
+                            image, original_size = decode_image(f.read(), self.decode_min_long_side)
+                    except OSError:
+                        image = None
                 if image is None:
                     raise ValueError(f"Không đọc được ảnh: {image_input}")
             elif isinstance(image_input, np.ndarray):
@@ -45,54 +145,297 @@ class IDCardPipeline:
             else:
                 raise ValueError(f"image_input không hợp lệ: {type(image_input)}")
             
-            print("⚠️  Skipping YOLOv8 detection (chưa train model)")
-            print("🔍 OCR toàn bộ ảnh...")
+            if angle_cls is not None and angle_cls not in ANGLE_CLS_MODES:
+                raise ValueError(f"angle_cls không hợp lệ: {angle_cls} (chọn {', '.join(ANGLE_CLS_MODES)})")
             
-            # OCR - Truyền numpy array
-          
-           
-            # OCR - Truyền numpy array
-            ocr_results = self.ocr_engine.extract_text(image)
-            full_text = self.ocr_engine.get_full_text(image)
+            original_size = original_size or (image.shape[1], image.shape[0])
+            # Ma trận đưa toạ độ ảnh decode về ảnh gốc
+            to_original = np.diag([original_size[0] / image.shape[1], original_size[1] / image.shape[0], 1.0])
             
-            if not ocr_results:
-                return {
+            card_quad, card_image, to_work = None, None, None
+            if self.rectify.get('enabled', False):
+                with timer.stage('localize'):
+                    card_quad = ImageProcessor.find_card_quad(
+                        image,
+                        work_size=int(self.rectify.get('work_size', 640)),
+                        min_area_ratio=float(self.rectify.get('min_area_ratio', 0.2)),
+                        aspect_tolerance=float(self.rectify.get('aspect_tolerance', 0.25))
+                    )
+                    if card_quad is not None:
+                        size = tuple(self.rectify.get('canonical_size', (1000, 630)))
+                        card_image, to_work = ImageProcessor.rectify_card(image, card_quad, size)
+            
+            # Loại sớm ảnh mờ/tối/loá/thẻ quá nhỏ trước khi tốn một lượt OCR
+            quality = None
+            if self.quality_gate is not None and check_quality:
+                with timer.stage('quality'):
+                    quality = self.quality_gate.assess(image, card=card_image, quad=card_quad)
+            
+            if quality is not None and not quality['passed']:
+                logger.info("Ảnh không đạt quality gate: %s", [r['code'] for r in quality['reasons']])
+                result = {
                     "success": False,
-                    "message": "Không phát hiện text trong ảnh",
+                    "message": "; ".join(r['message'] for r in quality['reasons']),
+                    "quality": quality,
                     "full_text": "",
                     "ocr_results": [],
                     "parsed_data": {}
                 }
+            else:
+                result = self._recognize(image, to_original, original_size, card_quad, card_image, to_work,
+                                         angle_cls or self.angle_cls.get('mode', 'auto'), timer)
+                if quality is not None:
+                    result["quality"] = quality
             
-            print(f"📄 Full text:\n{full_text}\n")
-            
-            # Parse thông tin
-            parsed_data = self.field_parser.parse(full_text, ocr_results)
-            
-            # Build result và convert toàn bộ numpy types
+        except Exception as e:
+            logger.exception("Lỗi pipeline: %s", e)
             result = {
-                "success": True,
-                "detection": {
-                    "bbox": [0, 0, int(image.shape[1]), int(image.shape[0])],
-                    "confidence": 1.0,
-                    "class_name": "full_image"
-                },
-                "full_text": full_text,
-                "ocr_results": ocr_results,
-                "parsed_data": parsed_data
+                "success": False,
+                "message": str(e),
+                "full_text": "",
+                "ocr_results": [],
+                "parsed_data": {}
             }
+        
+        result["timings"] = timer.as_dict()
+        if self.ocr_engine.batcher is not None:
+            # API tách ra để ghi histogram batch size / thời gian chờ của batcher
+            result["ocr_batches"] = self.ocr_engine.batcher.stats.drain()
+        return result
+    
+    def _recognize(self, image: np.ndarray, to_original: np.ndarray, original_size: Tuple[int, int],
+                   card_quad: Optional[np.ndarray], card_image: Optional[np.ndarray],
+                   to_work: Optional[np.ndarray], angle_cls: str, timer: StageTimer) -> Dict[str, Any]:
+        """
+        Downscale (nếu chưa rectify) -> enhance -> OCR -> đưa toạ độ về ảnh gốc
+        Args:
+            to_original: Ma trận toạ độ ảnh decode -> ảnh gốc
+            card_quad, card_image, to_work: 4 góc thẻ, ảnh thẻ đã rectify và ma trận ảnh decode -> ảnh thẻ
+                                            (None nếu không tìm thấy thẻ)
+            angle_cls: Chế độ classifier hướng dòng text (ANGLE_CLS_MODES)
+        """
+        if card_image is not None:
+            work_image = card_image
+        else:
+            with timer.stage('resize'):
+                work_image, _ = self._downscale(image)
+            to_work = np.diag([work_image.shape[1] / image.shape[1], work_image.shape[0] / image.shape[0], 1.0])
+        to_original = to_original @ np.linalg.inv(to_work)
+        
+        if self.enhance.get('enabled', False):
+            with timer.stage('enhance'):
+                enhanced = self._enhance(work_image)
+            if enhanced.shape[:2] != work_image.shape[:2]:
+                # enhance.max_side đã thu nhỏ ảnh - toạ độ OCR phải đưa về ảnh trước enhance
+                to_enhanced = np.diag([enhanced.shape[1] / work_image.shape[1],
+                                       enhanced.shape[0] / work_image.shape[0], 1.0])
+                to_original = to_original @ np.linalg.inv(to_enhanced)
+            work_image = enhanced
+        
+        run_cls = False
+        if self.ocr_engine.use_angle_cls:
+            with timer.stage('orientation'):
+                run_cls = self._use_angle_cls(work_image, card_quad, angle_cls)
+        
+        result = None
+        if self.detector is not None:
+            result = self._process_fields(work_image, timer, run_cls)
+        if result is None:
+            result = self._process_full_image(work_image, timer, run_cls)
+        if self.ocr_engine.use_angle_cls:
+            # API tách ra để đếm tỉ lệ bỏ classifier
+            result["angle_cls"] = "run" if run_cls else "skipped"
+        if result["success"]:
+            if card_image is not None:
+                self._restore_coordinates(result, to_original, original_size,
+                                          card_size=(work_image.shape[1], work_image.shape[0]))
+            elif not np.allclose(to_original, np.eye(3)):
+                self._restore_coordinates(result, to_original, original_size)
+            with timer.stage('serialize'):
+                result = compact_result(result)
+        return result
+    
+    def _downscale(self, image: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Thu nhỏ theo section `preprocessing.downscale` (tắt nếu không cấu hình)"""
+        if not self.downscale.get('enabled', False):
+            return image, 1.0
+        return ImageProcessor.downscale_for_ocr(
+            image,
+            min_long_side=int(self.downscale.get('min_long_side', 1000)),
+            max_long_side=int(self.downscale.get('max_long_side', 2560)),
+            target_text_height=float(self.downscale.get('target_text_height', 20))
+        )
+    
+    def _use_angle_cls(self, image: np.ndarray, card_quad: Optional[np.ndarray], mode: str) -> bool:
+        """
+        Có chạy classifier hướng dòng text cho ảnh này không
+        auto: bỏ khi ảnh nằm ngang và projection profile cho thấy dòng text nằm ngang.
+        Không phân biệt được ảnh xoay 180 độ - upload từ điện thoại hầu như đã xoay
+        theo EXIF, trường hợp hiếm này dùng mode always.
+        """
+        if mode != 'auto':
+            return mode == 'always'
+        # Thẻ dựng đứng được xoay 90 độ khi rectify - không biết xoay xuôi hay ngược
+        if card_quad is not None and ImageProcessor.quad_is_portrait(card_quad):
+            return True
+        h, w = image.shape[:2]
+        if h > w:
+            return True
+        ratio = ImageProcessor.text_line_ratio(image)
+        return ratio is None or ratio < float(self.angle_cls.get('min_line_ratio', 1.2))
+    
+    def _enhance(self, image: np.ndarray) -> np.ndarray:
+        """Enhance theo section `preprocessing.enhance`, chỉ khi điểm chất lượng cho thấy cần"""
+        scores = ImageProcessor.quality_score(image)
+        if not ImageProcessor.needs_enhancement(
+            scores,
+            min_contrast=float(self.enhance.get('min_contrast', 100)),
+            max_noise=float(self.enhance.get('max_noise', 4))
+        ):
+            return image
+        tier = self.enhance.get('tier', 'fast')
+        max_side = self.enhance.get('max_side')
+        logger.debug("Enhance (%s): %s", tier, scores)
+        enhanced = ImageProcessor.enhance_image(image, tier, max_side=int(max_side) if max_side else None)
+        return cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
+    
+    @staticmethod
+    def _map_points(points, matrix: np.ndarray) -> np.ndarray:
+        """Áp ma trận 3x3 (scale hoặc perspective) lên mảng điểm (..., 2)"""
+        pts = np.asarray(points, dtype=np.float32)
+        mapped = cv2.perspectiveTransform(pts.reshape(-1, 1, 2), matrix)
+        return mapped.reshape(pts.shape)
+    
+    @classmethod
+    def _restore_coordinates(cls, result: Dict[str, Any], to_original: np.ndarray,
+                             original_size: Tuple[int, int], card_size: Optional[Tuple[int, int]] = None):
+        """
+        Đưa bbox/polygon từ ảnh đã thu nhỏ/warp về toạ độ ảnh gốc (original_size = (w, h))
+        Ảnh đã rectify (card_size = kích thước ảnh thẻ): thêm "card_quad" (4 góc thẻ trên
+        ảnh gốc), detection toàn ảnh thành bbox của thẻ
+        """
+        for block in result["ocr_results"]:
+            block['bbox'] = np.rint(cls._map_points(block['bbox'], to_original)).astype(np.int32)
+        
+        detection = result["detection"]
+        if card_size is not None:
+            w, h = card_size
+            quad = cls._map_points([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], to_original)
+            result["card_quad"] = np.rint(quad).astype(np.int32)
+            if detection["class_name"] == "full_image":
+                detection["class_name"] = "card"
+        
+        if detection["class_name"] == "full_image":
+            detection["bbox"] = [0, 0, int(original_size[0]), int(original_size[1])]
+        else:
+            x1, y1, x2, y2 = detection["bbox"]
+            corners = cls._map_points([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], to_original)
+            detection["bbox"] = [int(round(float(corners[:, 0].min()))), int(round(float(corners[:, 1].min()))),
+                                 int(round(float(corners[:, 0].max()))), int(round(float(corners[:, 1].max())))]
+    
+    def _process_full_image(self, image: np.ndarray, timer: StageTimer,
+                            angle_cls: bool = True) -> Dict[str, Any]:
+        """OCR toàn bộ ảnh rồi regex-scan full text"""
+        logger.debug("OCR toàn bộ ảnh")
+        
+        # OCR - chạy model một lần, full text lấy lại từ kết quả
+        ocr_output = self.ocr_engine.run(image, angle_cls)
+        timer.merge(ocr_output.timings)
+        ocr_results = ocr_output.blocks
+        full_text = ocr_output.full_text
+        
+        if not ocr_results:
+            return {
+                "success": False,
+                "message": NO_TEXT_MESSAGE,
+                "full_text": "",
+                "ocr_results": [],
+                "parsed_data": {}
+            }
+        
+        logger.debug("Full text:\n%s", full_text)
+        
+        # Parse thông tin
+        with timer.stage('parse'):
+            parsed_data = self.field_parser.parse(full_text, ocr_results)
+        
+        return {
+            "success": True,
+            "detection": {
+                "bbox": [0, 0, int(image.shape[1]), int(image.shape[0])],
+                "confidence": 1.0,
+                "class_name": "full_image"
+            },
+            "full_text": full_text,
+            "ocr_results": ocr_results,
+            "parsed_data": parsed_data
+        }
+    
+    def _process_fields(self, image: np.ndarray, timer: StageTimer,
+                        angle_cls: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        OCR từng vùng field do detector crop, mỗi vùng map thẳng vào field output
+        Trả về None nếu detector không tìm thấy vùng nào (để fallback OCR toàn ảnh)
+        """
+        with timer.stage('detect'):
+            detections = [d for d in self.detector.detect(image) if d['class_name'] not in self.SKIP_REGIONS]
+        if not detections:
+            logger.debug("Detector không tìm thấy vùng nào, fallback OCR toàn bộ ảnh")
+            return None
+        
+        logger.debug("OCR %d vùng field", len(detections))
+        
+        # Đọc từ trên xuống: field nhiều dòng (vd. current_place) bị detect thành nhiều box sẽ nối đúng thứ tự
+        detections.sort(key=lambda d: (d['bbox'][1], d['bbox'][0]))
+        
+        region_lines: Dict[str, list] = {}
+        ocr_results = []
+        for det in detections:
+            x1, y1 = max(0, det['bbox'][0]), max(0, det['bbox'][1])
+            crop = self.detector.crop_bbox(image, det['bbox'])
+            if crop.size == 0:
+                continue
             
-            # Convert tất cả numpy types sang Python native types
-            return convert_numpy_to_native(result)
+            crop_result = self.ocr_engine.run(crop, angle_cls)
+            timer.merge(crop_result.timings)
+            if crop_result.line_text:
+                region_lines.setdefault(det['class_name'], []).append(crop_result.line_text)
             
-        except Exception as e:
-            print(f"❌ Lỗi pipeline: {e}")
-            import traceback
-            traceback.print_exc()
+            # Đưa bbox về toạ độ ảnh gốc
+            for block in crop_result.blocks:
+                ocr_results.append({
+                    **block,
+                    'bbox': np.asarray(block['bbox'], dtype=np.int32) + np.array([x1, y1], dtype=np.int32),
+                    'field': det['class_name']
+                })
+        
+        regions = {name: ' '.join(lines) for name, lines in region_lines.items()}
+        if not regions:
             return {
                 "success": False,
-                "message": str(e),
+                "message": NO_TEXT_MESSAGE,
                 "full_text": "",
                 "ocr_results": [],
                 "parsed_data": {}
-            }
\ No newline at end of file
+            }
+        
+        full_text = '\n'.join(regions.values())
+        logger.debug("Regions: %s", regions)
+        
+        with timer.stage('parse'):
+            parsed_data = self.field_parser.parse_regions(regions)
+        
+        boxes = np.array([d['bbox'] for d in detections])
+        return {
+            "success": True,
+            "detection": {
+                "bbox": [int(boxes[:, 0].min()), int(boxes[:, 1].min()),
+                         int(boxes[:, 2].max()), int(boxes[:, 3].max())],
+                "confidence": float(np.mean([d['confidence'] for d in detections])),
+                "class_name": "cccd_fields"
+            },
+            "regions": regions,
+            "full_text": full_text,
+            "ocr_results": ocr_results,
+            "parsed_data": parsed_data
+        }
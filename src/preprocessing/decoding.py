@@ -0,0 +1,158 @@
+# src/preprocessing/decoding.py
+"""
+Decode ảnh upload ở độ phân giải giảm
+
+Đọc kích thước + EXIF orientation từ header JPEG/PNG (không decode pixel), rồi
+chọn IMREAD_REDUCED_COLOR_2/4/8: libjpeg scale DCT khi decode nên ảnh 12 MP chỉ
+tốn thời gian và bộ nhớ của ảnh nhỏ. OpenCV tự xoay theo EXIF sau khi decode,
+trên buffer đã thu nhỏ, nên không cần thêm bước xoay ảnh full-size.
+"""
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Marker SOF chứa kích thước ảnh (trừ DHT 0xC4, JPG 0xC8, DAC 0xCC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class ImageHeader(NamedTuple):
+    format: str
+    width: int        # theo dữ liệu lưu trong file (chưa xoay EXIF)
+    height: int
+    orientation: int  # EXIF orientation (1 = không xoay)
+
+    @property
+    def display_size(self) -> Tuple[int, int]:
+        """(w, h) sau khi xoay theo EXIF - orientation 5-8 đổi chiều rộng/cao"""
+        if self.orientation in (5, 6, 7, 8):
+            return self.height, self.width
+        return self.width, self.height
+
+
+def _exif_orientation(segment: bytes) -> int:
+    """Orientation (tag 0x0112) trong IFD0 của segment APP1 Exif"""
+    if not segment.startswith(b'Exif\x00\x00'):
+        return 1
+    tiff = segment[6:]
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        return 1
+    try:
+        ifd_offset = struct.unpack_from(endian + 'I', tiff, 4)[0]
+        count = struct.unpack_from(endian + 'H', tiff, ifd_offset)[0]
+        for i in range(count):
+            entry = ifd_offset + 2 + i * 12
+            tag, _, _ = struct.unpack_from(endian + 'HHI', tiff, entry)
+            if tag == 0x0112:
+                value = struct.unpack_from(endian + 'H', tiff, entry + 8)[0]
+                return value if 1 <= value <= 8 else 1
+    except struct.error:
+        pass
+    return 1
+
+
+def _scan_jpeg(data: bytes) -> Tuple[Optional[ImageHeader], bool]:
+    """(header, truncated) - truncated = dữ liệu hết trước khi gặp SOF (cần đọc thêm)"""
+    orientation = 1
+    pos = 2
+    size = len(data)
+    while pos + 4 <= size:
+        if data[pos] != 0xFF:
+            return None, False
+        marker = data[pos + 1]
+        if marker == 0xFF:  # byte đệm
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack_from('>H', data, pos + 2)[0]
+        if marker == 0xE1:
+            if pos + 2 + length > size:
+                return None, True
+            orientation = _exif_orientation(data[pos + 4:pos + 2 + length])
+        elif marker in _JPEG_SOF:
+            if pos + 9 > size:
+                return None, True
+            height, width = struct.unpack_from('>HH', data, pos + 5)
+            return ImageHeader('jpeg', width, height, orientation), False
+        elif marker == 0xDA:  # bắt đầu dữ liệu ảnh mà chưa thấy SOF
+            return None, False
+        pos += 2 + length
+    return None, True
+
+
+def _scan_image(data: bytes) -> Tuple[Optional[ImageHeader], bool]:
+    if data[:3] == b'\xff\xd8\xff':
+        return _scan_jpeg(data)
+    if data[:8] == _PNG_SIGNATURE:
+        # IHDR luôn là chunk đầu tiên
+        if len(data) < 24:
+            return None, True
+        if data[12:16] != b'IHDR':
+            return None, False
+        width, height = struct.unpack_from('>II', data, 16)
+        return ImageHeader('png', width, height, 1), False
+    return None, False
+
+
+def probe_image(data: bytes) -> Optional[ImageHeader]:
+    """Đọc định dạng, kích thước và orientation từ header (JPEG, PNG); None nếu không nhận ra"""
+    return _scan_image(data)[0]
+
+
+def header_truncated(data: bytes) -> bool:
+    """True nếu data là JPEG/PNG bị cắt trước khi tới SOF/IHDR (vd. EXIF/ICC lớn) - cần đọc thêm"""
+    return _scan_image(data)[1]
+
+
+def is_probed_format(data: bytes) -> bool:
+    """True nếu data bắt đầu bằng signature JPEG/PNG (định dạng probe_image đọc được kích thước)"""
+    return data[:3] == b'\xff\xd8\xff' or data[:8] == _PNG_SIGNATURE
+
+
+def choose_reduction(header: Optional[ImageHeader], min_long_side: int) -> int:
+    """Hệ số giảm lớn nhất (1/2/4/8) mà cạnh dài sau decode vẫn >= min_long_side"""
+    # Chỉ JPEG được scale khi decode; định dạng khác OpenCV decode full rồi mới resize
+    if header is None or header.format != 'jpeg' or min_long_side <= 0:
+        return 1
+    long_side = max(header.width, header.height)
+    factor = 1
+    while factor < 8 and long_side // (factor * 2) >= min_long_side:
+        factor *= 2
+    return factor
+
+
+def decode_image(data: bytes, min_long_side: int = 0) -> Tuple[Optional[np.ndarray], Tuple[int, int]]:
+    """
+    Decode bytes ảnh (đã xoay theo EXIF), thu nhỏ khi decode nếu ảnh lớn
+
+    Args:
+        min_long_side: Cạnh dài tối thiểu của ảnh sau decode (0 = decode full-size)
+
+    Returns:
+        (ảnh BGR hoặc None nếu lỗi, (w, h) của ảnh gốc sau khi xoay EXIF)
+    """
+    header = probe_image(data)
+    factor = choose_reduction(header, min_long_side)
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_FLAGS[factor])
+    if image is None:
+        return None, (0, 0)
+    width, height = header.display_size if header is not None else (0, 0)
+    # Header không khớp ảnh decode được (file lạ) -> suy ra từ ảnh đã decode
+    if (-(-width // factor), -(-height // factor)) != (image.shape[1], image.shape[0]):
+        width, height = image.shape[1] * factor, image.shape[0] * factor
+    return image, (width, height)
@@ -1,21 +1,123 @@
+import threading
 import cv2
 import numpy as np
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
+
+_thread_local = threading.local()
+
+# Kernel ước lượng nhiễu (Immerkær 1996)
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
 
 class ImageProcessor:
+    # Tỉ lệ thẻ ID-1 (CCCD, bằng lái): 85.6 x 53.98 mm
+    CARD_ASPECT = 85.6 / 53.98
+    ENHANCE_TIERS = ('fast', 'balanced', 'quality')
+    
+    @staticmethod
+    def resize_image(image: np.ndarray, size: Tuple[int, int],
+                     interpolation: int = cv2.INTER_LINEAR) -> np.ndarray:
+        return cv2.resize(image, size, interpolation=interpolation)
+    
+    @staticmethod
+    def shrink(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+        """
+        Thu nhỏ về size (w, h): giảm 1/2 bằng INTER_AREA (nhanh, không răng cưa)
+        tới khi còn <= 2 lần rồi INTER_LINEAR - INTER_AREA với hệ số lẻ chậm hơn nhiều
+        """
+        w, h = size
+        while image.shape[1] >= w * 2 and image.shape[0] >= h * 2:
+            half = (image.shape[1] // 2, image.shape[0] // 2)
+            image = ImageProcessor.resize_image(image, half, interpolation=cv2.INTER_AREA)
+        if (image.shape[1], image.shape[0]) == (w, h):
+            return image
+        return ImageProcessor.resize_image(image, (w, h))
+    
+    @staticmethod
+    def estimate_text_height(image: np.ndarray, work_size: int = 640) -> Optional[float]:
+        """
+        Ước lượng chiều cao ký tự (px, theo ảnh gốc) từ các connected component
+        trên bản thu nhỏ; None nếu không đủ component giống ký tự
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        h, w = gray.shape[:2]
+        scale = min(1.0, work_size / max(h, w))
+        if scale < 1.0:
+            gray = ImageProcessor.shrink(gray, (max(1, int(w * scale)), max(1, int(h * scale))))
+        
+        # Chữ tối trên nền sáng -> threshold ngược, mỗi ký tự là một component
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY_INV, 15, 10)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        widths, heights = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]
+        small_h = gray.shape[0]
+        is_glyph = ((heights >= 3) & (heights <= small_h * 0.1)
+                    & (widths <= heights * 3) & (widths * 5 >= heights))
+        if int(is_glyph.sum()) < 20:
+            return None
+        return float(np.median(heights[is_glyph])) / scale
+    
     @staticmethod
-    def resize_image(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
-        return cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+    def choose_ocr_scale(image: np.ndarray, min_long_side: int = 1000, max_long_side: int = 2560,
+                         target_text_height: float = 20) -> float:
+        """
+        Hệ số thu nhỏ (<= 1) trước OCR: đưa chiều cao chữ về khoảng target_text_height,
+        cạnh dài không nhỏ hơn min_long_side và không lớn hơn max_long_side
+        """
+        long_side = max(image.shape[:2])
+        if long_side <= min_long_side:
+            return 1.0
+        
+        text_height = ImageProcessor.estimate_text_height(image)
+        scale = target_text_height / text_height if text_height else min_long_side / long_side
+        scale = max(scale, min_long_side / long_side)
+        return min(1.0, scale, max_long_side / long_side)
+    
+    @staticmethod
+    def downscale_for_ocr(image: np.ndarray, **kwargs) -> Tuple[np.ndarray, float]:
+        """
+        Thu nhỏ ảnh trước OCR (tham số như choose_ocr_scale)
+        Returns: (ảnh đã thu nhỏ, hệ số scale) - toạ độ gốc = toạ độ mới / scale
+        """
+        scale = ImageProcessor.choose_ocr_scale(image, **kwargs)
+        if scale >= 1.0:
+            return image, 1.0
+        h, w = image.shape[:2]
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return ImageProcessor.shrink(image, size), scale
     
     @staticmethod
-    def enhance_image(image: np.ndarray) -> np.ndarray:
-        """Cải thiện chất lượng ảnh"""
+    def enhance_image(image: np.ndarray, tier: str = 'quality',
+                      max_side: Optional[int] = None) -> np.ndarray:
+        """
+        Cải thiện chất lượng ảnh (trả về ảnh grayscale)
+        
+        Args:
+            tier: 'fast' (CLAHE + median, vài ms), 'balanced' (CLAHE + bilateral,
+                  vài chục ms) hoặc 'quality' (equalizeHist + NL-means, hàng trăm ms)
+            max_side: Thu nhỏ về cạnh dài này trước khi xử lý (None = giữ kích thước)
+        """
+        if tier not in ImageProcessor.ENHANCE_TIERS:
+            raise ValueError(f"tier không hợp lệ: {tier} (chọn {', '.join(ImageProcessor.ENHANCE_TIERS)})")
+        
         # Chuyển sang grayscale
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         else:
             gray = image
         
+        h, w = gray.shape[:2]
+        if max_side and max(h, w) > max_side:
+            scale = max_side / max(h, w)
+            gray = ImageProcessor.shrink(gray, (max(1, int(w * scale)), max(1, int(h * scale))))
+        
+        if tier == 'fast':
+            enhanced = ImageProcessor._clahe().apply(gray)
+            return cv2.medianBlur(enhanced, 3)
+        
+        if tier == 'balanced':
+            enhanced = ImageProcessor._clahe().apply(gray)
+            return cv2.bilateralFilter(enhanced, 9, 75, 75)
+        
         # Cân bằng histogram
         enhanced = cv2.equalizeHist(gray)
         
@@ -24,6 +126,52 @@ class ImageProcessor:
         
         return denoised
     
+    @staticmethod
+    def _clahe():
+        # CLAHE object không thread-safe -> mỗi thread một object
+        clahe = getattr(_thread_local, 'clahe', None)
+        if clahe is None:
+            clahe = _thread_local.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        return clahe
+    
+    @staticmethod
+    def quality_score(image: np.ndarray, work_size: int = 512) -> Dict[str, float]:
+        """
+        Chỉ số chất lượng nhanh (tính trên bản thu nhỏ cạnh dài work_size):
+            sharpness   phương sai Laplacian (thấp = mờ)
+            contrast    khoảng mức xám phân vị 1-99 (chữ tối trên nền sáng ~ 150-220)
+            brightness  mức xám trung bình
+            noise       sigma nhiễu ước lượng (Immerkær)
+            glare       tỉ lệ pixel gần bão hoà (>= 250) - vùng loá đèn/flash
+            dark        tỉ lệ pixel gần đen (<= 10)
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        h, w = gray.shape[:2]
+        if max(h, w) > work_size:
+            scale = work_size / max(h, w)
+            gray = ImageProcessor.shrink(gray, (max(1, int(w * scale)), max(1, int(h * scale))))
+        
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+        total = max(hist.sum(), 1)
+        cdf = np.cumsum(hist) / total
+        low, high = int(np.searchsorted(cdf, 0.01)), int(np.searchsorted(cdf, 0.99))
+        laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+        residual = cv2.filter2D(gray.astype(np.float32), -1, _NOISE_KERNEL)[1:-1, 1:-1]
+        return {
+            'sharpness': float(laplacian.var()),
+            'contrast': float(high - low),
+            'brightness': float(np.dot(hist, np.arange(256)) / total),
+            'noise': float(np.abs(residual).mean() * np.sqrt(np.pi / 2) / 6),
+            'glare': float(hist[250:].sum() / total),
+            'dark': float(hist[:11].sum() / total),
+        }
+    
+    @staticmethod
+    def needs_enhancement(scores: Dict[str, float], min_contrast: float = 100,
+                          max_noise: float = 4) -> bool:
+        """Ảnh tương phản thấp hoặc nhiều nhiễu mới cần enhance"""
+        return scores['contrast'] < min_contrast or scores['noise'] > max_noise
+    
     @staticmethod
     def detect_edges(image: np.ndarray) -> np.ndarray:
         """Phát hiện cạnh"""
@@ -70,4 +218,93 @@ class ImageProcessor:
         
         return warped
     
-    
\ No newline at end of file
+
+    @staticmethod
+    def find_card_quad(image: np.ndarray, work_size: int = 640, min_area_ratio: float = 0.2,
+                       aspect_tolerance: float = 0.25) -> Optional[np.ndarray]:
+        """
+        Tìm 4 góc thẻ trên bản thu nhỏ (cạnh dài work_size)
+        
+        Args:
+            min_area_ratio: Diện tích thẻ tối thiểu so với ảnh
+            aspect_tolerance: Sai lệch tương đối cho phép so với tỉ lệ ID-1
+        Returns: 4 điểm (float32) theo toạ độ ảnh gốc, None nếu không thấy thẻ
+        """
+        h, w = image.shape[:2]
+        scale = min(1.0, work_size / max(h, w))
+        small = image
+        if scale < 1.0:
+            small = ImageProcessor.shrink(image, (max(1, int(w * scale)), max(1, int(h * scale))))
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if len(small.shape) == 3 else small
+        
+        # Nối các đoạn cạnh bị đứt trước khi tìm contour
+        edges = cv2.dilate(ImageProcessor.detect_edges(gray), np.ones((3, 3), np.uint8))
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = min_area_ratio * gray.shape[0] * gray.shape[1]
+        
+        for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+            area = cv2.contourArea(contour)
+            if area < min_area:
+                break
+            approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+            if len(approx) == 4 and cv2.isContourConvex(approx):
+                quad = approx.reshape(4, 2).astype(np.float32)
+            else:
+                # Góc bo tròn / cạnh dính nền: dùng hình chữ nhật bao nhỏ nhất nếu contour đủ "vuông"
+                rect = cv2.minAreaRect(contour)
+                if area < 0.85 * rect[1][0] * rect[1][1]:
+                    continue
+                quad = cv2.boxPoints(rect).astype(np.float32)
+            
+            tl, tr, br, bl = ImageProcessor.order_points(quad)
+            width = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+            height = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+            aspect = max(width, height) / max(min(width, height), 1.0)
+            if abs(aspect - ImageProcessor.CARD_ASPECT) / ImageProcessor.CARD_ASPECT <= aspect_tolerance:
+                return quad / scale
+        return None
+    
+    @staticmethod
+    def quad_is_portrait(pts: np.ndarray) -> bool:
+        """4 góc thẻ dựng đứng (cạnh trái dài hơn cạnh trên)"""
+        (tl, tr, br, bl) = ImageProcessor.order_points(np.asarray(pts, dtype=np.float32))
+        return bool(np.linalg.norm(bl - tl) > np.linalg.norm(tr - tl))
+    
+    @staticmethod
+    def text_line_ratio(image: np.ndarray, work_size: int = 320) -> Optional[float]:
+        """
+        Tỉ lệ độ biến thiên projection profile theo hàng / theo cột trên bản thu nhỏ
+        nhị phân: dòng text nằm ngang -> profile theo hàng xen kẽ dòng chữ/khoảng
+        trắng nên tỉ lệ > 1, dòng text dọc (ảnh xoay 90 độ) -> tỉ lệ < 1.
+        None nếu ảnh gần như không có chữ.
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        h, w = gray.shape[:2]
+        scale = min(1.0, work_size / max(h, w))
+        if scale < 1.0:
+            gray = ImageProcessor.shrink(gray, (max(1, int(w * scale)), max(1, int(h * scale))))
+        
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                       cv2.THRESH_BINARY_INV, 15, 10).astype(np.float32) / 255
+        if binary.mean() < 0.005:
+            return None
+        rows = np.diff(binary.mean(axis=1))
+        cols = np.diff(binary.mean(axis=0))
+        return float(np.mean(rows ** 2) / max(float(np.mean(cols ** 2)), 1e-9))
+    
+    @staticmethod
+    def rectify_card(image: np.ndarray, pts: np.ndarray,
+                     size: Tuple[int, int] = (1000, 630)) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Warp thẻ về kích thước chuẩn size (w, h), luôn nằm ngang
+        Returns: (ảnh thẻ, ma trận perspective 3x3 từ ảnh gốc sang ảnh thẻ)
+        """
+        rect = ImageProcessor.order_points(pts)
+        # Thẻ dựng đứng trong ảnh -> lấy cạnh trái làm cạnh trên (xoay 90 độ)
+        if ImageProcessor.quad_is_portrait(rect):
+            rect = np.roll(rect, 1, axis=0)
+        
+        w, h = size
+        dst = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+        M = cv2.getPerspectiveTransform(rect, dst)
+        return cv2.warpPerspective(image, M, (w, h), flags=cv2.INTER_LINEAR), M
@@ -0,0 +1,113 @@
+# src/preprocessing/quality.py
+"""
+Quality gate trước OCR
+
+Loại sớm ảnh mờ, tối, loá hoặc thẻ quá nhỏ (vài ms trên bản thu nhỏ) thay vì
+chạy hết một lượt OCR rồi trả về field rác. Mỗi lý do từ chối có mã, giá trị
+đo được, ngưỡng và hướng dẫn chụp lại cho người dùng.
+"""
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from src.preprocessing.image_processing import ImageProcessor
+
+
+class QualityGate:
+    """Đánh giá chất lượng ảnh theo các ngưỡng trong section `preprocessing.quality_gate`"""
+
+    # mã lý do -> hướng dẫn cho người dùng
+    MESSAGES = {
+        'blurry': "Ảnh bị mờ, hãy giữ máy chắc tay và lấy nét vào thẻ",
+        'too_dark': "Ảnh quá tối, hãy chụp ở nơi đủ sáng",
+        'overexposed': "Ảnh bị cháy sáng, hãy giảm độ sáng hoặc tránh nguồn sáng trực tiếp",
+        'glare': "Thẻ bị loá, hãy nghiêng thẻ hoặc tắt flash để tránh phản chiếu",
+        'card_too_small': "Thẻ quá nhỏ trong ảnh, hãy chụp gần hơn để thẻ chiếm phần lớn khung hình",
+    }
+
+    def __init__(self, min_sharpness: float = 60, min_brightness: float = 50,
+                 max_brightness: float = 240, max_glare: float = 0.03,
+                 min_card_area_ratio: float = 0.25, work_size: int = 512):
+        """
+        Args:
+            min_sharpness: Phương sai Laplacian tối thiểu (trên bản thu nhỏ work_size)
+            min_brightness: Mức xám trung bình tối thiểu
+            max_brightness: Mức xám trung bình tối đa
+            max_glare: Tỉ lệ pixel bão hoà (>= 250) tối đa
+            min_card_area_ratio: Diện tích thẻ / diện tích ảnh tối thiểu (0 = bỏ kiểm tra)
+            work_size: Cạnh dài bản thu nhỏ dùng để tính chỉ số
+        """
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_glare = max_glare
+        self.min_card_area_ratio = min_card_area_ratio
+        self.work_size = work_size
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["QualityGate"]:
+        """Tạo gate từ section `preprocessing.quality_gate` (None nếu tắt)"""
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        return cls(
+            min_sharpness=float(config.get('min_sharpness', 60)),
+            min_brightness=float(config.get('min_brightness', 50)),
+            max_brightness=float(config.get('max_brightness', 240)),
+            max_glare=float(config.get('max_glare', 0.03)),
+            min_card_area_ratio=float(config.get('min_card_area_ratio', 0.25)),
+            work_size=int(config.get('work_size', 512)),
+        )
+
+    @staticmethod
+    def _card_area_ratio(image: np.ndarray, quad: Optional[np.ndarray]) -> Optional[float]:
+        """
+        Diện tích thẻ / diện tích ảnh theo 4 góc thẻ bước localize đã tìm (viền ngoài thẻ)
+        None nếu không có - không tự tìm lại với ngưỡng thấp hơn: contour nhỏ tìm được khi đó
+        thường là hình chữ nhật bên trong thẻ (ảnh chân dung), còn ảnh không thấy viền thẻ
+        phần lớn là thẻ chiếm gần hết khung hình hoặc bản scan sát mép
+        """
+        if quad is None:
+            return None
+        return float(cv2.contourArea(np.asarray(quad, dtype=np.float32)) / (image.shape[0] * image.shape[1]))
+
+    def assess(self, image: np.ndarray, card: Optional[np.ndarray] = None,
+               quad: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Args:
+            image: Ảnh đầu vào (toàn khung hình)
+            card: Ảnh thẻ đã rectify (nếu có) - độ nét/độ sáng/loá đo trên thẻ thay vì cả khung
+            quad: 4 góc thẻ trên `image` (nếu đã tìm ở bước localize)
+
+        Không có thẻ (card/quad None) thì bỏ kiểm tra cháy sáng, loá và card_too_small: nền
+        trắng của bản scan nằm trong khung hình nhưng không phải vùng sáng/loá trên thẻ
+
+        Returns:
+            {'passed': bool, 'reasons': [{'code', 'message', 'value', 'threshold'}], 'metrics': {...}}
+        """
+        scores = ImageProcessor.quality_score(card if card is not None else image, self.work_size)
+        metrics = {name: round(value, 4) for name, value in scores.items()}
+
+        reasons: List[Dict[str, Any]] = []
+
+        def reject(code: str, value: float, threshold: float):
+            reasons.append({'code': code, 'message': self.MESSAGES[code],
+                            'value': round(value, 4), 'threshold': threshold})
+
+        if scores['sharpness'] < self.min_sharpness:
+            reject('blurry', scores['sharpness'], self.min_sharpness)
+        if scores['brightness'] < self.min_brightness:
+            reject('too_dark', scores['brightness'], self.min_brightness)
+        elif card is not None and scores['brightness'] > self.max_brightness:
+            reject('overexposed', scores['brightness'], self.max_brightness)
+        if card is not None and scores['glare'] > self.max_glare:
+            reject('glare', scores['glare'], self.max_glare)
+
+        if self.min_card_area_ratio > 0:
+            ratio = self._card_area_ratio(image, quad)
+            metrics['card_area_ratio'] = round(ratio, 4) if ratio is not None else None
+            if ratio is not None and ratio < self.min_card_area_ratio:
+                reject('card_too_small', ratio, self.min_card_area_ratio)
+
+        return {'passed': not reasons, 'reasons': reasons, 'metrics': metrics}
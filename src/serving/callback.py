@@ -0,0 +1,144 @@
+# src/serving/callback.py
+"""
+Gửi callback của job (POST kết quả tới callback_url do client cung cấp)
+
+callback_url do client chọn nên server không được thành proxy tới mạng nội bộ (SSRF):
+    - callback_allowed_hosts rỗng = tắt callback
+    - Host ghi đích danh (tên, IP hoặc CIDR) được gọi tới mọi địa chỉ nó resolve ra
+    - "*" = mọi host khác, nhưng chỉ khi địa chỉ resolve ra là IP công khai
+      (chặn loopback, private, link-local như 169.254.169.254, ...)
+Địa chỉ được kiểm tra ngay trước mỗi lần gửi và kết nối thẳng tới IP đã kiểm tra
+(không resolve lại - chặn DNS rebinding); không đi theo redirect.
+"""
+import http.client
+import ipaddress
+import socket
+import ssl
+from typing import Iterable, List, Optional, Union
+from urllib.parse import urlparse
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class CallbackBlocked(ValueError):
+    """callback_url không được phép theo callback_allowed_hosts"""
+
+
+class CallbackPolicy:
+    """Danh sách host được phép làm callback (section `jobs.callback_allowed_hosts`)"""
+
+    def __init__(self, allowed_hosts: Optional[Iterable[str]] = None):
+        self.hosts = set()
+        self.networks: List[IPNetwork] = []
+        self.any_public = False
+        for entry in allowed_hosts or []:
+            entry = str(entry).strip().lower()
+            if entry == '*':
+                self.any_public = True
+                continue
+            try:
+                self.networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                self.hosts.add(entry)
+
+    @property
+    def enabled(self) -> bool:
+        return self.any_public or bool(self.hosts) or bool(self.networks)
+
+    def _listed_ip(self, ip) -> bool:
+        return any(ip in network for network in self.networks)
+
+    def _allowed_ip(self, ip) -> bool:
+        return self._listed_ip(ip) or (self.any_public and ip.is_global)
+
+    def check_url(self, url: str):
+        """
+        Kiểm tra lúc nhận job (chưa resolve DNS)
+
+        Raises:
+            CallbackBlocked: URL không hợp lệ, callback đang tắt hoặc host không được phép
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise CallbackBlocked("callback_url phải là URL http(s)")
+        if not self.enabled:
+            raise CallbackBlocked("Callback đang tắt (jobs.callback_allowed_hosts rỗng)")
+        host = parsed.hostname.lower()
+        if host in self.hosts:
+            return
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            if self.any_public:
+                return  # Kiểm tra địa chỉ sau khi resolve, lúc gửi
+            raise CallbackBlocked(f"Host callback không được phép: {parsed.hostname}")
+        if not self._allowed_ip(ip):
+            raise CallbackBlocked(f"Địa chỉ callback không được phép: {parsed.hostname}")
+
+    def resolve(self, host: str, port: int) -> str:
+        """
+        IP được phép kết nối tới cho host (resolve DNS)
+
+        Raises:
+            CallbackBlocked: Mọi địa chỉ của host đều không được phép (vd. IP nội bộ)
+            OSError: Không resolve được
+        """
+        listed = host.lower() in self.hosts
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+        for address in addresses:
+            ip = ipaddress.ip_address(address.split('%', 1)[0])
+            if listed or self._allowed_ip(ip):
+                return address
+        raise CallbackBlocked(f"Callback tới địa chỉ nội bộ bị chặn: {host} -> {', '.join(addresses)}")
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """Kết nối tới địa chỉ đã kiểm tra thay vì resolve lại host"""
+
+    def __init__(self, host: str, port: int, address: str, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self._address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self._address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """Như _PinnedHTTPConnection, chứng chỉ vẫn kiểm tra theo tên host (SNI)"""
+
+    def __init__(self, host: str, port: int, address: str, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self._address = address
+        self._tls = ssl.create_default_context()
+
+    def connect(self):
+        sock = socket.create_connection((self._address, self.port), self.timeout)
+        self.sock = self._tls.wrap_socket(sock, server_hostname=self.host)
+
+
+def post_json(policy: CallbackPolicy, url: str, body: bytes, timeout: float) -> int:
+    """
+    POST body JSON tới url, trả về status (2xx/3xx; redirect không được đi theo)
+
+    Raises:
+        CallbackBlocked: URL/địa chỉ không được phép (không nên thử lại)
+        OSError, http.client.HTTPException: Lỗi mạng hoặc server trả status >= 400
+    """
+    policy.check_url(url)
+    parsed = urlparse(url)
+    https = parsed.scheme == 'https'
+    port = parsed.port or (443 if https else 80)
+    address = policy.resolve(parsed.hostname, port)
+    connection_cls = _PinnedHTTPSConnection if https else _PinnedHTTPConnection
+    connection = connection_cls(parsed.hostname, port, address, timeout)
+    try:
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+        status = connection.getresponse().status
+    finally:
+        connection.close()
+    if status >= 400:
+        raise http.client.HTTPException(f"HTTP {status}")
+    return status
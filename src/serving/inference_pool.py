@@ -0,0 +1,342 @@
+# src/serving/inference_pool.py
+"""
+Pool worker chạy inference ngoài event loop của API
+
+Mỗi worker (thread hoặc process) giữ một IDCardPipeline/PaddleOCR riêng.
+Chế độ prefork: process cha load pipeline một lần rồi fork worker, weights
+được chia sẻ copy-on-write (xem src/serving/prefork.py).
+Số request đang chờ + đang chạy bị giới hạn, vượt quá thì báo QueueFullError
+để API trả 503 thay vì xếp hàng vô hạn.
+"""
+import asyncio
+import copy
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from src.serving import prefork
+from src.serving.shared_memory import FrameRef, ResultRef, SharedFrameRing, frame_view, store_result
+from src.utils.logger import request_id_var
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Pipeline đã load ở process cha (mode prefork), worker kế thừa qua fork
+_preloaded: Dict[str, Any] = {}
+
+
+class QueueFullError(RuntimeError):
+    """Hàng đợi inference đã đầy"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Hàng đợi inference đã đầy")
+        self.retry_after = retry_after
+
+
+def _init_worker(pipeline_config: Optional[Dict[str, Any]] = None):
+    """Tạo pipeline riêng cho worker hiện tại khi worker khởi động"""
+    from src.pipeline.main_pipeline import IDCardPipeline
+    _local.pipeline = IDCardPipeline(pipeline_config)
+
+
+def _init_prefork_worker(pipeline_config: Optional[Dict[str, Any]], threads: int,
+                         cpu_sets: Optional[List[Set[int]]], counter):
+    """Khởi tạo worker sau fork: ghim CPU, giới hạn thread, dùng lại pipeline của process cha"""
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    if cpu_sets:
+        prefork.pin_to_cpus(cpu_sets[index % len(cpu_sets)])
+    prefork.limit_threads(threads)
+
+    pipeline = _preloaded.get('pipeline')
+    if pipeline is None:
+        from src.pipeline.main_pipeline import IDCardPipeline
+        pipeline = IDCardPipeline(pipeline_config)
+    else:
+        pipeline.after_fork()
+    _local.pipeline = pipeline
+
+
+def _process(image: Union[np.ndarray, FrameRef], request_id: str = '-',
+             original_size: Optional[Tuple[int, int]] = None,
+             angle_cls: Optional[str] = None) -> Union[Dict[str, Any], ResultRef]:
+    # contextvars không tự truyền sang worker - gắn lại request id cho log
+    request_id_var.set(request_id)
+    frame = image if isinstance(image, FrameRef) else None
+    if frame is not None:
+        image = frame_view(frame)
+    result = _local.pipeline.process(image, original_size, angle_cls)
+    # Kết quả đầu tiên của mỗi worker mang theo thời gian load model (cho metrics)
+    if not getattr(_local, 'reported_load', False):
+        _local.reported_load = True
+        result['model_load'] = _local.pipeline.load_timings
+    if frame is not None:
+        return store_result(frame, result)
+    return result
+
+
+# Stage chỉ xuất hiện trong timings khi OCR thực sự chạy
+OCR_STAGES = ('ocr', 'ocr_det', 'ocr_rec')
+
+
+def _warm_up(image: Optional[np.ndarray], runs: int, barrier,
+             timeout: float) -> Tuple[Tuple[int, int], Optional[bool]]:
+    """
+    Chạy pipeline trên ảnh warm-up (bỏ quality gate), mỗi worker một lần
+    Chờ ở barrier đến khi mọi worker đều nhận một task - executor buộc phải tạo đủ worker
+    thay vì để một worker rảnh nhận hết
+
+    Returns:
+        (id worker, OCR đã chạy hay chưa - None nếu không có ảnh warm-up)
+    """
+    worker_id = (os.getpid(), threading.get_ident())
+    if not hasattr(_local, 'warm_ocr'):
+        ocr_ran = None
+        if image is not None:
+            for _ in range(max(1, runs)):
+                result = _local.pipeline.process(image, check_quality=False)
+            ocr_ran = any(stage in (result.get('timings') or {}) for stage in OCR_STAGES)
+        _local.warm_ocr = ocr_ran
+    try:
+        barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        logger.warning("Warm-up: hết %ss chờ các worker khác", timeout)
+    return worker_id, _local.warm_ocr
+
+
+class InferencePool:
+    """Pool worker có hàng đợi giới hạn"""
+
+    MODES = ('thread', 'process', 'prefork')
+
+    def __init__(self, mode: str = 'thread', workers: int = 2,
+                 queue_size: int = 8, retry_after: int = 2,
+                 pipeline_config: Optional[Dict[str, Any]] = None,
+                 prefork_config: Optional[Dict[str, Any]] = None,
+                 shared_memory_config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            mode: 'thread', 'process' hoặc 'prefork'
+            workers: Số worker, mỗi worker một pipeline riêng
+            queue_size: Số request tối đa được chờ khi mọi worker đều bận
+            retry_after: Giá trị header Retry-After (giây) khi hàng đợi đầy
+            pipeline_config: Config truyền cho IDCardPipeline của mỗi worker
+            prefork_config: Section `inference.prefork` (preload, threads_per_worker, cpu_affinity)
+            shared_memory_config: Section `inference.shared_memory` - truyền ảnh/kết quả giữa
+                                  process qua ring buffer shared memory (mode process/prefork)
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode không hợp lệ: {mode} (chọn {', '.join(self.MODES)})")
+        if workers < 1:
+            raise ValueError("workers phải >= 1")
+
+        ocr_config = (pipeline_config or {}).get('ocr') or {}
+        if mode != 'thread' and (ocr_config.get('batching') or {}).get('enabled', False):
+            # Batcher dùng chung theo process, mỗi worker process chỉ chạy một request mỗi lúc
+            logger.warning("ocr.batching chỉ gom batch giữa các request trong mode thread; mode %s "
+                           "chỉ gom các dòng của cùng một ảnh và tốn thêm window_ms mỗi request", mode)
+
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = max(0, queue_size)
+        self.retry_after = retry_after
+
+        # Slot = worker đang chạy + chỗ trong hàng đợi
+        self._capacity = workers + self.queue_size
+        self._slots = threading.BoundedSemaphore(self._capacity)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+        self._pipeline_config = pipeline_config
+        self._prefork_config = prefork_config or {}
+        self._shared_memory_config = shared_memory_config
+        self._ring = None
+        self._executor = None
+
+    def start(self):
+        """
+        Tạo ring shared memory và executor - gọi trong startup của API, không phải lúc import
+        Mode prefork load model ở process này rồi fork worker ngay (block tới khi xong)
+        """
+        if self._executor is not None:
+            return
+        # Mỗi request đã được nhận có sẵn một slot shared memory (thêm `workers` slot dự phòng
+        # cho khoảng giữa lúc worker xong và lúc API đọc xong kết quả); tạo trước khi fork
+        if self.mode != 'thread':
+            self._ring = SharedFrameRing.from_config(self._shared_memory_config, self._capacity + self.workers)
+
+        if self.mode == 'prefork':
+            self._executor = self._start_prefork(self._pipeline_config, self._prefork_config)
+        else:
+            executor_cls = ThreadPoolExecutor if self.mode == 'thread' else ProcessPoolExecutor
+            self._executor = executor_cls(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self._pipeline_config,)
+            )
+
+    def _start_prefork(self, pipeline_config: Optional[Dict[str, Any]],
+                       config: Dict[str, Any]) -> ProcessPoolExecutor:
+        """Load pipeline ở process này (nếu preload) rồi fork toàn bộ worker ngay"""
+        threads = max(1, int(config.get('threads_per_worker', 1)))
+        # Mỗi worker chỉ dùng `threads` thread: Paddle cpu_threads, onnxruntime intra-op, OpenMP/MKL
+        pipeline_config = copy.deepcopy(pipeline_config or {})
+        ocr_config = pipeline_config.setdefault('ocr', {})
+        ocr_config['cpu_threads'] = threads
+        ocr_config.setdefault('onnx', {})['intra_op_threads'] = threads
+        prefork.set_thread_env(threads)
+
+        preload = bool(config.get('preload', True))
+        if preload and (ocr_config.get('batching') or {}).get('enabled', False):
+            # Thread scheduler của batcher không sống sót qua fork
+            logger.warning("ocr.batching bật: prefork không preload, mỗi worker tự load model")
+            preload = False
+        if preload:
+            from src.pipeline.main_pipeline import IDCardPipeline
+            start = time.perf_counter()
+            _preloaded['pipeline'] = IDCardPipeline(pipeline_config)
+            logger.info("Prefork: load model ở process cha %.2fs", time.perf_counter() - start)
+
+        cpu_sets = prefork.cpu_sets(self.workers, threads) if config.get('cpu_affinity', False) else None
+        context = multiprocessing.get_context('fork')
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_prefork_worker,
+            initargs=(pipeline_config, threads, cpu_sets, context.Value('i', 0))
+        )
+        # Với context fork, executor fork đủ worker ở lần submit đầu - làm ngay khi process
+        # còn ít thread (startup, trước thread warm-up) thay vì giữa lúc đang phục vụ request
+        executor.submit(os.getpid).result()
+        logger.info("Prefork: %d worker x %d thread, cpu_affinity=%s", self.workers, threads, bool(cpu_sets))
+        return executor
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]],
+                    pipeline_config: Optional[Dict[str, Any]] = None) -> "InferencePool":
+        """Tạo pool từ section `inference:` trong config.yaml"""
+        config = config or {}
+        return cls(
+            mode=config.get('mode', 'thread'),
+            workers=int(config.get('workers', 2)),
+            queue_size=int(config.get('queue_size', 8)),
+            retry_after=int(config.get('retry_after', 2)),
+            pipeline_config=pipeline_config,
+            prefork_config=config.get('prefork'),
+            shared_memory_config=config.get('shared_memory'),
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Số request đang chạy hoặc đang chờ"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Số request đang chờ worker rảnh"""
+        return max(0, self._in_flight - self.workers)
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self, *_):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    async def submit(self, image: np.ndarray, original_size: Optional[Tuple[int, int]] = None,
+                     angle_cls: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Chạy pipeline.process(image) trên worker, không block event loop
+
+        Args:
+            original_size: (w, h) ảnh gốc nếu image đã được thu nhỏ khi decode
+            angle_cls: Chế độ classifier hướng dòng text cho request này (None = theo config)
+
+        Raises:
+            QueueFullError: Khi mọi worker bận và hàng đợi đã đầy
+        """
+        if self._executor is None:
+            raise RuntimeError("InferencePool chưa start()")
+        self._acquire()
+        frame = self._ring.put(image) if self._ring is not None else None
+        try:
+            future = self._executor.submit(_process, frame or image, request_id_var.get(),
+                                           original_size, angle_cls)
+        except BaseException:
+            if frame is not None:
+                self._ring.release(frame.slot)
+            self._release()
+            raise
+        if frame is None:
+            future.add_done_callback(self._release)
+            return await asyncio.wrap_future(future)
+
+        # Đọc kết quả và trả slot ngay khi worker xong (kể cả khi request đã bị huỷ)
+        shared: Dict[str, Any] = {}
+
+        def on_done(done):
+            try:
+                if not done.cancelled() and done.exception() is None and isinstance(done.result(), ResultRef):
+                    shared['result'] = self._ring.read_result(done.result())
+            finally:
+                self._ring.release(frame.slot)
+                self._release()
+
+        future.add_done_callback(on_done)
+        result = await asyncio.wrap_future(future)
+        return shared['result'] if isinstance(result, ResultRef) else result
+
+    def warm_up(self, image: Optional[np.ndarray] = None, runs: int = 1,
+                timeout: float = 600) -> Dict[str, Any]:
+        """
+        Khởi động mọi worker (load model) và chạy warm-up trên từng worker - gọi lúc startup
+
+        Gửi `workers` task cùng lúc, mỗi task chờ ở một barrier chung nên không worker nào
+        nhận được task thứ hai: executor (tạo worker theo nhu cầu) phải tạo đủ worker.
+
+        Args:
+            image: Ảnh chạy thử (None = chỉ load model)
+            runs: Số lần chạy thử trên mỗi worker
+            timeout: Giây tối đa chờ ở barrier (gồm thời gian load model của worker chậm nhất)
+
+        Returns:
+            {'workers': số worker đã warm, 'ocr_workers': số worker đã chạy OCR, 'seconds': tổng thời gian}
+        """
+        if self._executor is None:
+            raise RuntimeError("InferencePool chưa start()")
+        start = time.perf_counter()
+        manager = None
+        if self.mode == 'thread':
+            barrier = threading.Barrier(self.workers)
+        else:
+            # Barrier dùng chung giữa các process qua manager (chỉ sống trong lúc warm-up)
+            manager = multiprocessing.Manager()
+            barrier = manager.Barrier(self.workers)
+        try:
+            futures = [self._executor.submit(_warm_up, image, runs, barrier, timeout)
+                       for _ in range(self.workers)]
+            results = dict(future.result() for future in futures)
+        finally:
+            if manager is not None:
+                manager.shutdown()
+        return {'workers': len(results),
+                'ocr_workers': sum(1 for ran in results.values() if ran),
+                'seconds': time.perf_counter() - start}
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+        if self._ring is not None:
+            self._ring.close()
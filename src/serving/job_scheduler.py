@@ -0,0 +1,242 @@
+# src/serving/job_scheduler.py
+"""
+Scheduler cho job bất đồng bộ (POST /api/jobs)
+
+Job chờ trong hàng đợi theo mức ưu tiên (high > normal > low); trong cùng một mức,
+các client được phục vụ xoay vòng (round-robin) nên một client gửi hàng trăm ảnh
+không chặn job của client khác. `concurrency` coroutine lấy job ra và gọi `runner`
+(API truyền vào hàm chạy IDCardPipeline.process qua InferencePool). Job xong thì
+kết quả được ghi vào JobStore và POST tới callback_url (nếu có, theo chính sách
+chống SSRF trong src/serving/callback.py).
+
+Mọi lệnh gọi JobStore chạy trên một thread riêng (không trên event loop): với store
+sqlite mỗi lần đổi trạng thái là một commit WAL, và chạy tuần tự nên thứ tự update giữ nguyên.
+"""
+import asyncio
+import functools
+import http.client
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from src.serving.callback import CallbackBlocked, CallbackPolicy, post_json
+from src.serving.job_store import FAILED, RUNNING, SUCCEEDED, Job, JobStore, job_store_from_config
+from src.utils import serialization
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ('high', 'normal', 'low')
+
+# runner(job, payload) -> kết quả pipeline (dict); exception -> job failed
+Runner = Callable[[Job, Any], Awaitable[Dict[str, Any]]]
+
+
+class JobQueueFullError(RuntimeError):
+    """Số job (hoặc tổng dung lượng payload) đang chờ đã đạt max_queued / max_queued_bytes"""
+
+
+class JobScheduler:
+    """Hàng đợi ưu tiên + xoay vòng theo client, chạy job trên event loop của API"""
+
+    def __init__(self, store: JobStore, runner: Runner, concurrency: int = 2,
+                 max_queued: int = 200, max_queued_bytes: int = 512 * 1024 * 1024,
+                 result_ttl: float = 3600,
+                 callback_timeout: float = 5.0, callback_retries: int = 3,
+                 callback_allowed_hosts: Optional[List[str]] = None):
+        """
+        Args:
+            store: Nơi lưu trạng thái/kết quả job
+            runner: Coroutine chạy một job, trả về kết quả pipeline
+            concurrency: Số job chạy đồng thời (nên bằng số worker inference)
+            max_queued: Số job chờ tối đa, vượt quá thì submit báo JobQueueFullError
+            max_queued_bytes: Tổng dung lượng payload (bytes ảnh upload) của các job đang chờ -
+                              payload nằm trong bộ nhớ tới khi job chạy
+            result_ttl: Giây giữ job đã xong trong store
+            callback_timeout: Timeout (giây) mỗi lần POST callback
+            callback_retries: Số lần thử lại khi POST callback lỗi
+            callback_allowed_hosts: Host/IP/CIDR được phép làm callback; "*" = mọi host có IP
+                                    công khai; rỗng = tắt callback (xem CallbackPolicy)
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency phải >= 1")
+        self.store = store
+        self.runner = runner
+        self.concurrency = concurrency
+        self.max_queued = max(1, max_queued)
+        self.max_queued_bytes = max(1, max_queued_bytes)
+        self.result_ttl = result_ttl
+        self.callback_timeout = callback_timeout
+        self.callback_retries = max(0, callback_retries)
+        self.callback_policy = CallbackPolicy(callback_allowed_hosts)
+
+        # priority -> {client_id -> deque[(job, payload, nbytes)]}; thứ tự client trong OrderedDict là lượt phục vụ
+        self._queues: Dict[str, 'OrderedDict[str, Deque[Tuple[Job, Any, int]]]'] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._queued = 0
+        self._queued_bytes = 0
+        self._ready: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+        self._callbacks: Set[asyncio.Task] = set()
+        self._store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-store')
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], runner: Runner,
+                    default_concurrency: int = 2) -> Optional["JobScheduler"]:
+        """Tạo scheduler (và store) từ section `jobs:` (None nếu tắt)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(
+            job_store_from_config(config), runner,
+            concurrency=int(config.get('concurrency') or default_concurrency),
+            max_queued=int(config.get('max_queued', 200)),
+            max_queued_bytes=int(float(config.get('max_queued_mb', 512)) * 1024 * 1024),
+            result_ttl=float(config.get('result_ttl_seconds', 3600)),
+            callback_timeout=float(config.get('callback_timeout', 5)),
+            callback_retries=int(config.get('callback_retries', 3)),
+            callback_allowed_hosts=config.get('callback_allowed_hosts'),
+        )
+
+    @property
+    def queued(self) -> int:
+        """Số job đang chờ"""
+        return self._queued
+
+    def check_callback_url(self, url: str):
+        """Raises ValueError (CallbackBlocked) nếu callback_url không hợp lệ hoặc không được phép"""
+        self.callback_policy.check_url(url)
+
+    async def _store(self, method: Callable[..., Any], *args, **kwargs) -> Any:
+        """Gọi một method của store trên thread của store"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._store_executor, functools.partial(method, *args, **kwargs))
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self._store(self.store.get, job_id)
+
+    async def start(self):
+        """Gọi trong startup của API (cần event loop đang chạy)"""
+        stale = await self._store(self.store.fail_unfinished, "Server khởi động lại trước khi job chạy xong")
+        if stale:
+            logger.warning("Đánh dấu failed %d job dở dang từ lần chạy trước", stale)
+        self._ready = asyncio.Semaphore(0)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._purge_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._callbacks, return_exceptions=True)
+        self._tasks = []
+        await self._store(self.store.close)
+        self._store_executor.shutdown(wait=True)
+
+    async def submit(self, job: Job, payload: Any, nbytes: int = 0) -> Job:
+        """
+        Lưu job và đưa vào hàng đợi - trả về khi store đã ghi xong, không chờ job chạy
+
+        Args:
+            nbytes: Dung lượng payload giữ trong bộ nhớ (tính vào max_queued_bytes)
+
+        Raises:
+            JobQueueFullError: Khi đã có max_queued job hoặc max_queued_bytes payload đang chờ
+        """
+        if job.priority not in PRIORITIES:
+            raise ValueError(f"priority không hợp lệ: {job.priority} (chọn {', '.join(PRIORITIES)})")
+        if self._queued >= self.max_queued:
+            raise JobQueueFullError(f"Đã có {self._queued} job đang chờ")
+        if self._queued and self._queued_bytes + nbytes > self.max_queued_bytes:
+            raise JobQueueFullError(f"Các job đang chờ đã giữ {self._queued_bytes / 2 ** 20:.0f} MB")
+        # Giữ chỗ trước khi chờ store để các submit đồng thời không vượt giới hạn
+        self._queued += 1
+        self._queued_bytes += nbytes
+        try:
+            await self._store(self.store.create, job)
+        except BaseException:
+            self._queued -= 1
+            self._queued_bytes -= nbytes
+            raise
+        clients = self._queues[job.priority]
+        clients.setdefault(job.client_id, deque()).append((job, payload, nbytes))
+        self._ready.release()
+        return job
+
+    def _next(self) -> Tuple[Job, Any]:
+        """Job kế tiếp: mức ưu tiên cao nhất còn job, client đến lượt trong mức đó"""
+        for priority in PRIORITIES:
+            clients = self._queues[priority]
+            if not clients:
+                continue
+            client_id, jobs = next(iter(clients.items()))
+            job, payload, nbytes = jobs.popleft()
+            if jobs:
+                clients.move_to_end(client_id)
+            else:
+                del clients[client_id]
+            self._queued -= 1
+            self._queued_bytes -= nbytes
+            return job, payload
+        raise RuntimeError("Hàng đợi job rỗng")
+
+    async def _worker(self):
+        while True:
+            # Mỗi release() trong submit ứng với đúng một job trong hàng đợi
+            await self._ready.acquire()
+            job, payload = self._next()
+            await self._run(job, payload)
+
+    async def _run(self, job: Job, payload: Any):
+        await self._store(self.store.update, job.id, status=RUNNING, started_at=time.time())
+        try:
+            result = await self.runner(job, payload)
+            changes = {'status': SUCCEEDED, 'result': result}
+        except asyncio.CancelledError:
+            # Task đang bị huỷ - ghi trực tiếp (stop() đóng store ngay sau đó)
+            self.store.update(job.id, status=FAILED, error="Server dừng trước khi job chạy xong",
+                              finished_at=time.time())
+            raise
+        except ValueError as e:
+            # Lỗi dữ liệu đầu vào (vd. ảnh không decode được) - không cần traceback
+            logger.info("Job %s lỗi: %s", job.id, e)
+            changes = {'status': FAILED, 'error': str(e)}
+        except Exception as e:
+            logger.exception("Job %s lỗi: %s", job.id, e)
+            changes = {'status': FAILED, 'error': str(e)}
+        finished = await self._store(self.store.update, job.id, finished_at=time.time(), **changes)
+        if finished is not None and finished.callback_url:
+            task = asyncio.create_task(self._callback(finished))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+
+    async def _callback(self, job: Job):
+        """POST trạng thái job tới callback_url (chạy trong thread, thử lại với backoff)"""
+        body = serialization.dumps(job.to_dict())
+        error = None
+        for attempt in range(self.callback_retries + 1):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                status = await asyncio.to_thread(post_json, self.callback_policy, job.callback_url,
+                                                 body, self.callback_timeout)
+            except CallbackBlocked as e:
+                # Không thử lại: địa chỉ bị chặn theo callback_allowed_hosts
+                logger.warning("Callback job %s bị chặn: %s", job.id, e)
+                error = str(e)
+                break
+            except (OSError, http.client.HTTPException) as e:
+                error = str(e)
+                logger.warning("Callback job %s lần %d lỗi: %s", job.id, attempt + 1, error)
+                continue
+            await self._store(self.store.update, job.id, callback_status=f"delivered ({status})")
+            return
+        await self._store(self.store.update, job.id, callback_status=f"failed: {error}")
+
+    async def _purge_loop(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            removed = await self._store(self.store.purge, time.time() - self.result_ttl)
+            if removed:
+                logger.debug("Xoá %d job hết hạn", removed)
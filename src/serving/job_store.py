@@ -0,0 +1,194 @@
+# src/serving/job_store.py
+"""
+Lưu trạng thái job xử lý bất đồng bộ (POST /api/jobs)
+
+Store chỉ giữ metadata + kết quả; bytes ảnh của job đang chờ nằm trong hàng đợi
+của JobScheduler. Hai backend: MemoryJobStore (mặc định, mất khi restart) và
+SqliteJobStore (giữ kết quả qua restart, dùng chung được giữa các process).
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.utils import serialization
+
+# Trạng thái job
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED = (SUCCEEDED, FAILED)
+
+
+@dataclass
+class Job:
+    client_id: str
+    priority: str = 'normal'
+    callback_url: Optional[str] = None
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    callback_status: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class JobStore:
+    """Interface store - các method đều thread-safe"""
+
+    def create(self, job: Job) -> Job:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Job]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **changes) -> Optional[Job]:
+        raise NotImplementedError
+
+    def purge(self, older_than: float) -> int:
+        """Xoá job đã xong trước thời điểm older_than (epoch), trả về số job đã xoá"""
+        raise NotImplementedError
+
+    def fail_unfinished(self, error: str) -> int:
+        """Đánh dấu failed các job queued/running còn lại (vd. sau khi server restart)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Job) -> Job:
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return Job(**job.to_dict()) if job is not None else None
+
+    def update(self, job_id: str, **changes) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            for key, value in changes.items():
+                setattr(job, key, value)
+            return Job(**job.to_dict())
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.status in FINISHED and (job.finished_at or 0) < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def fail_unfinished(self, error: str) -> int:
+        count = 0
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status not in FINISHED:
+                    job.status, job.error, job.finished_at = FAILED, error, time.time()
+                    count += 1
+        return count
+
+
+class SqliteJobStore(JobStore):
+    """Một bảng `jobs`, cột result lưu JSON"""
+
+    _COLUMNS = [f.name for f in fields(Job)]
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, client_id TEXT, priority TEXT, callback_url TEXT, status TEXT, "
+            "created_at REAL, started_at REAL, finished_at REAL, result TEXT, error TEXT, "
+            "callback_status TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at)")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(key: str, value: Any) -> Any:
+        if key == 'result' and value is not None:
+            return serialization.dumps(value).decode('utf-8')
+        return value
+
+    def _row_to_job(self, row) -> Job:
+        data = dict(zip(self._COLUMNS, row))
+        if data['result'] is not None:
+            data['result'] = serialization.loads(data['result'])
+        return Job(**data)
+
+    def create(self, job: Job) -> Job:
+        data = job.to_dict()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                [self._encode(key, data[key]) for key in self._COLUMNS]
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def update(self, job_id: str, **changes) -> Optional[Job]:
+        unknown = set(changes) - set(self._COLUMNS)
+        if unknown:
+            raise ValueError(f"Cột không hợp lệ: {sorted(unknown)}")
+        if changes:
+            with self._lock:
+                self._conn.execute(
+                    f"UPDATE jobs SET {', '.join(f'{key} = ?' for key in changes)} WHERE id = ?",
+                    [self._encode(key, value) for key, value in changes.items()] + [job_id]
+                )
+        return self.get(job_id)
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (*FINISHED, older_than))
+        return cursor.rowcount
+
+    def fail_unfinished(self, error: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)",
+                (FAILED, error, time.time(), QUEUED, RUNNING))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def job_store_from_config(config: Optional[Dict[str, Any]]) -> JobStore:
+    """Store theo section `jobs:` (store: memory | sqlite)"""
+    config = config or {}
+    kind = config.get('store', 'memory')
+    if kind == 'memory':
+        return MemoryJobStore()
+    if kind == 'sqlite':
+        return SqliteJobStore(config.get('sqlite_path', './output/jobs.sqlite3'))
+    raise ValueError(f"jobs.store không hợp lệ: {kind} (chọn memory, sqlite)")
@@ -0,0 +1,70 @@
+# src/serving/prefork.py
+"""
+Tiện ích cho chế độ inference `prefork`
+
+Process cha load model một lần rồi fork N worker: các trang nhớ chứa weights
+(PaddleOCR, YOLO) được chia sẻ copy-on-write thay vì mỗi worker một bản. Mỗi
+worker được giới hạn số thread (OpenMP/MKL/OpenCV/torch) và có thể ghim vào
+một nhóm core riêng để N worker không tranh nhau CPU.
+"""
+import logging
+import os
+import sys
+from typing import List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Biến môi trường các thư viện đọc khi tạo thread pool (OpenMP, MKL, OpenBLAS...)
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'FLAGS_cpu_math_library_num_threads')
+
+
+def available_cpus() -> List[int]:
+    """Các core process hiện tại được phép chạy"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_sets(workers: int, threads_per_worker: int,
+             cpus: Optional[List[int]] = None) -> List[Set[int]]:
+    """
+    Chia core cho từng worker: worker i nhận threads_per_worker core liên tiếp
+    Ít core hơn workers * threads_per_worker thì các nhóm quay vòng (dùng chung core)
+    """
+    cpus = cpus if cpus is not None else available_cpus()
+    size = max(1, min(threads_per_worker, len(cpus)))
+    sets = []
+    for i in range(workers):
+        start = (i * size) % len(cpus)
+        sets.append({cpus[(start + j) % len(cpus)] for j in range(size)})
+    return sets
+
+
+def set_thread_env(threads: int):
+    """Đặt số thread cho các thư viện native - gọi trước khi thư viện tạo thread pool"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+def limit_threads(threads: int):
+    """Giới hạn thread của các thư viện đã import trong worker hiện tại"""
+    set_thread_env(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+    # Chỉ chỉnh torch nếu detector đã import (không kéo torch vào khi không dùng)
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def pin_to_cpus(cpus: Set[int]) -> bool:
+    """Ghim process hiện tại vào các core cho trước; False nếu hệ điều hành không hỗ trợ"""
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        logger.warning("Không ghim được CPU %s: %s", sorted(cpus), e)
+        return False
+    return True
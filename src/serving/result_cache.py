@@ -0,0 +1,179 @@
+# src/serving/result_cache.py
+"""
+Cache kết quả theo nội dung ảnh upload
+
+Key là SHA-256 của bytes upload; tuỳ chọn thêm perceptual hash (dHash) của ảnh
+đã decode để bắt các bản re-encode của cùng một ảnh (so khớp gần đúng theo
+khoảng cách Hamming). Tầng bộ nhớ là LRU có TTL, tầng đĩa (tuỳ chọn) lưu mỗi
+kết quả một file JSON.
+
+Cảnh báo: dHash chỉ so bố cục sáng/tối ở 16x16, hai thẻ khác người cùng mẫu, chụp
+cùng góc có thể lệch ít bit - get_similar khi đó trả kết quả (họ tên, số CCCD) của
+người khác. Chỉ bật perceptual_hash khi các ảnh trùng lặp chắc chắn là cùng một thẻ.
+Các method đọc/ghi đĩa và hash bytes ảnh - API gọi trong thread pool, không trên event loop.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from src.utils import serialization
+
+
+class ResultCache:
+    """Cache 2 tầng (memory LRU/TTL + disk) cho kết quả pipeline"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 disk_dir: Optional[str] = None, perceptual_hash: bool = False,
+                 max_hash_distance: int = 8):
+        """
+        Args:
+            max_entries: Số kết quả tối đa trong bộ nhớ
+            ttl_seconds: Thời gian sống của một kết quả (<= 0 = không hết hạn)
+            disk_dir: Thư mục tầng đĩa (None = chỉ dùng bộ nhớ)
+            perceptual_hash: Tra thêm theo dHash của ảnh đã decode
+            max_hash_distance: Số bit dHash khác nhau tối đa để coi là cùng ảnh
+        """
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_seconds
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.perceptual_hash = perceptual_hash
+        self.max_hash_distance = max_hash_distance
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._hash_bits: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'similar_hits': 0, 'misses': 0,
+                       'stores': 0, 'evictions': 0}
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["ResultCache"]:
+        """Tạo cache từ section `cache:` trong config.yaml (None nếu tắt)"""
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        return cls(
+            max_entries=int(config.get('max_entries', 1024)),
+            ttl_seconds=float(config.get('ttl_seconds', 3600)),
+            disk_dir=config.get('disk_dir'),
+            perceptual_hash=bool(config.get('perceptual_hash', False)),
+            max_hash_distance=int(config.get('max_hash_distance', 8)),
+        )
+
+    @staticmethod
+    def content_key(contents: bytes) -> str:
+        return 'sha256:' + hashlib.sha256(contents).hexdigest()
+
+    @staticmethod
+    def image_key(image: np.ndarray, hash_size: int = 16) -> str:
+        """dHash (hash_size^2 bit) - ổn định khi ảnh bị nén lại/đổi định dạng"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return 'dhash:' + np.packbits(bits).tobytes().hex()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _disk_path(self, key: str) -> Path:
+        kind, digest = key.split(':', 1)
+        return self.disk_dir / kind / digest[:2] / f"{digest}.json"
+
+    def get(self, key: str, record_miss: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            record_miss: False khi còn tra tiếp key khác (vd. dHash) cho cùng request
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if not self._expired(stored_at):
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return result
+                del self._memory[key]
+                self._hash_bits.pop(key, None)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    entry = serialization.loads(f.read())
+                if not self._expired(entry['stored_at']):
+                    self._put_memory(key, entry['stored_at'], entry['result'])
+                    with self._lock:
+                        self._stats['disk_hits'] += 1
+                    return entry['result']
+                path.unlink(missing_ok=True)
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if record_miss:
+            with self._lock:
+                self._stats['misses'] += 1
+        return None
+
+    def get_similar(self, image_key: str) -> Optional[Dict[str, Any]]:
+        """Tìm kết quả có dHash gần image_key nhất (trong bộ nhớ), trong ngưỡng max_hash_distance"""
+        exact = self.get(image_key, record_miss=False)
+        if exact is not None:
+            return exact
+
+        target = np.frombuffer(bytes.fromhex(image_key.split(':', 1)[1]), dtype=np.uint8)
+        with self._lock:
+            keys = [k for k, bits in self._hash_bits.items() if len(bits) == len(target)]
+            if keys:
+                stacked = np.stack([self._hash_bits[k] for k in keys])
+                distances = np.unpackbits(stacked ^ target, axis=1).sum(axis=1)
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_hash_distance:
+                    stored_at, result = self._memory[keys[best]]
+                    if not self._expired(stored_at):
+                        self._memory.move_to_end(keys[best])
+                        self._stats['similar_hits'] += 1
+                        return result
+            self._stats['misses'] += 1
+        return None
+
+    def _put_memory(self, key: str, stored_at: float, result: Dict[str, Any]):
+        with self._lock:
+            self._memory[key] = (stored_at, result)
+            self._memory.move_to_end(key)
+            if key.startswith('dhash:'):
+                self._hash_bits[key] = np.frombuffer(bytes.fromhex(key.split(':', 1)[1]), dtype=np.uint8)
+            while len(self._memory) > self.max_entries:
+                evicted, _ = self._memory.popitem(last=False)
+                self._hash_bits.pop(evicted, None)
+                self._stats['evictions'] += 1
+
+    def put(self, key: str, result: Dict[str, Any]):
+        stored_at = time.time()
+        self._put_memory(key, stored_at, result)
+        with self._lock:
+            self._stats['stores'] += 1
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(serialization.dumps({'stored_at': stored_at, 'result': result}))
+            tmp.replace(path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._memory)
+        hits = stats['memory_hits'] + stats['disk_hits'] + stats['similar_hits']
+        total = hits + stats['misses']
+        stats['hit_rate'] = hits / total if total else 0.0
+        return stats
@@ -0,0 +1,174 @@
+# src/serving/shared_memory.py
+"""
+Ring buffer shared memory giữa API process và inference worker process
+
+Ảnh decode (vài MB) được copy một lần vào một slot của vùng `multiprocessing.shared_memory`,
+qua hàng đợi của executor chỉ có descriptor nhỏ (FrameRef). Worker đọc ảnh tại chỗ
+(không copy), xử lý xong ghi kết quả (pickle) vào chính slot đó và trả về ResultRef.
+API process cấp phát và thu hồi slot; ảnh/kết quả không vừa slot (hoặc hết slot) thì
+truyền qua pickle như bình thường.
+
+Vùng nhớ nằm trong /dev/shm (tmpfs): tạo vùng lớn hơn dung lượng trống vẫn thành công
+nhưng process bị SIGBUS khi ghi tới trang vượt quá (Docker mặc định chỉ 64 MB) - ring
+được thu nhỏ cho vừa, hoặc tắt hẳn, theo dung lượng trống lúc tạo.
+"""
+import logging
+import os
+import pickle
+import threading
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHM_DIR = '/dev/shm'
+# Phần dung lượng trống của /dev/shm ring được dùng tối đa (chừa chỗ cho process khác)
+SHM_MAX_FRACTION = 0.8
+
+
+def shm_free_bytes() -> Optional[int]:
+    """Dung lượng trống của /dev/shm (None nếu không kiểm tra được, vd. macOS)"""
+    try:
+        stat = os.statvfs(SHM_DIR)
+    except (OSError, AttributeError):
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+class FrameRef(NamedTuple):
+    """Vị trí một ảnh trong ring"""
+    shm_name: str
+    slot: int
+    offset: int
+    shape: tuple
+    dtype: str
+    slot_bytes: int
+
+
+class ResultRef(NamedTuple):
+    """Vị trí kết quả (pickle) worker đã ghi vào slot của ảnh"""
+    shm_name: str
+    slot: int
+    offset: int
+    nbytes: int
+
+
+class SharedFrameRing:
+    """Vùng shared memory chia thành `slots` slot cố định, mỗi slot `slot_bytes` byte"""
+
+    def __init__(self, slots: int, slot_bytes: int):
+        if slots < 1 or slot_bytes < 1:
+            raise ValueError("slots và slot_bytes phải >= 1")
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self._shm = SharedMemory(create=True, size=slots * slot_bytes)
+        self._lock = threading.Lock()
+        self._free: List[int] = list(range(slots))
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], slots: int) -> Optional["SharedFrameRing"]:
+        """
+        Tạo ring từ section `inference.shared_memory` (None nếu tắt)
+        Ít slot hơn nếu /dev/shm không đủ chỗ; không đủ cho một slot thì None (dùng pickle)
+        """
+        config = config or {}
+        if not config.get('enabled', False):
+            return None
+        slot_bytes = int(float(config.get('slot_mb', 24)) * 1024 * 1024)
+        free = shm_free_bytes()
+        if free is not None and slots * slot_bytes > free * SHM_MAX_FRACTION:
+            fit = int(free * SHM_MAX_FRACTION) // slot_bytes
+            if fit < 1:
+                logger.warning("%s chỉ còn %.0f MB trống, không đủ cho slot %.0f MB: tắt shared memory, "
+                               "ảnh truyền qua pickle (tăng --shm-size)", SHM_DIR, free / 2 ** 20,
+                               slot_bytes / 2 ** 20)
+                return None
+            logger.warning("%s chỉ còn %.0f MB trống: ring shared memory giảm từ %d xuống %d slot "
+                           "(tăng --shm-size)", SHM_DIR, free / 2 ** 20, slots, fit)
+            slots = fit
+        return cls(slots, slot_bytes)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def free_slots(self) -> int:
+        return len(self._free)
+
+    def put(self, image: np.ndarray) -> Optional[FrameRef]:
+        """
+        Copy ảnh vào một slot trống; None nếu ảnh quá lớn hoặc hết slot
+
+        Ảnh đã decode ra mảng riêng nên tốn thêm một lần copy (~1 ms ảnh 1600x1200, ~5 ms
+        ảnh 3200x2400): binding Python của cv2.imdecode không nhận mảng `dst` có sẵn, và
+        kích thước cuối (IMREAD_REDUCED_*, xoay EXIF) chỉ biết sau khi decode xong.
+        """
+        if image.nbytes > self.slot_bytes:
+            return None
+        with self._lock:
+            if not self._free:
+                return None
+            slot = self._free.pop()
+        offset = slot * self.slot_bytes
+        view = np.ndarray(image.shape, dtype=image.dtype, buffer=self._shm.buf, offset=offset)
+        view[...] = image
+        return FrameRef(self._shm.name, slot, offset, image.shape, image.dtype.str, self.slot_bytes)
+
+    def read_result(self, ref: ResultRef) -> Any:
+        return pickle.loads(self._shm.buf[ref.offset:ref.offset + ref.nbytes])
+
+    def release(self, slot: int):
+        with self._lock:
+            self._free.append(slot)
+
+    def close(self):
+        try:
+            self._shm.close()
+        except BufferError:
+            # Còn view numpy trỏ vào buffer - vùng nhớ được giải phóng khi process thoát
+            pass
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# --- Phía worker ---
+
+_attached: Dict[str, SharedMemory] = {}
+
+
+def _attach(name: str) -> SharedMemory:
+    """Mở vùng shared memory theo tên (cache trong process)"""
+    shm = _attached.get(name)
+    if shm is None:
+        try:
+            shm = SharedMemory(name=name, track=False)  # Python >= 3.13
+        except TypeError:
+            # Worker là process con, dùng chung resource_tracker với API process: đăng ký
+            # lại cùng tên không làm vùng nhớ bị xoá khi worker thoát
+            shm = SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+def frame_view(ref: FrameRef) -> np.ndarray:
+    """Ảnh trong slot dưới dạng numpy view (không copy)"""
+    shm = _attach(ref.shm_name)
+    return np.ndarray(ref.shape, dtype=np.dtype(ref.dtype), buffer=shm.buf, offset=ref.offset)
+
+
+def store_result(ref: FrameRef, result: Any) -> Union[ResultRef, Any]:
+    """
+    Ghi kết quả vào slot của ảnh (ảnh đã xử lý xong, slot được dùng lại)
+    Kết quả lớn hơn slot thì trả nguyên object để executor pickle như bình thường
+    """
+    data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) > ref.slot_bytes:
+        return result
+    shm = _attach(ref.shm_name)
+    shm.buf[ref.offset:ref.offset + len(data)] = data
+    return ResultRef(ref.shm_name, ref.slot, ref.offset, len(data))
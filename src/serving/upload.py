@@ -0,0 +1,210 @@
+# src/serving/upload.py
+"""
+Nhận file upload với giới hạn kích thước, từ chối sớm theo header ảnh
+
+Starlette ghi phần file của multipart vào SpooledTemporaryFile (quá 1 MB thì ra đĩa),
+nên bộ nhớ của API process chỉ bị chiếm khi handler đọc file. Ở đây:
+    - BodyLimitMiddleware chặn body quá `max_request_mb` theo Content-Length, hoặc
+      ngay khi số byte nhận được vượt mức (upload chunked), trước khi multipart được ghi hết
+    - read_image() kiểm tra kích thước file, đọc `header_kb` đầu để lấy kích thước ảnh
+      (probe_image) và từ chối ảnh quá nhiều pixel trước khi đọc phần còn lại. JPEG có
+      EXIF/ICC lớn (SOF nằm sau `header_kb`) được đọc thêm tới `max_header_kb`; JPEG/PNG
+      vẫn không có kích thước thì bị từ chối (fail closed), không để lọt qua giới hạn pixel
+    - Phần còn lại được readinto() thẳng vào một bytearray cấp phát đúng kích thước;
+      decode_image() đọc buffer đó qua np.frombuffer, không copy thêm
+"""
+import json
+from typing import Any, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from src.preprocessing.decoding import ImageHeader, header_truncated, is_probed_format, probe_image
+
+MB = 1024 * 1024
+
+
+class UploadRejected(Exception):
+    """Upload vượt giới hạn hoặc không hợp lệ - API trả về status_code kèm detail"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadLimits:
+    """Giới hạn upload mỗi request"""
+
+    def __init__(self, max_file_bytes: int = 20 * MB, max_request_bytes: int = 100 * MB,
+                 max_pixels: int = 50_000_000, header_bytes: int = 64 * 1024,
+                 max_header_bytes: int = MB):
+        """
+        Args:
+            max_file_bytes: Dung lượng tối đa một ảnh (kể cả ảnh trong file zip)
+            max_request_bytes: Dung lượng tối đa toàn bộ body / file zip / tổng ảnh giải nén từ zip
+            max_pixels: Số pixel tối đa của ảnh gốc (theo header) - chặn ảnh bomb decode ra hàng GB
+            header_bytes: Số byte đọc trước để lấy kích thước ảnh
+            max_header_bytes: Số byte tối đa đọc để tìm kích thước JPEG/PNG (header cắt ngang thì đọc thêm)
+        """
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.max_pixels = max_pixels
+        self.header_bytes = header_bytes
+        self.max_header_bytes = max(header_bytes, max_header_bytes)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "UploadLimits":
+        """Tạo từ section `api.upload`"""
+        config = config or {}
+        return cls(
+            max_file_bytes=int(float(config.get('max_file_mb', 20)) * MB),
+            max_request_bytes=int(float(config.get('max_request_mb', 100)) * MB),
+            max_pixels=int(float(config.get('max_megapixels', 50)) * 1_000_000),
+            header_bytes=int(config.get('header_kb', 64)) * 1024,
+            max_header_bytes=int(config.get('max_header_kb', 1024)) * 1024,
+        )
+
+    def check_size(self, size: Optional[int], limit: Optional[int] = None):
+        limit = limit or self.max_file_bytes
+        if size is not None and size > limit:
+            raise UploadRejected(413, f"File quá lớn ({size / MB:.1f} MB, tối đa {limit / MB:.0f} MB)")
+
+    def header_wanted(self, head) -> int:
+        """Số byte cần đọc thêm để probe được header (0 = đủ, hoặc đã tới max_header_bytes)"""
+        if not header_truncated(head):
+            return 0
+        return min(max(len(head), self.header_bytes), self.max_header_bytes - len(head))
+
+    def check_header(self, data) -> Optional[ImageHeader]:
+        """
+        Kiểm tra kích thước ảnh từ header (JPEG/PNG); định dạng khác trả None và
+        được kiểm tra bởi decoder (OpenCV giới hạn 2^30 pixel)
+
+        Raises:
+            UploadRejected: 413 nếu ảnh quá nhiều pixel hoặc header JPEG/PNG dài hơn
+                max_header_bytes; 400 nếu JPEG/PNG không có kích thước (file hỏng/cắt cụt)
+        """
+        header = probe_image(data)
+        if header is None and is_probed_format(data):
+            if len(data) >= self.max_header_bytes and header_truncated(data):
+                raise UploadRejected(
+                    413, f"Header ảnh quá lớn (không thấy kích thước ảnh trong "
+                         f"{self.max_header_bytes // 1024} KB đầu)")
+            raise UploadRejected(400, "Ảnh JPEG/PNG không hợp lệ (không đọc được kích thước từ header)")
+        if header is not None and header.width * header.height > self.max_pixels:
+            raise UploadRejected(
+                413, f"Ảnh quá lớn ({header.width}x{header.height}, tối đa "
+                     f"{self.max_pixels / 1_000_000:.0f} megapixel)")
+        return header
+
+    async def read_image(self, file) -> bytearray:
+        """
+        Đọc một ảnh từ UploadFile: kiểm tra dung lượng, rồi header, rồi mới đọc phần còn lại
+
+        Raises:
+            UploadRejected: File/ảnh vượt giới hạn
+        """
+        self.check_size(file.size)
+        head = bytearray(await file.read(self.header_bytes))
+        wanted = self.header_wanted(head)
+        while wanted:
+            chunk = await file.read(wanted)
+            if not chunk:
+                break
+            head += chunk
+            wanted = self.header_wanted(head)
+        self.check_header(head)
+        return await self._read_rest(file, head, self.max_file_bytes)
+
+    async def read_file(self, file, limit: Optional[int] = None) -> bytearray:
+        """Đọc toàn bộ UploadFile không phải ảnh (vd. zip), tối đa `limit` byte (mặc định max_request_bytes)"""
+        limit = limit or self.max_request_bytes
+        self.check_size(file.size, limit)
+        return await self._read_rest(file, bytearray(), limit)
+
+    async def _read_rest(self, file, head: bytearray, limit: int) -> bytearray:
+        """Đọc phần còn lại sau `head` vào buffer đúng kích thước (UploadFile.size), tối đa `limit` byte"""
+        if file.size is None:
+            # Không biết trước kích thước: đọc theo chunk và dừng ngay khi vượt giới hạn
+            while True:
+                chunk = await file.read(MB)
+                if not chunk:
+                    return head
+                head += chunk
+                self.check_size(len(head), limit)
+
+        buffer = bytearray(file.size)
+        buffer[:len(head)] = head
+        view = memoryview(buffer)
+        filled = len(head)
+        while filled < file.size:
+            count = await run_in_threadpool(file.file.readinto, view[filled:])
+            if not count:
+                break
+            filled += count
+        view.release()
+        del buffer[filled:]
+        return buffer
+
+
+class BodyLimitMiddleware:
+    """ASGI middleware: trả 413 khi body request vượt `max_bytes` (theo Content-Length hoặc khi đang nhận)"""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get('headers', []):
+            if name == b'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    length = 0
+                if length > self.max_bytes:
+                    await self._reject(send)
+                    return
+
+        state = {'received': 0, 'exceeded': False, 'sent': False}
+
+        async def limited_receive():
+            message = await receive()
+            if message['type'] == 'http.request':
+                state['received'] += len(message.get('body', b''))
+                if state['received'] > self.max_bytes:
+                    state['exceeded'] = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def limited_send(message):
+            if state['exceeded']:
+                # FastAPI biến lỗi khi parse multipart thành 400 - thay bằng 413
+                if message['type'] == 'http.response.start' and not state['sent']:
+                    state['sent'] = True
+                    await self._reject(send)
+                return
+            state['sent'] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except _BodyTooLarge:
+            if not state['sent']:
+                await self._reject(send)
+
+    async def _reject(self, send):
+        body = json.dumps({'detail': f"Request quá lớn (tối đa {self.max_bytes / MB:.0f} MB)"},
+                          ensure_ascii=False).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+class _BodyTooLarge(Exception):
+    pass
@@ -0,0 +1,46 @@
+# src/serving/warmup.py
+"""
+Ảnh warm-up cho inference worker
+
+Request đầu tiên của PaddleOCR/YOLO phải trả chi phí khởi tạo graph, cấp phát
+buffer... Chạy trước một lần trên ảnh thẻ tổng hợp để server chỉ báo ready khi
+request thật không còn phải trả chi phí đó.
+"""
+from typing import Optional
+
+import cv2
+import numpy as np
+
+WARMUP_LINES = [
+    'CONG HOA XA HOI CHU NGHIA VIET NAM',
+    'CAN CUOC CONG DAN',
+    'So / No.: 001095002564',
+    'Ho va ten / Full name: NGUYEN VAN AN',
+    'Ngay sinh / Date of birth: 24/01/1995',
+    'Gioi tinh / Sex: Nam  Quoc tich / Nationality: Viet Nam',
+    'Co gia tri den: 24/01/2035',
+]
+
+
+def synthetic_card(width: int = 1000, height: int = 630) -> np.ndarray:
+    """Ảnh thẻ tổng hợp tỉ lệ ID-1: nền sáng, khung ảnh chân dung và các dòng text"""
+    card = np.full((height, width, 3), (235, 240, 245), dtype=np.uint8)
+    cv2.rectangle(card, (int(width * 0.04), int(height * 0.3)),
+                  (int(width * 0.28), int(height * 0.8)), (150, 140, 130), -1)
+    scale = width / 1000
+    for i, line in enumerate(WARMUP_LINES):
+        y = int(height * (0.12 + i * 0.11))
+        x = int(width * 0.15) if i < 2 else int(width * 0.32)
+        cv2.putText(card, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7 * scale, (30, 30, 30),
+                    max(1, int(2 * scale)), cv2.LINE_AA)
+    return card
+
+
+def load_warmup_image(path: Optional[str] = None) -> np.ndarray:
+    """Ảnh warm-up từ `path`, không có thì dùng thẻ tổng hợp"""
+    if path:
+        image = cv2.imread(path)
+        if image is None:
+            raise FileNotFoundError(f"Không đọc được ảnh warm-up: {path}")
+        return image
+    return synthetic_card()
@@ -1,30 +1,103 @@
+import json
 import logging
+import random
+from contextvars import ContextVar
 from pathlib import Path
 from datetime import datetime
+from typing import Any, Dict, Optional
 
-def setup_logger(name: str, log_dir: str = "logs") -> logging.Logger:
-    Path(log_dir).mkdir(parents=True, exist_ok=True)
-    
+# Request id của request đang xử lý - gắn vào mọi log record
+request_id_var: ContextVar[str] = ContextVar('request_id', default='-')
+
+# Đánh dấu handler do setup_logger thêm để gọi lại không bị nhân đôi handler
+_HANDLER_TAG = '_idcard_handler'
+
+
+class RequestContextFilter(logging.Filter):
+    """Gắn request_id hiện tại vào record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Chỉ giữ lại một tỉ lệ log dưới WARNING; WARNING trở lên luôn được giữ"""
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi record một dòng JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def setup_logger(name: str = '', log_dir: Optional[str] = None, level: str = 'INFO',
+                 fmt: str = 'text', sample_rate: float = 1.0) -> logging.Logger:
+    """
+    Cấu hình logger (mặc định root). Gọi lại nhiều lần chỉ thay handler cũ, không nhân đôi.
+
+    Args:
+        name: Tên logger ('' = root)
+        log_dir: Thư mục ghi file log theo ngày (None = chỉ console)
+        level: DEBUG để bật log chi tiết từng request/từng dòng OCR
+        fmt: 'text' hoặc 'json'
+        sample_rate: Tỉ lệ log dưới WARNING được giữ lại (0-1)
+    """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
-    # File handler
-    log_file = Path(log_dir) / f"{datetime.now().strftime('%Y%m%d')}.log"
-    fh = logging.FileHandler(log_file, encoding='utf-8')
-    fh.setLevel(logging.INFO)
-    
-    # Console handler
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    
-    # Formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+    for handler in list(logger.handlers):
+        if getattr(handler, _HANDLER_TAG, False):
+            logger.removeHandler(handler)
+            handler.close()
+
+    if fmt == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+        )
+
+    handlers = [logging.StreamHandler()]
+    if log_dir:
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+        log_file = Path(log_dir) / f"{datetime.now().strftime('%Y%m%d')}.log"
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(RequestContextFilter())
+        if sample_rate < 1.0:
+            handler.addFilter(SamplingFilter(sample_rate))
+        setattr(handler, _HANDLER_TAG, True)
+        logger.addHandler(handler)
+
+    return logger
+
+
+def setup_logging(config: Optional[Dict[str, Any]]) -> logging.Logger:
+    """Cấu hình root logger từ section `logging:` trong config.yaml"""
+    config = config or {}
+    return setup_logger(
+        log_dir=config.get('log_dir'),
+        level=config.get('level', 'INFO'),
+        fmt=config.get('format', 'text'),
+        sample_rate=float(config.get('sample_rate', 1.0)),
     )
-    fh.setFormatter(formatter)
-    ch.setFormatter(formatter)
-    
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-    
-    return logger
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Metrics Prometheus cho API
+
+Pipeline trả thời gian từng stage trong block "timings" của kết quả, API process
+ghi vào histogram - cách này đúng cả khi inference chạy trong worker process.
+"""
+from typing import Any, Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    'idcard_stage_seconds',
+    'Thời gian từng stage xử lý (decode, localize, quality, resize, enhance, orientation, detect, ocr, ocr_det, ocr_rec, parse, serialize, encode)',
+    ['stage'],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    'idcard_request_seconds',
+    'Thời gian xử lý toàn bộ request /api/process',
+    buckets=STAGE_BUCKETS,
+)
+REQUESTS = Counter(
+    'idcard_requests_total',
+    'Số request theo kết quả (success, failure, empty_ocr, low_quality, rejected, bad_request, error)',
+    ['outcome'],
+)
+MODEL_LOAD_SECONDS = Gauge(
+    'idcard_model_load_seconds',
+    'Thời gian load model lần gần nhất',
+    ['component'],
+)
+ANGLE_CLS = Counter(
+    'idcard_angle_cls_total',
+    'Số ảnh theo quyết định classifier hướng dòng text (run, skipped)',
+    ['decision'],
+)
+JOBS = Counter(
+    'idcard_jobs_total',
+    'Số job bất đồng bộ đã chạy xong theo kết quả (success, failure, empty_ocr, low_quality, bad_request, error)',
+    ['outcome'],
+)
+QUEUE_DEPTH = Gauge('idcard_queue_depth', 'Số request đang chờ worker inference')
+IN_FLIGHT = Gauge('idcard_in_flight', 'Số request đang chạy hoặc đang chờ')
+JOBS_QUEUED = Gauge('idcard_jobs_queued', 'Số job bất đồng bộ đang chờ scheduler')
+OCR_BATCH_SIZE = Histogram(
+    'idcard_ocr_batch_size',
+    'Số crop mỗi batch recognition (ocr.batching)',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+OCR_BATCH_WAIT_SECONDS = Histogram(
+    'idcard_ocr_batch_wait_seconds',
+    'Thời gian một crop chờ trong hàng đợi batcher trước khi batch của nó chạy',
+    buckets=STAGE_BUCKETS,
+)
+
+# event label -> key trong ResultCache.stats()
+CACHE_EVENTS = (('memory_hit', 'memory_hits'), ('disk_hit', 'disk_hits'), ('similar_hit', 'similar_hits'),
+                ('miss', 'misses'), ('store', 'stores'), ('eviction', 'evictions'))
+
+
+class _CacheCollector:
+    """Đọc bộ đếm của ResultCache mỗi lần scrape (cache tự đếm, không ghi counter hai lần)"""
+
+    def __init__(self, stats: Callable[[], Dict[str, Any]]):
+        self._stats = stats
+
+    def collect(self):
+        stats = self._stats()
+        events = CounterMetricFamily(
+            'idcard_cache_events',
+            'Số lần tra/ghi cache kết quả (memory_hit, disk_hit, similar_hit, miss, store, eviction)',
+            labels=['event'])
+        for event, key in CACHE_EVENTS:
+            events.add_metric([event], stats.get(key, 0))
+        yield events
+        yield GaugeMetricFamily('idcard_cache_entries', 'Số kết quả trong tầng bộ nhớ của cache',
+                                value=stats.get('entries', 0))
+
+
+def observe_timings(timings: Optional[Dict[str, float]]):
+    """Ghi block timings (ms) của một kết quả vào histogram"""
+    for stage, ms in (timings or {}).items():
+        STAGE_SECONDS.labels(stage=stage).observe(ms / 1000)
+
+
+def observe_model_load(load_timings: Optional[Dict[str, float]]):
+    for component, seconds in (load_timings or {}).items():
+        MODEL_LOAD_SECONDS.labels(component=component).set(seconds)
+
+
+def observe_angle_cls(decision: Optional[str]):
+    if decision:
+        ANGLE_CLS.labels(decision=decision).inc()
+
+
+def observe_ocr_batches(batches: Optional[Dict[str, list]]):
+    """Ghi các batch recognition (BatchStats.drain() từ worker) vào histogram"""
+    if not batches:
+        return
+    for size in batches.get('batch_sizes', ()):
+        OCR_BATCH_SIZE.observe(size)
+    for seconds in batches.get('wait_seconds', ()):
+        OCR_BATCH_WAIT_SECONDS.observe(seconds)
+
+
+def track_pool(queue_depth: Callable[[], float], in_flight: Callable[[], float]):
+    """Gauge đọc trực tiếp từ pool mỗi lần scrape"""
+    QUEUE_DEPTH.set_function(queue_depth)
+    IN_FLIGHT.set_function(in_flight)
+
+
+def track_jobs(queued: Callable[[], float]):
+    JOBS_QUEUED.set_function(queued)
+
+
+def track_cache(stats: Callable[[], Dict[str, Any]]):
+    """Xuất hit/miss/eviction của ResultCache (stats() đọc mỗi lần scrape)"""
+    REGISTRY.register(_CacheCollector(stats))
+
+
+def render_latest():
+    """(body, content_type) cho endpoint /metrics"""
+    return generate_latest(), CONTENT_TYPE_LATEST
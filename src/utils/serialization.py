@@ -0,0 +1,32 @@
+"""
+Encode/decode JSON cho kết quả pipeline bằng orjson
+
+Kết quả giữ polygon dạng mảng numpy int32 (N, 2); orjson (OPT_SERIALIZE_NUMPY) ghi
+thẳng mảng/số numpy sang JSON trong C, không cần duyệt cây kết quả bằng Python.
+Dùng chung cho response API, cache đĩa, job store và script ghi JSONL.
+"""
+from typing import Any
+
+import numpy as np
+import orjson
+
+_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    """Kiểu orjson không tự encode: mảng không liên tục/dtype lạ, tuple numpy..."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Không encode được kiểu {type(obj).__name__} sang JSON")
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """JSON (UTF-8 bytes) của obj; indent=True thụt lề 2 space"""
+    options = _OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS
+    return orjson.dumps(obj, default=_default, option=options)
+
+
+def loads(data) -> Any:
+    return orjson.loads(data)
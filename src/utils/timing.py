@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StageTimer:
+    """Đo thời gian (ms) từng stage của một lần xử lý"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, ms: float):
+        """Cộng dồn nếu stage chạy nhiều lần (vd. OCR từng vùng field)"""
+        self.timings[name] = self.timings.get(name, 0.0) + ms
+
+    def merge(self, timings: Optional[Dict[str, float]]):
+        for name, ms in (timings or {}).items():
+            self.add(name, ms)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(ms, 3) for name, ms in self.timings.items()}